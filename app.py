@@ -1,51 +1,319 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Flask, request, jsonify, abort
+import os
+
+# 异步模式: 在导入其他模块之前打补丁，使socket、subprocess和线程变为非阻塞的协程实现，
+# 单个进程即可同时处理大量进行中的Registry请求，接口和返回格式保持不变
+SERVER_MODE = os.environ.get('SERVER_MODE', 'dev').lower()
+if SERVER_MODE == 'async':
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, Response, request, jsonify, abort, g, has_request_context
 import subprocess
 import json
-import os
 import re
 import logging
+import logging.handlers
+import queue
+import random
+import uuid
+import atexit
 import traceback
 import sys
 import functools
 import time
+import hashlib
+import hmac
+import base64
+import threading
+import signal
+import copy
+import sqlite3
+import gzip
+import zlib
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit, urlencode
+from bisect import bisect_left
+import operator
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from flask_caching import Cache
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST, multiprocess
 
-# 配置日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# 日志级别，DEBUG时输出每个请求的处理细节
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# 日志格式: json 每行一个JSON对象，text 为可读文本
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+# 成功请求访问日志的采样比例（0~1），错误和慢请求总是记录
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+# 超过该耗时（毫秒）的请求视为慢请求，访问日志不采样
+LOG_SLOW_REQUEST_MS = float(os.environ.get('LOG_SLOW_REQUEST_MS', 1000))
+# 等待输出的日志条数上限，输出跟不上时丢弃新日志，不阻塞请求线程
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，包含请求ID和通过extra传入的字段"""
+
+    # LogRecord的标准属性，其余属性来自extra
+    RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample'}
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.%03dZ' % record.msecs,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if orjson is not None:
+            return orjson.dumps(entry, default=str).decode()
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class RequestContextFilter(logging.Filter):
+    """在记录日志的线程中补充请求ID，请求之外（启动、后台线程）的日志为 -"""
+
+    def filter(self, record):
+        record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+class SamplingFilter(logging.Filter):
+    """按LOG_SAMPLE_RATE采样通过extra标记了sample=True的日志"""
+
+    def filter(self, record):
+        if LOG_SAMPLE_RATE < 1 and getattr(record, 'sample', False):
+            return random.random() < LOG_SAMPLE_RATE
+        return True
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """请求线程只把日志记录放入队列，格式化和写stdout都在QueueListener线程中进行
+
+    与标准QueueHandler不同，入队前不格式化消息（进程内队列不需要序列化）；队列满时丢弃并计数。
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+log_listener = None
+
+def setup_logging():
+    """配置根日志器: 队列处理器 + 后台输出线程
+
+    gunicorn预加载应用时输出线程只在master进程中运行，fork出的worker进程需要重新调用（见gunicorn.conf.py的post_fork）。
+    """
+    global log_listener
+    stream = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == 'json':
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] [%(request_id)s] %(message)s'))
+    handler = LogQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(RequestContextFilter())
+    handler.addFilter(SamplingFilter())
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    log_listener = logging.handlers.QueueListener(handler.queue, stream)
+    log_listener.start()
+
+def stop_logging():
+    """退出前输出队列中剩余的日志"""
+    if log_listener is not None and log_listener._thread is not None:
+        log_listener.stop()
+
+setup_logging()
+atexit.register(stop_logging)
 logger = logging.getLogger('docker-size')
 
 app = Flask(__name__)
 
+# Prometheus指标，通过 /metrics 查看；多worker部署时设置PROMETHEUS_MULTIPROC_DIR汇总所有worker的数据
+STAGE_LATENCY = Histogram(
+    'docker_size_stage_duration_seconds', '各处理阶段耗时（skopeo调用、Registry请求、缓存读写）', ['stage'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+CACHE_LOOKUPS = Counter('docker_size_cache_lookups_total', '接口缓存查询结果', ['route', 'status'])
+SUBPROCESS_EXITS = Counter('docker_size_subprocess_exits_total', 'skopeo子进程退出码', ['stage', 'code'])
+# 作为指标registry标签的Registry，其他Registry（地址来自请求参数，数量不受控制）统一记为other；*表示不限制
+METRICS_REGISTRIES = frozenset(
+    r.strip().lower() for r in os.environ.get(
+        'METRICS_REGISTRIES', 'docker.io,ghcr.io,quay.io,gcr.io,registry.k8s.io,mcr.microsoft.com,public.ecr.aws'
+    ).split(',') if r.strip())
+
+def metric_registry(registry):
+    """指标的registry标签值，不在METRICS_REGISTRIES中的Registry记为other，避免标签基数无限增长"""
+    registry = (registry or '').lower()
+    if '*' in METRICS_REGISTRIES or registry in METRICS_REGISTRIES:
+        return registry
+    # Docker Hub的各种地址（如registry-1.docker.io）随docker.io一起允许
+    if registry in DOCKER_HUB_DOMAINS and 'docker.io' in METRICS_REGISTRIES:
+        return registry
+    return 'other'
+
+REGISTRY_RESPONSES = Counter('docker_size_registry_responses_total', 'Registry HTTP响应状态码', ['registry', 'method', 'code'])
+INFLIGHT_FETCHES = Gauge('docker_size_inflight_fetches', '每个Registry进行中的镜像获取数', ['registry'],
+                         multiprocess_mode='livesum')
+ADMISSION_WAIT = Histogram(
+    'docker_size_admission_wait_seconds', '缓存未命中请求在慢速通道排队的耗时', ['route'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+ADMISSION_QUEUE = Gauge('docker_size_admission_queue_depth', '慢速通道排队中的请求数', ['route'],
+                        multiprocess_mode='livesum')
+NEGATIVE_LOOKUPS = Counter('docker_size_negative_cache_total', '镜像不存在或无权访问结果的负缓存操作', ['kind', 'outcome'])
+REGISTRY_EVENTS = Counter('docker_size_registry_events_total', '处理的Registry推送/删除通知', ['action'])
+ADMISSION_SHED = Counter('docker_size_admission_shed_total', '慢速通道过载时降级处理的请求', ['route', 'outcome'])
+COMMAND_WAIT = Histogram(
+    'docker_size_command_wait_seconds', 'skopeo调用排队等待执行槽位的耗时', ['stage'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+COMMAND_QUEUE = Gauge('docker_size_command_queue_depth', '排队等待执行的skopeo调用数', multiprocess_mode='livesum')
+COMMAND_RUNNING = Gauge('docker_size_commands_running', '正在执行的skopeo子进程数', ['registry'],
+                        multiprocess_mode='livesum')
+COMMAND_REJECTIONS = Counter('docker_size_command_rejections_total', '因排队已满或等待超时被拒绝的skopeo调用', ['reason'])
+LOG_DROPPED = Counter('docker_size_log_dropped_total', '日志队列已满时丢弃的日志条数')
+
+class TimedCache(Cache):
+    """记录读写耗时的缓存"""
+
+    def get(self, *args, **kwargs):
+        with STAGE_LATENCY.labels(stage='cache_get').time():
+            return super().get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        with STAGE_LATENCY.labels(stage='cache_set').time():
+            return super().set(*args, **kwargs)
+
 # 配置缓存
 cache_config = {
     "CACHE_TYPE": os.environ.get("CACHE_TYPE", "simple"),  # 默认使用简单内存缓存
-    "CACHE_DEFAULT_TIMEOUT": int(os.environ.get("CACHE_TIMEOUT", 3600)),  # 默认缓存1小时
+    "CACHE_DEFAULT_TIMEOUT": int(os.environ.get("CACHE_TIMEOUT", 3600)),  # 默认缓存1小时，0为永不过期
+    "CACHE_THRESHOLD": int(os.environ.get("CACHE_THRESHOLD", 5000)),  # simple缓存最大条目数
+}
+
+# 标签到digest映射的缓存时间（秒），过期后通过一次manifest HEAD请求重新验证
+TAG_CACHE_TIMEOUT = int(os.environ.get("TAG_CACHE_TIMEOUT", 60))
+# 标签索引增量刷新间隔（秒）：超过后只获取字典序在已知最后一个标签之后的新标签
+TAG_INDEX_REFRESH = int(os.environ.get("TAG_INDEX_REFRESH", 300))
+# 标签索引完整刷新间隔（秒）：重新获取全部标签，移除已删除的标签
+TAG_INDEX_FULL_REFRESH = int(os.environ.get("TAG_INDEX_FULL_REFRESH", 3600))
+# 接口缓存软过期时间（秒）：超过后先返回旧数据并在后台刷新，CACHE_TIMEOUT为硬过期时间（为0时只有软过期）
+CACHE_SOFT_TIMEOUT = int(os.environ.get("CACHE_SOFT_TIMEOUT", 300))
+if cache_config["CACHE_DEFAULT_TIMEOUT"]:
+    CACHE_SOFT_TIMEOUT = min(CACHE_SOFT_TIMEOUT, cache_config["CACHE_DEFAULT_TIMEOUT"])
+# 后台刷新缓存的线程数
+REFRESH_WORKERS = int(os.environ.get("REFRESH_WORKERS", 4))
+# 响应体达到该字节数时按Accept-Encoding使用br或gzip压缩
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+# 接口缓存硬过期后继续保留的秒数，只在慢速通道过载、无法同步获取时作为降级数据返回
+CACHE_STALE_GRACE = int(os.environ.get("CACHE_STALE_GRACE", 3600))
+# 慢速通道（需要访问Registry的缓存未命中请求）每个路由的默认并发数、排队数和最长排队秒数，并发数为0表示不限制
+SLOW_LANE_CONCURRENCY = int(os.environ.get("SLOW_LANE_CONCURRENCY", 4))
+SLOW_LANE_QUEUE = int(os.environ.get("SLOW_LANE_QUEUE", 4))
+SLOW_LANE_WAIT = float(os.environ.get("SLOW_LANE_WAIT", 5))
+# 按路由覆盖并发数和排队数，格式: 路由=并发数:排队数，逗号分隔，例如: image_info=2:4,image_tags=8:8
+SLOW_LANE_LIMITS = {
+    route.strip(): tuple(int(n) for n in limits.split(':'))
+    for route, _, limits in (item.partition('=') for item in os.environ.get("SLOW_LANE_LIMITS", "").split(',') if item.strip())
 }
+# 过载拒绝时建议客户端重试的秒数（Retry-After响应头）
+RETRY_AFTER = int(os.environ.get("RETRY_AFTER", 5))
+
+# 持久化元数据存储（SQLite文件路径），保存digest缓存和标签映射，重启后不丢失；为空时不启用
+METADATA_DB = os.environ.get('METADATA_DB', '')
+# 持久化存储中超过指定天数未访问的条目会在后台压缩时删除
+METADATA_RETENTION_DAYS = int(os.environ.get('METADATA_RETENTION_DAYS', 30))
+# 后台压缩间隔（秒），多个worker进程之间只有一个会执行
+METADATA_COMPACT_INTERVAL = int(os.environ.get('METADATA_COMPACT_INTERVAL', 3600))
 
 # 如果设置了Redis缓存
 if os.environ.get("CACHE_REDIS_URL"):
     cache_config["CACHE_REDIS_URL"] = os.environ.get("CACHE_REDIS_URL")
 
-cache = Cache(config=cache_config)
+cache = TimedCache(config=cache_config)
 cache.init_app(app)
 
 # 日志输出缓存配置
 logger = logging.getLogger('docker-size')
-logger.info(f"缓存类型: {cache_config['CACHE_TYPE']}")
-logger.info(f"缓存超时: {cache_config['CACHE_DEFAULT_TIMEOUT']}秒")
+logger.info("缓存类型: %s", cache_config['CACHE_TYPE'])
+logger.info("缓存超时: %s秒, 软过期: %s秒", cache_config['CACHE_DEFAULT_TIMEOUT'], CACHE_SOFT_TIMEOUT)
+
+# 凭证范围标识（缓存键、Redis键名和持久化存储中区分不同凭证的部分）使用的HMAC密钥，
+# 键中不会出现可离线暴力破解的密码摘要。使用Redis或持久化存储时必须设置，且所有实例相同；
+# 否则未设置时每个进程随机生成（进程内缓存不会跨进程共享）
+CREDENTIAL_SCOPE_KEY = os.environ.get('CREDENTIAL_SCOPE_KEY', '').encode()
+if not CREDENTIAL_SCOPE_KEY:
+    if cache_config['CACHE_TYPE'] == 'redis' or METADATA_DB:
+        raise RuntimeError("CACHE_TYPE=redis或设置了METADATA_DB时必须设置CREDENTIAL_SCOPE_KEY")
+    CREDENTIAL_SCOPE_KEY = os.urandom(32)
 
 # 读取API认证密码
 API_KEY = os.environ.get('API_KEY', '')
-logger.info(f"API认证{'已配置' if API_KEY else '未配置'}")
+logger.info("API认证%s", '已配置' if API_KEY else '未配置')
+
+# 镜像数据获取后端: registry(内置Registry v2客户端，默认) 或 skopeo(调用skopeo命令)
+IMAGE_BACKEND = os.environ.get('IMAGE_BACKEND', 'registry').lower()
+# Registry HTTP请求超时（秒）和连接池大小
+REGISTRY_TIMEOUT = int(os.environ.get('REGISTRY_TIMEOUT', 30))
+REGISTRY_POOL_SIZE = int(os.environ.get('REGISTRY_POOL_SIZE', 20))
+# 遇到多架构镜像时默认选择的平台，与skopeo在linux/amd64主机上的行为一致
+DEFAULT_PLATFORM = os.environ.get('DEFAULT_PLATFORM', 'linux/amd64')
+# 使用HTTP而非HTTPS访问的私有仓库，逗号分隔，例如: localhost:5000,registry.local
+INSECURE_REGISTRIES = [r.strip() for r in os.environ.get('INSECURE_REGISTRIES', '').split(',') if r.strip()]
+# Registry令牌提前失效的秒数，避免令牌在请求途中过期
+TOKEN_EXPIRY_MARGIN = int(os.environ.get('TOKEN_EXPIRY_MARGIN', 30))
+# skopeo子进程执行限制: 全局并发数、每个Registry并发数、排队等待的最大调用数、单次调用超时（秒）
+SKOPEO_CONCURRENCY = int(os.environ.get('SKOPEO_CONCURRENCY', 16))
+SKOPEO_REGISTRY_CONCURRENCY = int(os.environ.get('SKOPEO_REGISTRY_CONCURRENCY', 4))
+SKOPEO_QUEUE_DEPTH = int(os.environ.get('SKOPEO_QUEUE_DEPTH', 64))
+SKOPEO_TIMEOUT = int(os.environ.get('SKOPEO_TIMEOUT', 60))
+logger.info("镜像数据后端: %s", IMAGE_BACKEND)
+
+# 批量查询: 单次最多镜像数、每个请求的并发线程数、每个Registry的全局并发获取数
+BATCH_MAX_IMAGES = int(os.environ.get('BATCH_MAX_IMAGES', 500))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 32))
+REGISTRY_CONCURRENCY = int(os.environ.get('REGISTRY_CONCURRENCY', 8))
+# 多架构镜像并发获取各平台manifest的线程数
+PLATFORM_WORKERS = int(os.environ.get('PLATFORM_WORKERS', 8))
+# 未压缩大小计算方法: auto（只用已有数据）、sample（采样估算）、exact（流式解压完整统计），可按请求传size_method覆盖
+# EXACT_SIZE=true 等同于 SIZE_METHOD=exact；EXACT_SIZE_WORKERS为每个镜像并发处理的图层数
+EXACT_SIZE = os.environ.get('EXACT_SIZE', 'false').lower() in ('1', 'true', 'yes')
+SIZE_METHOD = 'exact' if EXACT_SIZE else os.environ.get('SIZE_METHOD', 'auto').lower()
+EXACT_SIZE_WORKERS = int(os.environ.get('EXACT_SIZE_WORKERS', 4))
+# 采样估算时每个图层通过Range请求下载的字节数
+SAMPLE_SIZE = int(os.environ.get('SAMPLE_SIZE_MB', 4)) * 1024 * 1024
+# 没有任何测量数据时使用的固定压缩比及其相对误差（经验值）
+FIXED_COMPRESSION_RATIO = float(os.environ.get('FIXED_COMPRESSION_RATIO', 1.7))
+FIXED_RATIO_ERROR = 0.5
+# 采样估算在还没有学习到压缩比分布时，未采样部分的相对误差
+SAMPLE_RATIO_ERROR = 0.25
+# 流式解压时每次读取的字节数，内存占用只与该值有关，与图层大小无关
+LAYER_CHUNK_SIZE = 64 * 1024
+# 标签大小批量查询: 单次最多标签数和并发线程数
+TAG_SWEEP_MAX_TAGS = int(os.environ.get('TAG_SWEEP_MAX_TAGS', 1000))
+TAG_SWEEP_WORKERS = int(os.environ.get('TAG_SWEEP_WORKERS', 16))
 
 # API认证装饰器
 def require_api_key(f):
@@ -60,7 +328,7 @@ def require_api_key(f):
         
         # 验证API密钥
         if api_key != API_KEY:
-            logger.warning(f"API认证失败: 提供的API密钥不正确")
+            logger.warning("API认证失败: 提供的API密钥不正确")
             return jsonify({
                 'status': 'error',
                 'message': 'API认证失败: 无效的API密钥'
@@ -88,22 +356,486 @@ def index():
     <p>缓存超时: {cache_config["CACHE_DEFAULT_TIMEOUT"]}秒</p>
     <p>缓存状态: <a href="/cache-info{api_param}">查看缓存状态</a></p>
     <p>清除缓存: <a href="/cache-clear{api_param}">清除所有缓存</a></p>
+    <p>监控指标: <a href="/metrics{api_param and '?' + api_param[1:]}">/metrics</a></p>
     '''
 
-def get_image_data(image, username=None, password=None, proxy=None):
-    """获取镜像数据的通用函数"""
-    # 检查镜像名是否带标签，未带则补全为:latest
-    if ':' not in image:
-        image = f"{image}:latest"
-        logger.info(f"镜像未指定标签，补全为: {image}")
+# 运行统计计数器，通过 /cache-info 查看
+request_stats_lock = threading.Lock()
+request_stats = {}
+
+def incr_stat(name, value=1):
+    """累加统计计数器"""
+    with request_stats_lock:
+        request_stats[name] = request_stats.get(name, 0) + value
+
+# 合并并发请求：同一镜像引用和凭证范围同时只执行一次获取，等待者最长等待的秒数
+SINGLEFLIGHT_TIMEOUT = int(os.environ.get('SINGLEFLIGHT_TIMEOUT', 60))
+# CACHE_TYPE=redis时，领头请求的结果在Redis中保留的秒数，供其他worker进程读取
+SINGLEFLIGHT_RESULT_TTL = int(os.environ.get('SINGLEFLIGHT_RESULT_TTL', 5))
+# 镜像不存在或无权访问(404/401/403)结果的缓存秒数，0为不缓存
+NEGATIVE_CACHE_TIMEOUT = int(os.environ.get('NEGATIVE_CACHE_TIMEOUT', 60))
+
+inflight_lock = threading.Lock()
+inflight = {}
+
+# 表示认证失败、无权访问或不存在的Registry状态码，接口原样返回并短时负缓存
+ACCESS_ERROR_CODES = (401, 403, 404)
+
+def credential_scope(username, password):
+    """凭证范围标识：用户名加以CREDENTIAL_SCOPE_KEY为密钥的密码HMAC，避免不同密码的请求共享结果"""
+    if not password:
+        return username or ''
+    return f"{username}~{hmac.new(CREDENTIAL_SCOPE_KEY, password.encode(), hashlib.sha256).hexdigest()[:16]}"
+
+def get_redis_client():
+    """CACHE_TYPE=redis时返回缓存使用的Redis客户端，否则返回None"""
+    if cache_config['CACHE_TYPE'] != 'redis':
+        return None
+    return getattr(cache.cache, '_write_client', None)
+
+def singleflight(key, fn):
+    """对相同key的并发调用只执行一次fn，其余调用等待并共享结果
+
+    进程内通过线程事件合并；CACHE_TYPE=redis时再通过Redis租约合并不同worker进程的请求。
+    结果为字典，等待者拿到的是深拷贝，调用方可以放心修改。
+    """
+    with inflight_lock:
+        flight = inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = {'event': threading.Event(), 'result': None, 'error': None, 'waiters': 0}
+            inflight[key] = flight
+        else:
+            flight['waiters'] += 1
+    
+    if not leader:
+        incr_stat('singleflight_coalesced_local')
+        if flight['event'].wait(SINGLEFLIGHT_TIMEOUT) and flight['error'] is None:
+            logger.debug("合并并发请求: %s", key)
+            return copy.deepcopy(flight['result'])
+        # 领头请求超时或失败，自行获取
+        return fn()
+    
+    incr_stat('singleflight_leader')
+    result = None
+    try:
+        result = redis_singleflight(key, fn)
+        return result
+    except BaseException as e:
+        flight['error'] = e
+        raise
+    finally:
+        with inflight_lock:
+            inflight.pop(key, None)
+            waiters = flight['waiters']
+        # 移出inflight后不会再有新的等待者，没有等待者时不复制结果
+        if waiters and flight['error'] is None:
+            flight['result'] = copy.deepcopy(result)
+        flight['event'].set()
+
+def redis_singleflight(key, fn):
+    """跨worker进程的合并：获得Redis租约的进程执行fn并发布结果，其他进程轮询结果"""
+    client = get_redis_client()
+    if client is None:
+        return fn()
+    
+    lease_key = f"singleflight:lease:{key}"
+    result_key = f"singleflight:result:{key}"
+    token = os.urandom(8).hex()
+    try:
+        acquired = client.set(lease_key, token, nx=True, px=SINGLEFLIGHT_TIMEOUT * 1000)
+    except Exception as e:
+        logger.warning("获取Redis租约失败，直接获取: %s", e)
+        return fn()
+    
+    if acquired:
+        try:
+            result = fn()
+            cache.set(result_key, result, timeout=SINGLEFLIGHT_RESULT_TTL)
+            return result
+        finally:
+            try:
+                if client.get(lease_key) == token.encode():
+                    client.delete(lease_key)
+            except Exception as e:
+                logger.warning("释放Redis租约失败: %s", e)
+    
+    # 其他worker正在获取，轮询其发布的结果
+    deadline = time.time() + SINGLEFLIGHT_TIMEOUT
+    while time.time() < deadline:
+        result = cache.get(result_key)
+        if result is not None:
+            incr_stat('singleflight_coalesced_remote')
+            logger.debug("合并其他worker的并发请求: %s", key)
+            return result
+        if not client.exists(lease_key):
+            # 租约已释放但没有结果，再读一次后自行获取
+            result = cache.get(result_key)
+            if result is not None:
+                incr_stat('singleflight_coalesced_remote')
+                return result
+            break
+        time.sleep(0.05)
+    return fn()
+
+def normalized_reference(image):
+    """规范化的镜像引用，用于合并等价的请求和生成缓存键"""
+    return str(parse_image_reference(image))
+
+# 当前线程所属请求的取消事件，批量和流式接口在客户端断开时设置，正在执行的子进程随之终止
+cancellation = threading.local()
+
+def run_cancellable(event, fn, *args):
+    """在线程池中执行fn，期间启动的skopeo子进程会在event被设置时终止"""
+    cancellation.event = event
+    try:
+        return fn(*args)
+    finally:
+        cancellation.event = None
+
+class CommandExecutor:
+    """外部命令执行器
+    
+    限制全局和每个Registry同时运行的子进程数，超过时排队等待，排队数超过上限直接拒绝；
+    子进程在独立的进程组中运行，超时或请求取消时杀死整个进程组。
+    """
+    
+    POLL_INTERVAL = 0.5
+    
+    def __init__(self, concurrency, registry_concurrency, queue_depth, timeout):
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.registry_concurrency = registry_concurrency
+        self.registry_slots = {}
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.processes = set()
+    
+    def registry_slot(self, registry):
+        with self.lock:
+            slot = self.registry_slots.get(registry)
+            if slot is None:
+                slot = self.registry_slots[registry] = threading.BoundedSemaphore(self.registry_concurrency)
+            return slot
+    
+    def acquire(self, stage, registry, deadline):
+        """按先Registry后全局的顺序获取执行槽位，返回需要释放的槽位列表"""
+        with self.lock:
+            if self.waiting >= self.queue_depth:
+                COMMAND_REJECTIONS.labels(reason='queue_full').inc()
+                raise CommandError(f"skopeo调用排队已满（{self.queue_depth}），请稍后重试", 503)
+            self.waiting += 1
+        COMMAND_QUEUE.inc()
+        start = time.monotonic()
+        acquired = []
+        try:
+            for slot in (self.registry_slot(registry), self.slots):
+                if not slot.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                    COMMAND_REJECTIONS.labels(reason='wait_timeout').inc()
+                    raise CommandError(f"等待skopeo执行槽位超时: {registry}", 503)
+                acquired.append(slot)
+            return acquired
+        except BaseException:
+            for slot in acquired:
+                slot.release()
+            raise
+        finally:
+            with self.lock:
+                self.waiting -= 1
+            COMMAND_QUEUE.dec()
+            COMMAND_WAIT.labels(stage=stage).observe(time.monotonic() - start)
+    
+    def run(self, stage, registry, cmd, timeout=None, env=None, text=False):
+        """执行命令并返回CompletedProcess；排队和执行共用同一个超时时间"""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        cancel = getattr(cancellation, 'event', None)
+        acquired = self.acquire(stage, registry, deadline)
+        try:
+            with COMMAND_RUNNING.labels(registry=metric_registry(registry)).track_inprogress(), \
+                    STAGE_LATENCY.labels(stage=stage).time():
+                return self.execute(stage, cmd, timeout, deadline, cancel, env, text)
+        finally:
+            for slot in acquired:
+                slot.release()
+    
+    def execute(self, stage, cmd, timeout, deadline, cancel, env, text):
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, text=text,
+                                       start_new_session=True)
+        except OSError:
+            SUBPROCESS_EXITS.labels(stage=stage, code='spawn_error').inc()
+            raise
+        with self.lock:
+            self.processes.add(process)
+        try:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    self.kill(process)
+                    SUBPROCESS_EXITS.labels(stage=stage, code='cancelled').inc()
+                    raise CommandCancelled("请求已取消，终止skopeo子进程")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.kill(process)
+                    SUBPROCESS_EXITS.labels(stage=stage, code='timeout').inc()
+                    raise CommandError(f"skopeo命令执行超时（{timeout}秒）", 504)
+                try:
+                    stdout, stderr = process.communicate(timeout=min(remaining, self.POLL_INTERVAL))
+                    break
+                except subprocess.TimeoutExpired:
+                    continue
+        except BaseException:
+            # 包括协程被杀死等情况，保证不留下孤儿进程
+            self.kill(process)
+            raise
+        finally:
+            with self.lock:
+                self.processes.discard(process)
+        SUBPROCESS_EXITS.labels(stage=stage, code=str(process.returncode)).inc()
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+    
+    @staticmethod
+    def kill(process):
+        """杀死子进程所在的整个进程组并回收"""
+        if process.poll() is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        try:
+            process.communicate(timeout=5)
+        except (subprocess.TimeoutExpired, ValueError, OSError):
+            pass
+    
+    def kill_all(self):
+        """worker退出时终止所有仍在运行的子进程"""
+        with self.lock:
+            processes = list(self.processes)
+        for process in processes:
+            self.kill(process)
+
+command_executor = CommandExecutor(SKOPEO_CONCURRENCY, SKOPEO_REGISTRY_CONCURRENCY, SKOPEO_QUEUE_DEPTH, SKOPEO_TIMEOUT)
+
+def run_skopeo(stage, cmd, **kwargs):
+    """通过命令执行器运行skopeo子进程，按命令中的docker://镜像引用计入对应Registry的并发限制"""
+    target = cmd[-1]
+    registry = split_image_reference(target[len('docker://'):])[0] if target.startswith('docker://') else 'local'
+    return command_executor.run(stage, registry, cmd, **kwargs)
+
+class CacheKeyIndex:
+    """仓库到缓存键的反向索引，用于按仓库、标签或标签前缀精确失效缓存（见invalidate_cache）
+
+    每条记录为(标记, 缓存键)，标记为标签、@digest（按digest引用的条目）或 *（标签列表等与整个仓库相关的条目）。
+    CACHE_TYPE=redis时保存在Redis集合中，所有worker共享；否则保存在进程内存中，与simple缓存一样按进程隔离。
+    索引中可能残留已过期的缓存键，失效时删除不存在的键没有影响。
+    """
+    
+    # 进程内每个仓库最多记录的缓存键数，超过时丢弃最早登记的
+    MAX_KEYS_PER_REPOSITORY = 10000
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = {}
+    
+    def add(self, repository, marker, key):
+        member = f"{marker} {key}"
+        client = get_redis_client()
+        if client is not None:
+            index_key = f"reverse-index:{repository}"
+            try:
+                pipe = client.pipeline()
+                pipe.sadd(index_key, member)
+                if cache_config["CACHE_DEFAULT_TIMEOUT"]:
+                    pipe.expire(index_key, cache_config["CACHE_DEFAULT_TIMEOUT"] + CACHE_STALE_GRACE)
+                pipe.execute()
+            except Exception as e:
+                logger.warning("登记缓存反向索引失败: %s, %s", repository, e)
+            return
+        with self.lock:
+            members = self.local.setdefault(repository, {})
+            members.pop(member, None)
+            members[member] = None
+            if len(members) > self.MAX_KEYS_PER_REPOSITORY:
+                members.pop(next(iter(members)))
+    
+    def members(self, repository):
+        """返回仓库登记的[(标记, 缓存键)]"""
+        client = get_redis_client()
+        if client is not None:
+            members = [m.decode() for m in client.smembers(f"reverse-index:{repository}")]
+        else:
+            with self.lock:
+                members = list(self.local.get(repository, ()))
+        return [tuple(member.split(' ', 1)) for member in members]
+    
+    def remove(self, repository, entries):
+        if not entries:
+            return
+        members = [f"{marker} {key}" for marker, key in entries]
+        client = get_redis_client()
+        if client is not None:
+            client.srem(f"reverse-index:{repository}", *members)
+            return
+        with self.lock:
+            registered = self.local.get(repository, {})
+            for member in members:
+                registered.pop(member, None)
+            if not registered:
+                self.local.pop(repository, None)
+    
+    def clear(self):
+        with self.lock:
+            self.local.clear()
+
+cache_key_index = CacheKeyIndex()
+
+def reference_marker(reference):
+    """split_image_reference返回的reference在反向索引中的标记"""
+    return f"@{reference}" if is_digest(reference) else reference
+
+def invalidate_cache(registry, repository, tags=None, prefix=None, refresh=None):
+    """按仓库、标签或标签前缀失效缓存，返回(删除的缓存键数, 直接更新的标签映射数)
+
+    tags和prefix都为None时失效整个仓库；否则只失效匹配标签的条目，以及标签列表、标签索引等
+    与整个仓库相关的条目（新推送的标签会改变它们）。按digest引用的条目内容不可变，只在失效整个仓库时删除。
+    refresh为{标签: digest}时，对应标签的digest映射直接更新为新值，无需再向Registry验证。
+    """
+    name = f"{registry}/{repository}"
+    refresh = refresh or {}
+    whole_repository = tags is None and prefix is None
+    
+    def affected(marker):
+        if whole_repository or marker == '*':
+            return True
+        if marker.startswith('@'):
+            return False
+        return (tags is not None and marker in tags) or (prefix is not None and marker.startswith(prefix))
+    
+    if metadata_store is not None:
+        if whole_repository:
+            metadata_store.delete_tags(f"tag:{name}:")
+        else:
+            for tag in tags or ():
+                metadata_store.delete_tags(f"tag:{name}:{tag}|")
+            if prefix is not None:
+                metadata_store.delete_tags(f"tag:{name}:{prefix}")
+    
+    deleted = []
+    refreshed = 0
+    for marker, key in cache_key_index.members(name):
+        if not affected(marker):
+            continue
+        if marker in refresh and key.startswith('tag:'):
+            set_tag_digest(key, refresh[marker])
+            refreshed += 1
+        else:
+            deleted.append((marker, key))
+    if deleted:
+        cache.delete_many(*[key for _, key in deleted])
+        cache_key_index.remove(name, deleted)
+        count_negative_cleared(key for _, key in deleted)
+    incr_stat('cache_invalidated_keys', len(deleted))
+    logger.info("缓存失效 %s (标签: %s, 前缀: %s): 删除 %s 个条目，更新 %s 个标签映射",
+                name, tags or '-', prefix if prefix is not None else '-', len(deleted), refreshed)
+    return len(deleted), refreshed
+
+def negative_cached(kind, key, fetch, repository, marker):
+    """对镜像不存在或无权访问的结果做短时缓存，避免反复查询拼错或私有的镜像消耗Registry配额
+
+    key需包含规范化引用，以 |凭证范围|代理 结尾。repository和marker用于登记反向索引：推送新镜像后可以精确失效
+    （见invalidate_cache），其他路径（解析标签、获取标签列表）用同一凭证成功访问时删除（见clear_negative_entries）。
+    """
+    negative_key = f"negative:{key}"
+    if NEGATIVE_CACHE_TIMEOUT > 0:
+        cached = cache.get(negative_key)
+        if cached is not None:
+            incr_stat(f'negative_cache_hit_{kind}')
+            NEGATIVE_LOOKUPS.labels(kind=kind, outcome='hit').inc()
+            logger.debug("负缓存命中: %s", key)
+            return copy.deepcopy(cached)
+    
+    data = fetch()
+    if data.get('status') == 'error' and data.get('code') in ACCESS_ERROR_CODES:
+        if NEGATIVE_CACHE_TIMEOUT > 0:
+            cache.set(negative_key, data, timeout=NEGATIVE_CACHE_TIMEOUT)
+            cache_key_index.add(repository, marker, negative_key)
+            incr_stat(f'negative_cache_store_{kind}')
+            NEGATIVE_LOOKUPS.labels(kind=kind, outcome='store').inc()
+    return data
+
+def count_negative_cleared(keys):
+    """按类型统计删除的负缓存条目"""
+    for key in keys:
+        if key.startswith('negative:'):
+            NEGATIVE_LOOKUPS.labels(kind=key.split(':', 2)[1], outcome='clear').inc()
+
+def clear_negative_entries(registry, repository, markers, scope, proxy):
+    """凭证范围scope成功访问了仓库时，删除该凭证在这些标记（标签或*）下的负缓存条目，返回删除条数
+
+    负缓存命中时不会再访问Registry，镜像推送或权限变化后只能由其他成功的路径清除。
+    """
+    if NEGATIVE_CACHE_TIMEOUT <= 0:
+        return 0
+    name = f"{registry}/{repository}"
+    suffix = f"|{scope}|{proxy}"
+    entries = [(marker, key) for marker, key in cache_key_index.members(name)
+               if key.startswith('negative:') and key.endswith(suffix) and marker in markers]
+    cleared = [key for _, key in entries if cache.delete(key)]
+    cache_key_index.remove(name, entries)
+    count_negative_cleared(cleared)
+    if cleared:
+        logger.debug("清除负缓存: %s, %s 个条目", name, len(cleared))
+    return len(cleared)
+
+def track_fetch(registry, fn):
+    """执行实际的获取，期间计入该Registry的进行中获取数"""
+    with INFLIGHT_FETCHES.labels(registry=metric_registry(registry)).track_inprogress():
+        return fn()
+
+def get_image_data(image, username=None, password=None, proxy=None, platform=None):
+    """获取镜像数据的通用函数，根据IMAGE_BACKEND选择获取方式，并发的相同请求只获取一次，
+    镜像不存在或无权访问的结果短时缓存
+
+    platform为 os/arch[/variant]，多架构镜像时选择该平台，默认为DEFAULT_PLATFORM。
+    """
+    platform = platform or DEFAULT_PLATFORM
+    scope = credential_scope(username or os.environ.get('IMAGE_USERNAME', ''),
+                             password or os.environ.get('IMAGE_PASSWORD', ''))
+    key = f"image:{normalized_reference(image)}|{platform}|{scope}|{proxy or os.environ.get('HTTPS_PROXY', '')}"
+    registry, repository, reference = split_image_reference(image)
+    if IMAGE_BACKEND == 'skopeo':
+        fetch = get_image_data_skopeo
+    else:
+        fetch = get_image_data_registry
+    return negative_cached('image', key, lambda: singleflight(
+        key, lambda: track_fetch(registry, lambda: fetch(image, username, password, proxy, platform))),
+        f"{registry}/{repository}", reference_marker(reference))
+
+def skopeo_platform_args(platform):
+    """将 os/arch[/variant] 转换为skopeo的全局平台覆盖参数"""
+    if not platform:
+        return []
+    os_name, _, rest = platform.partition('/')
+    arch, _, variant = rest.partition('/')
+    args = ['--override-os', os_name]
+    if arch:
+        args.extend(['--override-arch', arch])
+    if variant:
+        args.extend(['--override-variant', variant])
+    return args
+
+def get_image_data_skopeo(image, username=None, password=None, proxy=None, platform=None):
+    """通过skopeo命令获取镜像数据"""
+    # 使用规范化的完整引用，未指定标签时补全为:latest
+    image = normalized_reference(image)
     
     # 获取认证信息（可选）
     username = username or os.environ.get('IMAGE_USERNAME', '')
     password = password or os.environ.get('IMAGE_PASSWORD', '')
-    creds = []
+    creds = skopeo_auth_args(image, username, password, proxy or os.environ.get('HTTPS_PROXY', ''))
     if username and password:
-        creds = ['--creds', f'{username}:{password}']
-        logger.info(f"使用认证信息: 用户名={username}")
+        logger.debug("使用认证信息: 用户名=%s", username)
     
     # 获取代理信息（可选）
     proxy = proxy or os.environ.get('HTTPS_PROXY', '')
@@ -112,40 +844,46 @@ def get_image_data(image, username=None, password=None, proxy=None):
         env['HTTPS_PROXY'] = proxy
         # 也设置HTTP_PROXY，增加兼容性
         env['HTTP_PROXY'] = proxy
-        logger.info(f"使用代理: {proxy}")
+        logger.debug("使用代理: %s", proxy)
     
     # 调用skopeo获取镜像信息
-    cmd = ['skopeo', 'inspect']
+    platform_args = skopeo_platform_args(platform)
+    cmd = ['skopeo'] + platform_args + ['inspect']
     cmd.extend(creds)
     cmd.append(f'docker://{image}')
     
-    logger.info(f"执行命令: {' '.join(cmd)}")
+    logger.debug("执行命令: %s", ' '.join(cmd))
     
-    process = subprocess.run(
-        cmd,
-        env=env,
-        capture_output=True,
-        text=True
-    )
+    try:
+        process = run_skopeo('skopeo_inspect', cmd, env=env, text=True)
+    except CommandError as e:
+        logger.error("skopeo命令未完成: %s", e)
+        return {
+            'status': 'error',
+            'code': e.status_code,
+            'message': f'获取镜像信息失败: {image}',
+            'error': str(e),
+            'command': ' '.join(cmd)
+        }
     
     if process.returncode != 0:
         # 详细记录错误信息
-        logger.error(f"skopeo命令执行失败，返回码: {process.returncode}")
-        logger.error(f"错误输出: {process.stderr}")
+        logger.error("skopeo命令执行失败，返回码: %s", process.returncode)
+        logger.error("错误输出: %s", process.stderr)
         
         # 检查常见错误
-        err = process.stderr.lower()
-        if any(msg in err for msg in ['unauthorized', 'forbidden', 'not found']):
-            logger.error(f"权限不足或镜像不存在: {image}")
+        status_code = skopeo_error_status(process.stderr)
+        if status_code in ACCESS_ERROR_CODES:
+            logger.error("权限不足或镜像不存在: %s", image)
             return {
                 'status': 'error',
-                'code': 404,
+                'code': status_code,
                 'message': f'权限不足或镜像不存在: {image}',
                 'error': process.stderr,
                 'command': ' '.join(cmd)
             }
         else:
-            logger.error(f"获取镜像信息失败: {image}")
+            logger.error("获取镜像信息失败: %s", image)
             return {
                 'status': 'error',
                 'code': 500,
@@ -156,36 +894,55 @@ def get_image_data(image, username=None, password=None, proxy=None):
     
     # 解析JSON结果
     result = json.loads(process.stdout)
-    logger.info(f"成功获取镜像信息: {image}")
+    logger.debug("成功获取镜像信息: %s", image)
     
     # 尝试获取镜像配置以提取端口信息
-    exposed_ports = get_image_exposed_ports(image, username, password, proxy, env, creds)
+    exposed_ports = get_image_exposed_ports(image, username, password, proxy, env, creds, platform_args)
     if exposed_ports:
         result['ExposedPorts'] = exposed_ports
-        logger.info(f"成功获取镜像暴露端口: {exposed_ports}")
+        logger.debug("成功获取镜像暴露端口: %s", exposed_ports)
     
     return {
         'status': 'success',
         'result': result
     }
 
-def get_image_exposed_ports(image, username, password, proxy, env, creds):
+def skopeo_error_status(stderr):
+    """由skopeo的错误输出判断接口状态码: 认证失败401，无权访问403，不存在404，其他500"""
+    err = stderr.lower()
+    if 'unauthorized' in err or 'authentication required' in err:
+        return 401
+    if 'forbidden' in err or 'denied' in err:
+        return 403
+    if 'not found' in err or 'manifest unknown' in err:
+        return 404
+    return 500
+
+def skopeo_auth_args(image, username, password, proxy):
+    """skopeo认证参数：优先使用共享令牌缓存中的Bearer令牌，避免每次skopeo调用重新协商令牌"""
+    try:
+        registry, repository, _ = split_image_reference(image)
+        token = registry_client.token_for(registry, repository, {'username': username, 'password': password}, proxy)
+        if token:
+            return ['--registry-token', token]
+    except (RegistryError, requests.RequestException, ValueError) as e:
+        logger.debug("获取共享令牌失败，使用用户名密码认证: %s", e)
+    if username and password:
+        return ['--creds', f'{username}:{password}']
+    return []
+
+def get_image_exposed_ports(image, username, password, proxy, env, creds, platform_args=()):
     """获取镜像暴露的端口信息"""
     try:
         # 获取镜像配置以提取端口信息
         # 方法1: 尝试使用skopeo inspect --config
-        cmd = ['skopeo', 'inspect', '--config']
+        cmd = ['skopeo'] + list(platform_args) + ['inspect', '--config']
         cmd.extend(creds)
         cmd.append(f'docker://{image}')
         
-        logger.info(f"获取镜像配置信息: {' '.join(cmd)}")
+        logger.debug("获取镜像配置信息: %s", ' '.join(cmd))
         
-        process = subprocess.run(
-            cmd,
-            env=env,
-            capture_output=True,
-            text=True
-        )
+        process = run_skopeo('skopeo_inspect_config', cmd, env=env, text=True)
         
         if process.returncode == 0:
             config = json.loads(process.stdout)
@@ -201,12 +958,7 @@ def get_image_exposed_ports(image, username, password, proxy, env, creds):
         cmd_raw.extend(creds)
         cmd_raw.append(f'docker://{image}')
         
-        process_raw = subprocess.run(
-            cmd_raw,
-            env=env,
-            capture_output=True,
-            text=True
-        )
+        process_raw = run_skopeo('skopeo_inspect_raw_ports', cmd_raw, env=env, text=True)
         
         if process_raw.returncode == 0:
             manifest = json.loads(process_raw.stdout)
@@ -216,97 +968,804 @@ def get_image_exposed_ports(image, username, password, proxy, env, creds):
                 config_digest = manifest['config']['digest']
                 
                 # 使用config digest获取配置信息
-                registry_url = get_registry_url(image)
-                image_name = get_image_name(image)
+                registry_url, image_name, _ = split_image_reference(image)
+                config_blob = get_config_blob(registry_url, image_name, config_digest, username, password, env)
                 
-                if registry_url and image_name:
-                    config_blob = get_config_blob(registry_url, image_name, config_digest, username, password, env)
-                    
-                    if config_blob and 'config' in config_blob and 'ExposedPorts' in config_blob['config']:
-                        ports = list(config_blob['config']['ExposedPorts'].keys())
-                        return ports
+                if config_blob and 'config' in config_blob and 'ExposedPorts' in config_blob['config']:
+                    ports = list(config_blob['config']['ExposedPorts'].keys())
+                    return ports
         
         # 如果都未找到，返回空列表
         return []
+    except CommandCancelled:
+        raise
     except Exception as e:
-        logger.error(f"获取镜像端口信息失败: {str(e)}")
+        logger.error("获取镜像端口信息失败: %s", e)
         return []
 
-def get_registry_url(image):
-    """从镜像名中提取registry URL"""
-    if '/' in image:
-        parts = image.split('/')
-        if '.' in parts[0] or ':' in parts[0]:  # 如果包含域名或端口
-            return parts[0]
-    # 默认为Docker Hub
-    return "registry-1.docker.io"
+def get_config_blob(registry_url, image_name, config_digest, username, password, env):
+    """获取镜像配置blob，通过Registry客户端跟随认证质询并复用缓存的令牌"""
+    try:
+        auth = {'username': username, 'password': password}
+        return registry_client.get_blob_json(registry_url, image_name, config_digest, auth, env.get('HTTPS_PROXY'))
+    except RegistryError as e:
+        logger.warning("获取配置blob失败: %s", e)
+        return None
+    except Exception as e:
+        logger.error("获取配置blob异常: %s", e)
+        return None
+
+# Registry v2 API 支持的manifest类型
+MANIFEST_LIST_TYPES = (
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.index.v1+json',
+)
+MANIFEST_ACCEPT = ', '.join(MANIFEST_LIST_TYPES + (
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+))
+
+class RegistryError(Exception):
+    """Registry请求失败，status_code为Registry返回的HTTP状态码"""
+    def __init__(self, message, status_code=500, url=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.url = url
+
+class CommandError(RegistryError):
+    """skopeo调用未能完成：排队已满或等待超时(503)、执行超时(504)"""
+
+class CommandCancelled(Exception):
+    """请求已取消，skopeo子进程已终止；不转换为错误结果，避免合并的其他请求拿到取消结果"""
+
+def parse_www_authenticate(header):
+    """解析WWW-Authenticate响应头，返回(认证方式, 参数字典)"""
+    scheme, _, params = header.partition(' ')
+    return scheme.lower(), dict(re.findall(r'(\w+)="([^"]*)"', params))
+
+class TokenManager:
+    """Registry认证令牌管理
+
+    跟随WWW-Authenticate质询获取令牌，并按(registry, repository, scope, 凭证)缓存到过期前
+    TOKEN_EXPIRY_MARGIN秒，所有获取阶段（manifest、config、标签列表、skopeo调用）共享。
+    """
+
+    def __init__(self, session, timeout=REGISTRY_TIMEOUT):
+        self.session = session
+        self.timeout = timeout
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def cache_key(self, registry, repository, auth):
+        scope = f"repository:{repository}:pull"
+        return (registry, repository, scope, credential_scope(auth.get('username', ''), auth.get('password', '')))
+
+    def get(self, registry, repository, auth):
+        """返回缓存的Authorization头，不存在或即将过期时返回None"""
+        key = self.cache_key(registry, repository, auth)
+        with self.lock:
+            entry = self.tokens.get(key)
+            if entry and entry[1] > time.time():
+                incr_stat('registry_token_cache_hit')
+                return entry[0]
+            self.tokens.pop(key, None)
+        return None
+
+    def invalidate(self, registry, repository, auth):
+        with self.lock:
+            self.tokens.pop(self.cache_key(registry, repository, auth), None)
 
-def get_image_name(image):
-    """从镜像名中提取镜像名称（不含registry和标签）"""
-    if '/' in image:
-        parts = image.split('/')
-        if '.' in parts[0] or ':' in parts[0]:  # 如果包含域名或端口
-            image = '/'.join(parts[1:])
+    def authorize(self, registry, repository, challenge, auth, proxies):
+        """根据WWW-Authenticate质询获取Authorization头并缓存，无法处理时返回None"""
+        scheme, params = parse_www_authenticate(challenge)
+        username, password = auth.get('username'), auth.get('password')
+        credentials = (username, password) if username and password else None
+        
+        if scheme == 'basic':
+            if not credentials:
+                return None
+            token = base64.b64encode(f"{username}:{password}".encode()).decode()
+            authorization, expires_in = f"Basic {token}", 86400
+        elif scheme == 'bearer' and params.get('realm'):
+            # /v2/ 的质询不带scope，按仓库补全为pull权限
+            query = {'service': params.get('service', ''), 'scope': params.get('scope') or f"repository:{repository}:pull"}
+            logger.debug("获取Registry令牌: %s %s", params['realm'], query)
+            with STAGE_LATENCY.labels(stage='registry_token').time():
+                resp = self.session.get(params['realm'], params=query, auth=credentials,
+                                        proxies=proxies, timeout=self.timeout)
+            incr_stat('registry_token_fetch')
+            REGISTRY_RESPONSES.labels(registry=metric_registry(registry), method='TOKEN', code=str(resp.status_code)).inc()
+            if resp.status_code != 200:
+                raise RegistryError(f"获取Registry令牌失败: {resp.status_code}", resp.status_code, params['realm'])
+            data = resp.json()
+            token = data.get('token') or data.get('access_token')
+            if not token:
+                return None
+            # 规范规定未返回expires_in时令牌有效期为60秒
+            authorization, expires_in = f"Bearer {token}", int(data.get('expires_in') or 60)
+        else:
+            return None
+        
+        margin = min(TOKEN_EXPIRY_MARGIN, expires_in // 2)
+        with self.lock:
+            self.tokens[self.cache_key(registry, repository, auth)] = (authorization, time.time() + expires_in - margin)
+        return authorization
+
+class RegistryClient:
+    """Registry v2 HTTP客户端，所有请求共享同一个keep-alive连接池和令牌缓存"""
+
+    def __init__(self, pool_size=REGISTRY_POOL_SIZE, timeout=REGISTRY_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.tokens = TokenManager(self.session, timeout)
+
+    def base_url(self, registry):
+        """返回registry的访问地址，localhost和INSECURE_REGISTRIES使用HTTP"""
+        host = registry.split(':')[0]
+        if registry in INSECURE_REGISTRIES or host in ('localhost', '127.0.0.1'):
+            return f"http://{registry}"
+        return f"https://{registry}"
+
+    def request(self, method, registry, repository, path, auth, proxy=None, headers=None, stream=False):
+        """发送Registry请求
+
+        有缓存的令牌时直接带上，省去一次401往返；遇到401时按质询重新获取令牌并重试一次。
+        stream为True时不读取响应体，调用方负责关闭响应。
+        """
+        url = f"{self.base_url(registry)}{path}"
+        proxies = {'https': proxy, 'http': proxy} if proxy else None
+        headers = dict(headers or {})
+        authorization = self.tokens.get(registry, repository, auth)
+        
+        for attempt in range(2):
+            if authorization:
+                headers['Authorization'] = authorization
+            with STAGE_LATENCY.labels(stage='registry_http').time():
+                resp = self.session.request(method, url, headers=headers, proxies=proxies, timeout=self.timeout,
+                                            stream=stream)
+            REGISTRY_RESPONSES.labels(registry=metric_registry(registry), method=method, code=str(resp.status_code)).inc()
+            if resp.status_code != 401 or attempt > 0:
+                break
+            resp.close()
+            self.tokens.invalidate(registry, repository, auth)
+            authorization = self.tokens.authorize(registry, repository, resp.headers.get('WWW-Authenticate', ''), auth, proxies)
+            if not authorization:
+                break
+        
+        if resp.status_code >= 400:
+            resp.close()
+            raise RegistryError(f"Registry返回错误: {resp.status_code} {method} {path}", resp.status_code, url)
+        return resp
+
+    def token_for(self, registry, repository, auth, proxy=None):
+        """获取仓库的Bearer令牌（供skopeo --registry-token使用），Registry不使用Bearer认证时返回None"""
+        authorization = self.tokens.get(registry, repository, auth)
+        if authorization is None:
+            proxies = {'https': proxy, 'http': proxy} if proxy else None
+            with STAGE_LATENCY.labels(stage='registry_http').time():
+                resp = self.session.get(f"{self.base_url(registry)}/v2/", proxies=proxies, timeout=self.timeout)
+            REGISTRY_RESPONSES.labels(registry=metric_registry(registry), method='GET', code=str(resp.status_code)).inc()
+            if resp.status_code != 401:
+                return None
+            authorization = self.tokens.authorize(registry, repository, resp.headers.get('WWW-Authenticate', ''), auth, proxies)
+        if authorization and authorization.startswith('Bearer '):
+            return authorization[len('Bearer '):]
+        return None
+
+    def get_manifest(self, registry, repository, reference, auth, proxy=None):
+        """获取manifest，返回(manifest, digest, mediaType)"""
+        resp = self.request('GET', registry, repository, f"/v2/{repository}/manifests/{reference}", auth, proxy,
+                            headers={'Accept': MANIFEST_ACCEPT})
+        body = resp.content
+        digest = resp.headers.get('Docker-Content-Digest') or 'sha256:' + hashlib.sha256(body).hexdigest()
+        manifest = json.loads(body)
+        media_type = manifest.get('mediaType') or resp.headers.get('Content-Type', '').split(';')[0]
+        return manifest, digest, media_type
+
+    def head_manifest(self, registry, repository, reference, auth, proxy=None):
+        """通过HEAD请求获取标签当前指向的manifest digest，Registry未返回digest时为None"""
+        resp = self.request('HEAD', registry, repository, f"/v2/{repository}/manifests/{reference}", auth, proxy,
+                            headers={'Accept': MANIFEST_ACCEPT})
+        return resp.headers.get('Docker-Content-Digest')
+
+    def get_blob_json(self, registry, repository, digest, auth, proxy=None):
+        """获取JSON格式的blob（如镜像config）"""
+        resp = self.request('GET', registry, repository, f"/v2/{repository}/blobs/{digest}", auth, proxy)
+        return resp.json()
+
+    def open_blob(self, registry, repository, digest, auth, proxy=None):
+        """以流的方式打开blob（如图层），调用方负责关闭响应"""
+        return self.request('GET', registry, repository, f"/v2/{repository}/blobs/{digest}", auth, proxy, stream=True)
+
+    def list_tags(self, registry, repository, auth, proxy=None, last=None):
+        """获取全部标签，按Link响应头自动翻页；指定last时只获取字典序在其之后的标签"""
+        path = f"/v2/{repository}/tags/list"
+        if last:
+            path += '?' + urlencode({'last': last})
+        tags = []
+        while path:
+            resp = self.request('GET', registry, repository, path, auth, proxy)
+            tags.extend(resp.json().get('tags') or [])
+            next_url = resp.links.get('next', {}).get('url')
+            if next_url:
+                parts = urlsplit(next_url)
+                path = f"{parts.path}?{parts.query}" if parts.query else parts.path
+            else:
+                path = None
+        return tags
+
+registry_client = RegistryClient()
+
+registry_semaphores = {}
+registry_semaphores_lock = threading.Lock()
+
+def registry_semaphore(registry):
+    """每个Registry一个信号量，限制并发获取数（REGISTRY_CONCURRENCY）"""
+    with registry_semaphores_lock:
+        semaphore = registry_semaphores.get(registry)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(REGISTRY_CONCURRENCY)
+            registry_semaphores[registry] = semaphore
+        return semaphore
+
+# 镜像引用语法（distribution/reference）: [域名[:端口]/]路径组件[/路径组件...][:标签][@算法:摘要]
+REFERENCE_DOMAIN = re.compile(r'^(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?(?:\.[a-z0-9](?:[a-z0-9-]*[a-z0-9])?)*|\[[0-9a-f:]+\])(?::[0-9]+)?$')
+REFERENCE_PATH_COMPONENT = re.compile(r'^[a-z0-9]+(?:(?:[._]|__|-+)[a-z0-9]+)*$')
+REFERENCE_TAG = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.-]{0,127}$')
+REFERENCE_DIGEST = re.compile(r'^[a-z0-9]+(?:[.+_-][a-z0-9]+)*:[a-zA-Z0-9=_-]+$')
+# 仓库名（含域名）最大长度
+REFERENCE_NAME_MAX_LENGTH = 255
+# Docker Hub的各种写法统一为docker.io，API地址为registry-1.docker.io
+DOCKER_HUB_DOMAINS = ('docker.io', 'index.docker.io', 'registry-1.docker.io', 'registry.hub.docker.com')
+DOCKER_HUB_API = 'registry-1.docker.io'
+
+class ImageReference(namedtuple('ImageReference', ['domain', 'repository', 'tag', 'digest'])):
+    """解析后的镜像引用，domain为规范域名（Docker Hub为docker.io），tag和digest未指定时为None"""
+    __slots__ = ()
+    
+    @property
+    def registry(self):
+        """Registry API地址"""
+        return DOCKER_HUB_API if self.domain == 'docker.io' else self.domain
     
-    if ':' in image:
-        image = image.split(':')[0]
+    @property
+    def name(self):
+        """规范仓库名，例如 docker.io/library/nginx"""
+        return f"{self.domain}/{self.repository}"
     
-    # 处理Docker Hub官方镜像
-    if '/' not in image:
-        image = "library/" + image
+    @property
+    def reference(self):
+        """获取时使用的引用：指定了digest时使用digest（忽略标签），否则使用标签，默认latest"""
+        return self.digest or self.tag or 'latest'
     
-    return image
+    def __str__(self):
+        separator = '@' if self.digest else ':'
+        return f"{self.name}{separator}{self.reference}"
 
-def get_config_blob(registry_url, image_name, config_digest, username, password, env):
-    """获取镜像配置blob"""
+@functools.lru_cache(maxsize=4096)
+def parse_image_reference(image):
+    """按distribution规范解析镜像引用，无效时抛出ValueError
+
+    nginx、nginx:latest、docker.io/nginx:latest 和 docker.io/library/nginx:latest 解析结果相同；
+    第一个路径组件包含 . 或 : 或为localhost时才视为Registry域名，因此 host:5000/repo 不会被当作标签。
+    """
+    remainder, _, digest = image.strip().partition('@')
+    if digest and not REFERENCE_DIGEST.match(digest):
+        raise ValueError(f"无效的digest: {digest}")
+    if digest.startswith('sha256:') and not re.match(r'^[a-f0-9]{64}$', digest[7:]):
+        raise ValueError(f"无效的sha256 digest: {digest}")
+    
+    # 冒号在最后一个斜杠之后才是标签，否则是域名中的端口
+    tag = None
+    colon = remainder.rfind(':')
+    if colon > remainder.rfind('/'):
+        remainder, tag = remainder[:colon], remainder[colon + 1:]
+        if not REFERENCE_TAG.match(tag):
+            raise ValueError(f"无效的标签: {tag}")
+    
+    domain, slash, path = remainder.partition('/')
+    if not slash or not ('.' in domain or ':' in domain or domain == 'localhost' or domain != domain.lower()):
+        domain, path = 'docker.io', remainder
+    domain = domain.lower()
+    if not REFERENCE_DOMAIN.match(domain):
+        raise ValueError(f"无效的Registry地址: {domain}")
+    if domain in DOCKER_HUB_DOMAINS:
+        domain = 'docker.io'
+        if '/' not in path:
+            path = f"library/{path}"
+    
+    components = path.split('/')
+    for component in components:
+        if not REFERENCE_PATH_COMPONENT.match(component):
+            raise ValueError(f"无效的仓库名: {path}（只能包含小写字母、数字和分隔符 . _ __ -）")
+    if len(domain) + 1 + len(path) > REFERENCE_NAME_MAX_LENGTH:
+        raise ValueError(f"仓库名超过{REFERENCE_NAME_MAX_LENGTH}个字符")
+    return ImageReference(domain, path, tag, digest or None)
+
+def split_image_reference(image):
+    """将镜像名拆分为(registry, repository, reference)，registry为API地址，reference为标签或digest"""
+    reference = parse_image_reference(image)
+    return reference.registry, reference.repository, reference.reference
+
+def is_digest(reference):
+    """split_image_reference返回的reference是否为digest（标签不能包含冒号）"""
+    return ':' in reference
+
+def invalid_reference_response(image):
+    """镜像引用无法解析时返回400响应，否则返回None"""
     try:
-        import requests
-        
-        # 构建URL
-        url = f"https://{registry_url}/v2/{image_name}/blobs/{config_digest}"
-        
-        headers = {}
-        auth = None
-        
-        # 添加认证
-        if username and password:
-            auth = (username, password)
-        
-        # 设置代理
-        proxies = {}
-        if 'HTTPS_PROXY' in env:
-            proxies['https'] = env['HTTPS_PROXY']
-        if 'HTTP_PROXY' in env:
-            proxies['http'] = env['HTTP_PROXY']
-        
-        # 发送请求
-        response = requests.get(url, headers=headers, auth=auth, proxies=proxies, timeout=30)
-        
-        if response.status_code == 200:
-            return response.json()
+        parse_image_reference(image)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'无效的镜像引用: {image}',
+            'error': str(e)
+        }), 400
+    return None
+
+def partition_image_list(images, field=None):
+    """把请求体中的镜像列表分为可用的镜像引用和逐项的错误结果
+
+    不是字符串、为空或无法解析的条目不影响其他镜像，错误结果带有它在列表中的位置index，
+    field为列表在请求体中的字段名（同一请求有多个列表时用于区分）。
+    """
+    valid, rejected = [], []
+    for index, image in enumerate(images):
+        error = None
+        if not isinstance(image, str) or not image:
+            message = f'第 {index} 项不是有效的镜像名称，应为非空字符串'
         else:
-            logger.warning(f"获取配置blob失败: {response.status_code} - {response.text}")
+            try:
+                parse_image_reference(image)
+                valid.append(image)
+                continue
+            except ValueError as e:
+                message, error = f'无效的镜像引用: {image}', str(e)
+        entry = {'status': 'error', 'index': index, 'image': image, 'code': 400, 'message': message}
+        if error:
+            entry['error'] = error
+        if field:
+            entry['field'] = field
+        rejected.append(entry)
+    return valid, rejected
+
+def select_platform_manifest(index, platform=DEFAULT_PLATFORM):
+    """从manifest list/OCI index中选出指定平台(os/arch[/variant])的manifest条目"""
+    os_name, _, rest = platform.partition('/')
+    arch, _, variant = rest.partition('/')
+    candidates = [
+        m for m in index.get('manifests', [])
+        if m.get('platform', {}).get('os') == os_name and m.get('platform', {}).get('architecture') == arch
+    ]
+    if variant:
+        candidates.sort(key=lambda m: m['platform'].get('variant') != variant)
+    return candidates[0] if candidates else None
+
+def build_inspect_result(name, digest, manifest, config):
+    """将manifest和config组装为与skopeo inspect输出一致的结构"""
+    container_config = config.get('config') or {}
+    layers = manifest.get('layers', [])
+    result = {
+        'Name': name,
+        'Digest': digest,
+        'RepoTags': [],
+        'Created': config.get('created', ''),
+        'DockerVersion': config.get('docker_version', ''),
+        'Labels': container_config.get('Labels'),
+        'Architecture': config.get('architecture', ''),
+        'Os': config.get('os', ''),
+        'Layers': [layer.get('digest') for layer in layers],
+        'LayersData': [
+            {
+                'MIMEType': layer.get('mediaType', ''),
+                'Digest': layer.get('digest'),
+                'Size': layer.get('size', 0),
+                'Annotations': layer.get('annotations'),
+            }
+            for layer in layers
+        ],
+        'Env': container_config.get('Env') or [],
+    }
+    if config.get('variant'):
+        result['Variant'] = config['variant']
+    if container_config.get('ExposedPorts'):
+        result['ExposedPorts'] = list(container_config['ExposedPorts'].keys())
+    return result
+
+class MetadataStore:
+    """SQLite持久化元数据存储：按digest缓存的数据和带时间戳的标签到digest映射
+
+    首次使用时才打开数据库，启动不做任何加载；每个线程使用独立连接，WAL模式下多个worker进程
+    可以同时读取，写入由SQLite串行化。存储出错时只记录警告，不影响请求。
+    """
+
+    # 读取时距离上次记录访问时间超过该秒数才更新，避免每次读取都写库
+    ACCESS_UPDATE_INTERVAL = 86400
+
+    def __init__(self, path, retention_days=METADATA_RETENTION_DAYS, compact_interval=METADATA_COMPACT_INTERVAL):
+        self.path = path
+        self.retention = retention_days * 86400
+        self.compact_interval = compact_interval
+        self.local = threading.local()
+        self.init_lock = threading.Lock()
+        self.initialized_pid = None
+
+    def connection(self):
+        """返回当前线程的连接，fork后的子进程重新建立连接"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None and self.local.pid == os.getpid():
+            return conn
+        with self.init_lock:
+            if self.initialized_pid != os.getpid():
+                self.initialize()
+                self.initialized_pid = os.getpid()
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self.local.conn = conn
+        self.local.pid = os.getpid()
+        return conn
+
+    def initialize(self):
+        """建表并启动本进程的后台压缩线程"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            # auto_vacuum只对新建的数据库生效，必须在建表之前设置
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS digest_entries '
+                         '(key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL, accessed REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS tag_digests '
+                         '(key TEXT PRIMARY KEY, digest TEXT NOT NULL, updated REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            # 旧版本按未加盐的密码SHA-256摘要区分凭证，删除这些标签映射，避免摘要留在磁盘上
+            conn.execute("DELETE FROM tag_digests WHERE key LIKE '%|credentials:%#%'")
+        finally:
+            conn.close()
+        logger.info("持久化元数据存储: %s", self.path)
+        threading.Thread(target=self.compact_loop, name='metadata-compact', daemon=True).start()
+
+    def get_digest(self, key):
+        try:
+            conn = self.connection()
+            row = conn.execute('SELECT value, accessed FROM digest_entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > self.ACCESS_UPDATE_INTERVAL:
+                conn.execute('UPDATE digest_entries SET accessed = ? WHERE key = ?', (now, key))
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning("读取持久化存储失败: %s, %s", key, e)
             return None
-    except Exception as e:
-        logger.error(f"获取配置blob异常: {str(e)}")
+
+    def set_digest(self, key, value):
+        try:
+            now = time.time()
+            self.connection().execute('INSERT OR REPLACE INTO digest_entries VALUES (?, ?, ?, ?)',
+                                      (key, json.dumps(value), now, now))
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning("写入持久化存储失败: %s, %s", key, e)
+
+    def get_tag(self, key):
+        """返回(digest, 记录时间)，不存在时返回None"""
+        try:
+            return self.connection().execute('SELECT digest, updated FROM tag_digests WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("读取持久化存储失败: %s, %s", key, e)
+            return None
+
+    def set_tag(self, key, digest):
+        try:
+            self.connection().execute('INSERT OR REPLACE INTO tag_digests VALUES (?, ?, ?)', (key, digest, time.time()))
+        except sqlite3.Error as e:
+            logger.warning("写入持久化存储失败: %s, %s", key, e)
+
+    def delete_tags(self, prefix):
+        """删除键以prefix开头的标签映射，返回删除条数"""
+        try:
+            return self.connection().execute('DELETE FROM tag_digests WHERE substr(key, 1, ?) = ?',
+                                             (len(prefix), prefix)).rowcount
+        except sqlite3.Error as e:
+            logger.warning("删除持久化标签映射失败: %s, %s", prefix, e)
+            return 0
+
+    def clear(self):
+        conn = self.connection()
+        conn.execute('DELETE FROM digest_entries')
+        conn.execute('DELETE FROM tag_digests')
+
+    def stats(self):
+        conn = self.connection()
+        return {
+            'path': self.path,
+            'digest_entries': conn.execute('SELECT COUNT(*) FROM digest_entries').fetchone()[0],
+            'tag_entries': conn.execute('SELECT COUNT(*) FROM tag_digests').fetchone()[0],
+            'size_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+    def compact(self):
+        """删除过期条目并回收空间，距离上次压缩（任意进程）不足compact_interval时跳过"""
+        conn = self.connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'last_compact'").fetchone()
+            if row is not None and now - float(row[0]) < self.compact_interval:
+                conn.execute('COMMIT')
+                return False
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_compact', ?)", (str(now),))
+            removed = conn.execute('DELETE FROM digest_entries WHERE accessed < ?', (now - self.retention,)).rowcount
+            removed += conn.execute('DELETE FROM tag_digests WHERE updated < ?', (now - self.retention,)).rowcount
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('PRAGMA incremental_vacuum')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        logger.info("持久化存储压缩完成，删除 %s 个过期条目", removed)
+        return True
+
+    def compact_loop(self):
+        while True:
+            time.sleep(self.compact_interval)
+            try:
+                self.compact()
+            except sqlite3.Error as e:
+                logger.warning("持久化存储压缩失败: %s", e)
+
+metadata_store = MetadataStore(METADATA_DB) if METADATA_DB else None
+
+def tag_cache_key(registry, repository, tag, scope, proxy):
+    """标签到digest映射的缓存键，按凭证范围（credential_scope，含密码HMAC）和代理区分
+
+    映射是用该凭证访问Registry得到的，其他凭证（包括用户名相同、密码错误）不能复用。
+    """
+    return f"tag:{registry}/{repository}:{tag}|credentials:{scope}|proxy:{proxy}"
+
+def auth_scope(auth):
+    """Registry客户端认证信息对应的凭证范围"""
+    return credential_scope(auth.get('username', ''), auth.get('password', ''))
+
+def access_cache_key(registry, repository, scope, proxy):
+    return f"access:{registry}/{repository}|credentials:{scope}|proxy:{proxy}"
+
+def has_repository_access(registry, repository, scope, proxy):
+    """该凭证范围在TAG_CACHE_TIMEOUT内是否已成功访问过仓库，只读缓存，不访问Registry"""
+    return cache.get(access_cache_key(registry, repository, scope, proxy)) is not None
+
+def grant_repository_access(registry, repository, scope, proxy):
+    """记录凭证范围已成功访问仓库，有效期与标签映射相同"""
+    cache.set(access_cache_key(registry, repository, scope, proxy), True, timeout=TAG_CACHE_TIMEOUT)
+
+def ensure_repository_access(registry, repository, digest, auth, proxy):
+    """读取按digest共享的缓存前确认当前凭证有权拉取该仓库
+
+    digest缓存（manifest、config、inspect结果）不区分凭证，知道digest不代表有权访问私有镜像；
+    该凭证最近没有成功访问过仓库时用它HEAD一次manifest，认证失败或无权访问时抛出RegistryError。
+    """
+    scope = auth_scope(auth)
+    if has_repository_access(registry, repository, scope, proxy):
+        return
+    registry_client.head_manifest(registry, repository, digest, auth, proxy)
+    grant_repository_access(registry, repository, scope, proxy)
+
+def get_digest_entry(kind, name, digest):
+    """读取按内容digest缓存的数据（manifest、config、inspect结果、大小），缓存未命中时读取持久化存储"""
+    key = f"digest:{kind}:{name}@{digest}"
+    value = cache.get(key)
+    if value is None and metadata_store is not None:
+        value = metadata_store.get_digest(key)
+        if value is not None:
+            cache.set(key, value, timeout=0)
+    return value
+
+def set_digest_entry(kind, name, digest, value):
+    """写入按内容digest缓存的数据，digest对应的内容不可变，因此永不过期"""
+    key = f"digest:{kind}:{name}@{digest}"
+    cache.set(key, value, timeout=0)
+    if metadata_store is not None:
+        metadata_store.set_digest(key, value)
+
+def get_tag_digest(key):
+    """读取标签映射的digest，缓存未命中时使用持久化存储中仍在TAG_CACHE_TIMEOUT内的映射"""
+    digest = cache.get(key)
+    if digest is None and metadata_store is not None:
+        entry = metadata_store.get_tag(key)
+        if entry is not None:
+            remaining = TAG_CACHE_TIMEOUT - (time.time() - entry[1])
+            if remaining > 0:
+                digest = entry[0]
+                cache.set(key, digest, timeout=max(1, int(remaining)))
+    return digest
+
+def set_tag_digest(key, digest):
+    """写入标签映射，缓存TAG_CACHE_TIMEOUT秒，持久化存储中记录解析时间"""
+    cache.set(key, digest, timeout=TAG_CACHE_TIMEOUT)
+    if metadata_store is not None:
+        metadata_store.set_tag(key, digest)
+
+def resolve_tag_digest(registry, repository, tag, auth, proxy):
+    """解析标签当前指向的digest，映射缓存TAG_CACHE_TIMEOUT秒，过期后用HEAD请求重新验证
+
+    映射按凭证范围缓存，解析成功同时记录该凭证有权访问仓库（见ensure_repository_access）。
+    """
+    key = tag_cache_key(registry, repository, tag, auth_scope(auth), proxy)
+    digest = get_tag_digest(key)
+    if digest:
+        logger.debug("标签digest缓存命中: %s/%s:%s -> %s", registry, repository, tag, digest)
+        return digest
+    
+    digest = registry_client.head_manifest(registry, repository, tag, auth, proxy)
+    if not digest:
+        # 部分Registry的HEAD响应不带Docker-Content-Digest，退回GET并顺便缓存manifest
+        manifest, digest, media_type = registry_client.get_manifest(registry, repository, tag, auth, proxy)
+        set_digest_entry('manifest', f"{registry}/{repository}", digest, {'manifest': manifest, 'media_type': media_type})
+    
+    set_tag_digest(key, digest)
+    grant_repository_access(registry, repository, auth_scope(auth), proxy)
+    # 标签可以访问，该凭证此前对这个标签或标签列表的负缓存已过时
+    clear_negative_entries(registry, repository, {tag, '*'}, auth_scope(auth), proxy)
+    cache_key_index.add(f"{registry}/{repository}", tag, key)
+    logger.debug("标签 %s/%s:%s 指向 %s", registry, repository, tag, digest)
+    return digest
+
+def get_cached_image_data(image, username=None, password=None, proxy=None, platform=None):
+    """只从缓存读取镜像数据（凭证的标签映射或访问记录和digest缓存均命中时），不访问Registry，未命中返回None"""
+    if IMAGE_BACKEND != 'registry':
         return None
+    registry, repository, reference = split_image_reference(image)
+    scope = credential_scope(username or os.environ.get('IMAGE_USERNAME', ''),
+                             password or os.environ.get('IMAGE_PASSWORD', ''))
+    proxy = proxy or os.environ.get('HTTPS_PROXY', '')
+    if is_digest(reference):
+        if not has_repository_access(registry, repository, scope, proxy):
+            return None
+        digest = reference
+    else:
+        digest = get_tag_digest(tag_cache_key(registry, repository, reference, scope, proxy))
+        if not digest:
+            return None
+    return get_digest_entry('inspect', f"{registry}/{repository}", f"{digest}|{platform or DEFAULT_PLATFORM}")
+
+def get_manifest_by_digest(registry, repository, digest, auth, proxy):
+    """按digest获取manifest，优先读取digest缓存，返回(manifest, mediaType)"""
+    name = f"{registry}/{repository}"
+    entry = get_digest_entry('manifest', name, digest)
+    if entry is None:
+        manifest, _, media_type = registry_client.get_manifest(registry, repository, digest, auth, proxy)
+        entry = {'manifest': manifest, 'media_type': media_type}
+        set_digest_entry('manifest', name, digest, entry)
+    return entry['manifest'], entry['media_type']
+
+def get_config_by_digest(registry, repository, digest, auth, proxy):
+    """按digest获取镜像config，优先读取digest缓存"""
+    name = f"{registry}/{repository}"
+    config = get_digest_entry('config', name, digest)
+    if config is None:
+        config = registry_client.get_blob_json(registry, repository, digest, auth, proxy)
+        set_digest_entry('config', name, digest, config)
+    return config
+
+def get_image_data_registry(image, username=None, password=None, proxy=None, platform=None):
+    """通过内置Registry v2客户端获取镜像数据
+
+    标签先解析为digest，之后manifest、config和组装好的结果都按digest缓存；
+    使用 image@sha256:... 引用且缓存命中时完全不访问Registry。
+    """
+    registry, repository, reference = split_image_reference(image)
+    separator = '@' if is_digest(reference) else ':'
+    platform = platform or DEFAULT_PLATFORM
+    
+    # 获取认证和代理信息（可选）
+    username = username or os.environ.get('IMAGE_USERNAME', '')
+    password = password or os.environ.get('IMAGE_PASSWORD', '')
+    proxy = proxy or os.environ.get('HTTPS_PROXY', '')
+    auth = {'username': username, 'password': password}
+    
+    logger.debug("通过Registry API获取镜像信息: %s/%s%s%s", registry, repository, separator, reference)
+    
+    try:
+        if separator == '@':
+            ensure_repository_access(registry, repository, reference, auth, proxy)
+            digest = reference
+        else:
+            digest = resolve_tag_digest(registry, repository, reference, auth, proxy)
+        
+        # 多架构镜像不同平台的结果不同，缓存键中包含平台
+        result = get_digest_entry('inspect', f"{registry}/{repository}", f"{digest}|{platform}")
+        if result is not None:
+            logger.debug("digest缓存命中: %s/%s@%s", registry, repository, digest)
+        else:
+            manifest, media_type = get_manifest_by_digest(registry, repository, digest, auth, proxy)
+            
+            # 多架构镜像，选择指定平台的manifest
+            if media_type in MANIFEST_LIST_TYPES:
+                entry = select_platform_manifest(manifest, platform)
+                if not entry:
+                    return {
+                        'status': 'error',
+                        'code': 404,
+                        'message': f'镜像不包含平台 {platform}: {image}'
+                    }
+                manifest, media_type = get_manifest_by_digest(registry, repository, entry['digest'], auth, proxy)
+            
+            config = get_config_by_digest(registry, repository, manifest['config']['digest'], auth, proxy)
+            result = build_inspect_result(parse_image_reference(image).name, digest, manifest, config)
+            set_digest_entry('inspect', f"{registry}/{repository}", f"{digest}|{platform}", result)
+    except RegistryError as e:
+        logger.error("Registry请求失败: %s", e)
+        if e.status_code in ACCESS_ERROR_CODES:
+            return {
+                'status': 'error',
+                'code': e.status_code,
+                'message': f'权限不足或镜像不存在: {image}',
+                'error': str(e),
+                'url': e.url
+            }
+        return {
+            'status': 'error',
+            'code': 500,
+            'message': f'获取镜像信息失败: {image}',
+            'error': str(e),
+            'url': e.url
+        }
+    except (requests.RequestException, ValueError, KeyError) as e:
+        logger.error("获取镜像信息失败: %s, %s", image, e)
+        return {
+            'status': 'error',
+            'code': 500,
+            'message': f'获取镜像信息失败: {image}',
+            'error': str(e)
+        }
+    
+    logger.debug("成功获取镜像信息: %s", image)
+    if 'ExposedPorts' in result:
+        logger.debug("成功获取镜像暴露端口: %s", result['ExposedPorts'])
+    
+    return {
+        'status': 'success',
+        'result': result
+    }
 
 def get_image_tags(image, username=None, password=None, proxy=None):
-    """获取镜像的所有标签"""
+    """获取镜像的所有标签，根据IMAGE_BACKEND选择获取方式，并发的相同请求只获取一次，仓库不存在或无权访问的结果短时缓存"""
+    registry, repository, _ = split_image_reference(image)
+    scope = credential_scope(username or os.environ.get('IMAGE_USERNAME', ''),
+                             password or os.environ.get('IMAGE_PASSWORD', ''))
+    proxy_key = proxy or os.environ.get('HTTPS_PROXY', '')
+    key = f"tags:{registry}/{repository}|{scope}|{proxy_key}"
+    if IMAGE_BACKEND == 'skopeo':
+        fetch = get_image_tags_skopeo
+    else:
+        fetch = get_image_tags_registry
+    data = negative_cached('tags', key, lambda: singleflight(
+        key, lambda: track_fetch(registry, lambda: fetch(image, username, password, proxy))),
+        f"{registry}/{repository}", '*')
+    if data.get('status') == 'success':
+        # 列出的标签都可以访问，该凭证此前对这些标签的负缓存已过时
+        clear_negative_entries(registry, repository, set(data['tags']), scope, proxy_key)
+    return data
+
+def get_image_tags_skopeo(image, username=None, password=None, proxy=None):
+    """通过skopeo命令获取镜像的所有标签"""
     try:
-        # 确保镜像名不包含标签
-        if ':' in image:
-            image = image.split(':')[0]
+        # 只使用仓库名，不包含标签和digest
+        image = parse_image_reference(image).name
         
-        logger.info(f"开始获取镜像 {image} 的所有标签")
+        logger.debug("开始获取镜像 %s 的所有标签", image)
         
         # 获取认证信息（可选）
         username = username or os.environ.get('IMAGE_USERNAME', '')
         password = password or os.environ.get('IMAGE_PASSWORD', '')
-        creds = []
+        creds = skopeo_auth_args(image, username, password, proxy or os.environ.get('HTTPS_PROXY', ''))
         if username and password:
-            creds = ['--creds', f'{username}:{password}']
-            logger.info(f"使用认证信息: 用户名={username}")
+            logger.debug("使用认证信息: 用户名=%s", username)
         
         # 获取代理信息（可选）
         proxy = proxy or os.environ.get('HTTPS_PROXY', '')
@@ -314,40 +1773,35 @@ def get_image_tags(image, username=None, password=None, proxy=None):
         if proxy:
             env['HTTPS_PROXY'] = proxy
             env['HTTP_PROXY'] = proxy
-            logger.info(f"使用代理: {proxy}")
+            logger.debug("使用代理: %s", proxy)
         
         # 调用skopeo获取标签列表
         cmd = ['skopeo', 'list-tags']
         cmd.extend(creds)
         cmd.append(f'docker://{image}')
         
-        logger.info(f"执行命令: {' '.join(cmd)}")
+        logger.debug("执行命令: %s", ' '.join(cmd))
         
-        process = subprocess.run(
-            cmd,
-            env=env,
-            capture_output=True,
-            text=True
-        )
+        process = run_skopeo('skopeo_list_tags', cmd, env=env, text=True)
         
         if process.returncode != 0:
             # 详细记录错误信息
-            logger.error(f"获取标签列表失败，返回码: {process.returncode}")
-            logger.error(f"错误输出: {process.stderr}")
+            logger.error("获取标签列表失败，返回码: %s", process.returncode)
+            logger.error("错误输出: %s", process.stderr)
             
             # 检查常见错误
-            err = process.stderr.lower()
-            if any(msg in err for msg in ['unauthorized', 'forbidden', 'not found']):
-                logger.error(f"权限不足或镜像不存在: {image}")
+            status_code = skopeo_error_status(process.stderr)
+            if status_code in ACCESS_ERROR_CODES:
+                logger.error("权限不足或镜像不存在: %s", image)
                 return {
                     'status': 'error',
-                    'code': 404,
+                    'code': status_code,
                     'message': f'权限不足或镜像不存在: {image}',
                     'error': process.stderr,
                     'command': ' '.join(cmd)
                 }
             else:
-                logger.error(f"获取标签列表失败: {image}")
+                logger.error("获取标签列表失败: %s", image)
                 return {
                     'status': 'error',
                     'code': 500,
@@ -359,7 +1813,7 @@ def get_image_tags(image, username=None, password=None, proxy=None):
         # 解析JSON结果
         result = json.loads(process.stdout)
         tags = result.get('Tags', [])
-        logger.info(f"成功获取镜像 {image} 的标签，共 {len(tags)} 个")
+        logger.debug("成功获取镜像 %s 的标签，共 %s 个", image, len(tags))
         
         return {
             'status': 'success',
@@ -367,10 +1821,20 @@ def get_image_tags(image, username=None, password=None, proxy=None):
             'tag_count': len(tags),
             'tags': tags
         }
+    except CommandCancelled:
+        raise
+    except CommandError as e:
+        logger.error("skopeo命令未完成: %s", e)
+        return {
+            'status': 'error',
+            'code': e.status_code,
+            'message': f'获取标签列表失败: {image}',
+            'error': str(e)
+        }
     except Exception as e:
         error_traceback = traceback.format_exc()
-        logger.error(f"处理异常: {str(e)}")
-        logger.error(f"详细堆栈: {error_traceback}")
+        logger.error("处理异常: %s", e)
+        logger.error("详细堆栈: %s", error_traceback)
         
         return {
             'status': 'error',
@@ -379,6 +1843,219 @@ def get_image_tags(image, username=None, password=None, proxy=None):
             'traceback': error_traceback
         }
 
+def get_image_tags_registry(image, username=None, password=None, proxy=None):
+    """通过内置Registry v2客户端获取镜像的所有标签"""
+    try:
+        registry, repository, _ = split_image_reference(image)
+        logger.debug("开始获取镜像 %s 的所有标签", image)
+        
+        # 获取认证和代理信息（可选）
+        username = username or os.environ.get('IMAGE_USERNAME', '')
+        password = password or os.environ.get('IMAGE_PASSWORD', '')
+        proxy = proxy or os.environ.get('HTTPS_PROXY', '')
+        auth = {'username': username, 'password': password}
+        
+        tags = registry_client.list_tags(registry, repository, auth, proxy)
+        logger.debug("成功获取镜像 %s 的标签，共 %s 个", image, len(tags))
+        
+        return {
+            'status': 'success',
+            'image': image,
+            'tag_count': len(tags),
+            'tags': tags
+        }
+    except RegistryError as e:
+        logger.error("获取标签列表失败: %s", e)
+        return {
+            'status': 'error',
+            'code': e.status_code if e.status_code in ACCESS_ERROR_CODES else 500,
+            'message': f'权限不足或镜像不存在: {image}' if e.status_code in ACCESS_ERROR_CODES else f'获取标签列表失败: {image}',
+            'error': str(e),
+            'url': e.url
+        }
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        logger.error("处理异常: %s", e)
+        logger.error("详细堆栈: %s", error_traceback)
+        
+        return {
+            'status': 'error',
+            'code': 500,
+            'message': f'获取标签列表异常: {str(e)}',
+            'traceback': error_traceback
+        }
+
+# 版本号格式的标签，例如 1.21、v3.12.1、3.12.1-slim
+SEMVER_TAG = re.compile(r'^v?(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:[-+](.+))?$')
+# 版本前缀约束，例如 3、3.12、3.12.x
+SEMVER_PREFIX = re.compile(r'^v?\d+(?:\.\d+){0,2}(?:\.[x*])?$')
+# 版本比较约束，例如 >=3.10、<3.12
+SEMVER_COMPARATOR = re.compile(r'^(>=|<=|>|<|==|=)v?(\d+)(?:\.(\d+))?(?:\.(\d+))?$')
+SEMVER_OPERATORS = {'>=': operator.ge, '<=': operator.le, '>': operator.gt, '<': operator.lt,
+                    '==': operator.eq, '=': operator.eq}
+
+def semver_key(tag):
+    """标签的版本排序键 (major, minor, patch, 是否无后缀, 后缀)，不是版本号格式时返回None
+
+    缺少的版本段记为-1，浮动标签3.12排在3.12.0之前；同一版本带后缀的标签（如3.12.1-slim）排在无后缀的之前。
+    """
+    match = SEMVER_TAG.match(tag)
+    if not match:
+        return None
+    major, minor, patch, suffix = match.groups()
+    return (int(major), int(minor) if minor else -1, int(patch) if patch else -1, 0 if suffix else 1, suffix or '')
+
+def build_tag_index(tags, full_fetched):
+    """建立标签索引：按字典序排序的全部标签，以及按版本排序的版本号标签"""
+    tags = sorted(set(tags))
+    versions = sorted((key, tag) for key, tag in ((semver_key(tag), tag) for tag in tags) if key is not None)
+    return {
+        'status': 'success',
+        'tags': tags,
+        'semver_keys': [key for key, _ in versions],
+        'semver_tags': [tag for _, tag in versions],
+        'fetched': time.time(),
+        'full_fetched': full_fetched,
+    }
+
+def get_tag_index(image, username=None, password=None, proxy=None):
+    """返回仓库的标签索引和缓存状态: (索引, 'HIT'/'MISS'/'STALE')，获取失败时返回(错误字典, 'MISS')
+
+    索引缓存后TAG_INDEX_REFRESH秒内直接使用；之后registry后端通过tags/list的last参数只获取
+    新增的标签并合并，每TAG_INDEX_FULL_REFRESH秒完整获取一次以移除已删除的标签。
+    刷新需要进入当前路由的慢速通道，过载时返回旧索引，没有旧索引时抛出Overloaded。
+    """
+    registry, repository, _ = split_image_reference(image)
+    scope = credential_scope(username or os.environ.get('IMAGE_USERNAME', ''),
+                             password or os.environ.get('IMAGE_PASSWORD', ''))
+    key = f"tagindex:{registry}/{repository}|{scope}|{proxy or os.environ.get('HTTPS_PROXY', '')}"
+    index = cache.get(key)
+    if index is not None and time.time() - index['fetched'] < TAG_INDEX_REFRESH:
+        return index, 'HIT'
+    
+    def refresh():
+        now = time.time()
+        if (index is not None and index['tags'] and IMAGE_BACKEND == 'registry'
+                and now - index['full_fetched'] < TAG_INDEX_FULL_REFRESH):
+            auth = {
+                'username': username or os.environ.get('IMAGE_USERNAME', ''),
+                'password': password or os.environ.get('IMAGE_PASSWORD', ''),
+            }
+            try:
+                new_tags = registry_client.list_tags(registry, repository, auth, proxy or os.environ.get('HTTPS_PROXY', ''),
+                                                     last=index['tags'][-1])
+                logger.info("增量刷新标签索引 %s/%s: 新增 %s 个标签", registry, repository, len(new_tags))
+                refreshed = build_tag_index(index['tags'] + new_tags, index['full_fetched'])
+                cache.set(key, refreshed)
+                cache_key_index.add(f"{registry}/{repository}", '*', key)
+                clear_negative_entries(registry, repository, set(new_tags) | {'*'}, scope,
+                                       proxy or os.environ.get('HTTPS_PROXY', ''))
+                return refreshed
+            except RegistryError as e:
+                logger.warning("增量刷新标签索引失败，完整获取: %s", e)
+        
+        data = get_image_tags(image, username, password, proxy)
+        if data.get('status') == 'error':
+            return data
+        refreshed = build_tag_index(data['tags'], now)
+        cache.set(key, refreshed)
+        cache_key_index.add(f"{registry}/{repository}", '*', key)
+        logger.info("建立标签索引 %s/%s: 共 %s 个标签", registry, repository, len(refreshed['tags']))
+        return refreshed
+    
+    try:
+        return singleflight(key, functools.partial(admitted, request.endpoint, refresh)), 'MISS'
+    except Overloaded as e:
+        if index is None:
+            raise
+        logger.warning("%s，返回旧的标签索引 %s/%s", e, registry, repository)
+        ADMISSION_SHED.labels(route=e.route, outcome='stale').inc()
+        return index, 'STALE'
+
+def semver_filter(index, constraint):
+    """按版本约束筛选版本号标签，按版本升序返回；前缀约束（3.12、3.12.x）通过二分查找定位"""
+    keys, tags = index['semver_keys'], index['semver_tags']
+    constraint = constraint.replace(' ', '')
+    if SEMVER_PREFIX.match(constraint):
+        parts = tuple(int(part) for part in constraint.lstrip('v').split('.') if part not in ('x', '*'))
+        upper = parts[:-1] + (parts[-1] + 1,)
+        return tags[bisect_left(keys, parts):bisect_left(keys, upper)]
+    
+    checks = []
+    for part in constraint.split(','):
+        match = SEMVER_COMPARATOR.match(part)
+        if not match:
+            raise ValueError(f"无法解析的版本约束: {constraint}，示例: 3.12、3.12.x、>=3.10,<3.12")
+        checks.append((SEMVER_OPERATORS[match.group(1)], tuple(int(n or 0) for n in match.groups()[1:])))
+    # 比较时缺少的版本段视为0
+    return [tag for key, tag in zip(keys, tags)
+            if all(op(tuple(max(n, 0) for n in key[:3]), version) for op, version in checks)]
+
+def query_tag_index(index, prefix=None, regex=None, semver=None, sort='lex', order='asc'):
+    """按前缀、版本约束和正则表达式筛选标签并排序，约束或正则无效时抛出ValueError
+
+    sort为lex（字典序）或semver（版本号顺序，非版本号标签排在最前）；指定semver约束时总是按版本排序。
+    """
+    if semver:
+        tags = semver_filter(index, semver)
+        if prefix:
+            tags = [tag for tag in tags if tag.startswith(prefix)]
+    else:
+        tags = index['tags']
+        if prefix:
+            tags = tags[bisect_left(tags, prefix):bisect_left(tags, prefix + chr(0x10FFFF))]
+        if sort == 'semver':
+            matched = set(tags)
+            tags = ([tag for tag in tags if semver_key(tag) is None]
+                    + [tag for tag in index['semver_tags'] if tag in matched])
+    
+    if regex:
+        try:
+            pattern = re.compile(regex)
+        except re.error as e:
+            raise ValueError(f"无效的正则表达式: {str(e)}")
+        tags = [tag for tag in tags if pattern.search(tag)]
+    
+    if order == 'desc':
+        return tags[::-1]
+    return list(tags)
+
+def json_response(data, status=200):
+    """序列化为JSON响应，安装了orjson时使用orjson，与jsonify一样按键排序"""
+    if orjson is not None:
+        try:
+            body = orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            body = None
+        if body is not None:
+            return Response(body, status=status, mimetype='application/json')
+    body = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':')) + '\n'
+    return Response(body, status=status, mimetype='application/json')
+
+# /image-info 响应中可以通过fields参数选择的字段，默认返回除layers以外的全部字段
+IMAGE_INFO_FIELDS = (
+    'compressed_size', 'compressed_size_mb', 'exposed_ports',
+    'uncompressed_size', 'uncompressed_size_mb', 'uncompressed_size_method',
+    'uncompressed_size_error', 'uncompressed_size_exact',
+    'layers', 'raw_data',
+)
+
+def requested_fields():
+    """fields参数（逗号分隔）中的字段集合，未指定时返回None
+
+    字段名同时选择以它加下划线开头的字段，例如 compressed_size 包含 compressed_size_mb。
+    """
+    fields = request.args.get('fields', '')
+    if not fields:
+        return None
+    return frozenset(field.strip() for field in fields.split(',') if field.strip())
+
+def field_selected(fields, key):
+    """key是否被字段集合选中，fields为None表示默认字段"""
+    if fields is None:
+        return key != 'layers'
+    return any(key == field or key.startswith(field + '_') for field in fields)
+
 def make_cache_key():
     """生成缓存键的函数，考虑所有相关的请求参数"""
     # 基本参数
@@ -386,22 +2063,406 @@ def make_cache_key():
     username = request.args.get('username', os.environ.get('IMAGE_USERNAME', ''))
     password = request.args.get('password', os.environ.get('IMAGE_PASSWORD', ''))
     proxy = request.args.get('proxy', os.environ.get('HTTPS_PROXY', ''))
+    try:
+        # nginx、nginx:latest、docker.io/library/nginx:latest 等等价写法共用同一个缓存条目
+        image = normalized_reference(image)
+    except ValueError:
+        # 无效引用由接口返回400，不会被缓存
+        pass
     
     # 组合生成唯一键
     key_parts = [
+        f"path:{request.path}",  # 不同接口的响应不同
         f"image:{image}",
-        f"username:{username}",  # 用户名会影响结果
-        # 不包含密码在缓存键中，因为相同用户名下，密码通常一致
+        f"platform:{request.args.get('platform', '')}",
+        f"size_method:{size_method_requested()}",  # 不同计算方法的未压缩大小不同
+        f"fields:{','.join(sorted(requested_fields() or ()))}",  # 字段投影不同响应不同
+        f"credentials:{credential_scope(username, password)}",  # 用户名和密码HMAC，不同凭证的结果互不共享
         f"proxy:{proxy}",  # 代理可能影响结果
     ]
     
     # 生成唯一缓存键
     return "|".join(key_parts)
 
+def request_manifest_digest():
+    """当前请求镜像的manifest digest，不访问Registry
+
+    digest引用直接返回；registry后端的标签引用读取未过期的标签映射，映射已过期或使用skopeo后端时返回None。
+    """
+    try:
+        registry, repository, reference = split_image_reference(request.args.get('image', ''))
+    except ValueError:
+        return None
+    if is_digest(reference):
+        return reference
+    if IMAGE_BACKEND != 'registry':
+        return None
+    scope = credential_scope(request.args.get('username') or os.environ.get('IMAGE_USERNAME', ''),
+                             request.args.get('password') or os.environ.get('IMAGE_PASSWORD', ''))
+    proxy = request.args.get('proxy') or os.environ.get('HTTPS_PROXY', '')
+    return get_tag_digest(tag_cache_key(registry, repository, reference, scope, proxy))
+
+def tag_digest_expired():
+    """接口缓存的过期检查：标签的digest映射过期后视为过期，后台重新生成响应
+
+    接口缓存可以设置较长的CACHE_TIMEOUT，但标签指向的digest每TAG_CACHE_TIMEOUT秒
+    重新验证一次，避免长时间返回旧的latest数据。按digest引用的镜像不受影响。
+    """
+    if IMAGE_BACKEND != 'registry' or not request.args.get('image'):
+        return False
+    return request_manifest_digest() is None
+
+refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+refreshing = set()
+refreshing_lock = threading.Lock()
+
+def response_etag(cache_key, digest):
+    """强ETag：由缓存键（镜像、平台、计算方法等响应变体）和manifest digest生成，镜像内容不变时ETag不变"""
+    return '"' + hashlib.sha256(f"{cache_key}|{digest}".encode()).hexdigest()[:32] + '"'
+
+def has_size_estimate(body):
+    """响应（包括各平台条目）中是否有非精确的未压缩大小
+
+    按学习到的压缩比估算的值在同一digest下也会变化，这类响应不能只按digest生成ETag。
+    """
+    try:
+        data = orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError:
+        return False
+    if not isinstance(data, dict):
+        return False
+    for entry in [data] + [p for p in data.get('platforms') or [] if isinstance(p, dict)]:
+        if any(key.startswith('uncompressed_size') for key in entry) and entry.get('uncompressed_size_exact') is not True:
+            return True
+    return False
+
+def encoded_etag(etag, encoding):
+    """压缩后的表示使用不同的强ETag"""
+    return f'{etag[:-1]}-{encoding}"'
+
+def matched_etag(etag):
+    """请求的If-None-Match包含etag或其压缩表示时（按弱比较）返回匹配的ETag，用于304响应；不匹配时返回None"""
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag:
+        return etag
+    opaque = etag.removeprefix('W/')[1:-1]
+    for tag in if_none_match.as_set(include_weak=True):
+        if tag == opaque:
+            return etag
+        base, _, encoding = tag.rpartition('-')
+        if encoding in ('gzip', 'br') and base == opaque:
+            return encoded_etag(etag, encoding)
+    return None
+
+def not_modified_response(etag):
+    resp = Response(status=304)
+    resp.headers['ETag'] = etag
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+def negotiate_encoding():
+    """按Accept-Encoding选择响应压缩方式，不支持压缩时返回None"""
+    offers = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offers)
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def cached_body_response(entry):
+    """由缓存条目构造响应，客户端支持时直接使用存储时已压缩的响应体"""
+    resp = Response(entry['body'], mimetype=entry['mimetype'])
+    etag = entry.get('etag')
+    encoding = negotiate_encoding() if entry.get('encoded') else None
+    if encoding in (entry.get('encoded') or {}):
+        resp.set_data(entry['encoded'][encoding])
+        resp.headers['Content-Encoding'] = encoding
+        if etag:
+            etag = encoded_etag(etag, encoding)
+    if etag:
+        resp.headers['ETag'] = etag
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+@app.before_request
+def start_request():
+    """记录请求ID（沿用客户端的X-Request-ID）和开始时间，用于日志关联和访问日志耗时"""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def log_request(resp):
+    """每个请求一条访问日志，包含状态码、耗时和缓存状态；成功且不慢的请求按LOG_SAMPLE_RATE采样"""
+    if 'request_start' not in g:
+        return resp
+    resp.headers['X-Request-ID'] = g.request_id
+    duration_ms = round((time.perf_counter() - g.request_start) * 1000, 2)
+    logger.info("%s %s %s %.2fms", request.method, request.path, resp.status_code, duration_ms, extra={
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': resp.status_code,
+        'duration_ms': duration_ms,
+        'cache': resp.headers.get('X-Cache-Status'),
+        'sample': resp.status_code < 400 and duration_ms < LOG_SLOW_REQUEST_MS,
+    })
+    return resp
+
+@app.after_request
+def compress_response(resp):
+    """较大的JSON和文本响应按Accept-Encoding压缩，缓存命中的响应已在存储时压缩"""
+    if (resp.status_code != 200 or resp.direct_passthrough or resp.is_streamed
+            or 'Content-Encoding' in resp.headers
+            or not (resp.mimetype == 'application/json' or resp.mimetype.startswith('text/'))):
+        return resp
+    body = resp.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return resp
+    resp.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return resp
+    resp.set_data(compress_body(body, encoding))
+    resp.headers['Content-Encoding'] = encoding
+    if resp.headers.get('ETag'):
+        resp.headers['ETag'] = encoded_etag(resp.headers['ETag'], encoding)
+    return resp
+
+def store_response(cache_key, resp):
+    """缓存成功的响应体，记录生成时间用于判断软过期和计算Age，返回缓存条目，不缓存时返回None
+
+    条目比CACHE_TIMEOUT多保留CACHE_STALE_GRACE秒，硬过期后只作为过载降级数据使用；CACHE_TIMEOUT为0时永久保留。
+    条目中保存镜像的manifest digest和ETag（digest未知时按响应体生成），较大的响应体同时保存压缩后的版本。
+    包含估算的未压缩大小时使用按响应体生成的弱ETag，估算值变化后客户端不会收到304。
+    """
+    if resp.status_code != 200 or resp.is_streamed:
+        return None
+    body = resp.get_data()
+    digest = request_manifest_digest()
+    if has_size_estimate(body):
+        etag = 'W/' + response_etag(cache_key, hashlib.sha256(body).hexdigest())
+    else:
+        etag = response_etag(cache_key, digest or hashlib.sha256(body).hexdigest())
+    entry = {
+        'body': body,
+        'mimetype': resp.mimetype,
+        'created': time.time(),
+        'digest': digest,
+        'etag': etag,
+    }
+    if len(body) >= COMPRESS_MIN_SIZE:
+        encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        entry['encoded'] = {encoding: compress_body(body, encoding) for encoding in encodings}
+    timeout = cache_config["CACHE_DEFAULT_TIMEOUT"]
+    cache.set(cache_key, entry, timeout=timeout + CACHE_STALE_GRACE if timeout else 0)
+    registry, repository, reference = split_image_reference(request.args.get('image', ''))
+    cache_key_index.add(f"{registry}/{repository}", reference_marker(reference), cache_key)
+    return entry
+
+def add_cache_headers(resp, status, age, ttl=None):
+    """添加缓存相关响应头，Age和X-Cache-TTL按条目实际生成时间计算"""
+    resp.headers['X-Cache-Status'] = status
+    resp.headers['Age'] = str(int(age))
+    resp.headers['X-Cache-TTL'] = str(max(0, int((CACHE_SOFT_TIMEOUT if ttl is None else ttl) - age)))
+    resp.headers['X-Cache-Type'] = cache_config["CACHE_TYPE"]
+    return resp
+
+def schedule_refresh(cache_key, view):
+    """在后台线程池中重新生成响应并写回缓存，同一缓存键同时只刷新一次"""
+    with refreshing_lock:
+        if cache_key in refreshing:
+            return
+        refreshing.add(cache_key)
+    path = request.path
+    args = request.args.to_dict(flat=False)
+    
+    def refresh():
+        try:
+            with app.test_request_context(path, query_string=args):
+                resp = app.make_response(view())
+                store_response(cache_key, resp)
+                logger.info("后台刷新缓存完成: %s, 状态码: %s", cache_key, resp.status_code)
+        except Exception as e:
+            logger.error("后台刷新缓存失败: %s, %s", cache_key, e)
+        finally:
+            with refreshing_lock:
+                refreshing.discard(cache_key)
+    
+    refresh_executor.submit(refresh)
+
+class Overloaded(Exception):
+    """慢速通道排队已满或排队超时"""
+    def __init__(self, route, reason):
+        super().__init__(f"慢速通道过载: {route} ({reason})")
+        self.route = route
+        self.reason = reason
+
+class AdmissionLane:
+    """慢速通道：限制同一路由同时访问Registry的请求数
+    
+    缓存命中的请求不经过慢速通道；未命中的请求先获取槽位，槽位已满时在有界队列中等待，
+    队列已满或等待超过SLOW_LANE_WAIT秒时抛出Overloaded，由调用方返回旧数据或503。
+    """
+    
+    def __init__(self, route, concurrency, queue_depth, wait_timeout):
+        self.route = route
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+        self.queue_depth = queue_depth
+        self.wait_timeout = wait_timeout
+        self.lock = threading.Lock()
+        self.waiting = 0
+    
+    def __enter__(self):
+        if self.slots is None or self.slots.acquire(blocking=False):
+            return self
+        with self.lock:
+            if self.waiting >= self.queue_depth:
+                raise Overloaded(self.route, 'queue_full')
+            self.waiting += 1
+        ADMISSION_QUEUE.labels(route=self.route).inc()
+        start = time.monotonic()
+        try:
+            acquired = self.slots.acquire(timeout=self.wait_timeout)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+            ADMISSION_QUEUE.labels(route=self.route).dec()
+            ADMISSION_WAIT.labels(route=self.route).observe(time.monotonic() - start)
+        if not acquired:
+            raise Overloaded(self.route, 'wait_timeout')
+        return self
+    
+    def __exit__(self, *exc_info):
+        if self.slots is not None:
+            self.slots.release()
+        return False
+
+admission_lanes_lock = threading.Lock()
+admission_lanes = {}
+
+def admission_lane(route):
+    """返回路由的慢速通道，并发数和排队数可通过SLOW_LANE_LIMITS按路由覆盖"""
+    with admission_lanes_lock:
+        lane = admission_lanes.get(route)
+        if lane is None:
+            concurrency, queue_depth = SLOW_LANE_LIMITS.get(route, (SLOW_LANE_CONCURRENCY, SLOW_LANE_QUEUE))
+            lane = admission_lanes[route] = AdmissionLane(route, concurrency, queue_depth, SLOW_LANE_WAIT)
+        return lane
+
+def admitted(route, fn):
+    """在路由的慢速通道中执行fn
+
+    作为singleflight的fn使用，只有领头请求占用槽位，等待合并结果的相同请求不会因排队而被拒绝。
+    """
+    with admission_lane(route):
+        return fn()
+
+def overloaded_response(e):
+    """慢速通道过载且没有可用旧数据时返回503"""
+    logger.warning("%s，拒绝请求", e)
+    ADMISSION_SHED.labels(route=e.route, outcome='rejected').inc()
+    resp = jsonify({
+        'status': 'error',
+        'message': '服务繁忙，请稍后重试'
+    })
+    resp.status_code = 503
+    resp.headers['Retry-After'] = str(RETRY_AFTER)
+    return resp
+
+def cached_response(stale_check=None):
+    """接口响应缓存装饰器，支持stale-while-revalidate
+
+    条目在CACHE_SOFT_TIMEOUT内直接返回(HIT)；超过软过期时间或stale_check返回True时
+    立即返回旧数据(STALE)并在后台刷新；超过CACHE_TIMEOUT后同步获取(MISS)，CACHE_TIMEOUT为0时条目不会硬过期。
+    相同缓存键的同步获取通过singleflight合并，只有领头请求进入路由的慢速通道，
+    过载时返回硬过期后保留的旧数据，没有则返回503。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def decorated_function(*args, **kwargs):
+            cache_key = make_cache_key()
+            digest = request_manifest_digest()
+            
+            # 条件请求: 已知digest时不读取缓存条目，直接按ETag判断是否变化。只有精确大小的响应使用digest生成的
+            # 强ETag；包含估算值的响应使用按响应体生成的弱ETag，由下面的缓存条目判断
+            matched = (digest is not None and request.if_none_match
+                       and matched_etag(response_etag(cache_key, digest)))
+            if matched:
+                CACHE_LOOKUPS.labels(route=request.endpoint, status='not_modified').inc()
+                return not_modified_response(matched)
+            
+            entry = cache.get(cache_key)
+            age = time.time() - entry['created'] if isinstance(entry, dict) else None
+            
+            if age is not None and (not cache_config["CACHE_DEFAULT_TIMEOUT"] or age < cache_config["CACHE_DEFAULT_TIMEOUT"]):
+                stale = (age >= CACHE_SOFT_TIMEOUT or (stale_check is not None and stale_check())
+                         or (digest is not None and entry.get('digest') not in (None, digest)))
+                logger.debug("缓存状态: %s, 缓存时长: %s秒", '过期，后台刷新' if stale else '命中', int(age))
+                if stale:
+                    schedule_refresh(cache_key, view)
+                CACHE_LOOKUPS.labels(route=request.endpoint, status='stale' if stale else 'hit').inc()
+                matched = entry.get('etag') and matched_etag(entry['etag'])
+                if matched:
+                    return add_cache_headers(not_modified_response(matched), 'STALE' if stale else 'HIT', age)
+                return add_cache_headers(cached_body_response(entry), 'STALE' if stale else 'HIT', age)
+            
+            def generate():
+                # 结果在合并的请求间共享: 可缓存的响应返回缓存条目，其他响应返回响应体和状态码
+                logger.debug("缓存状态: 未命中")
+                resp = app.make_response(view(*args, **kwargs))
+                stored = store_response(cache_key, resp)
+                if stored is not None:
+                    return {'entry': stored}
+                headers = [(name, value) for name, value in resp.headers
+                           if name not in ('Content-Type', 'Content-Length')]
+                return {'body': resp.get_data(), 'mimetype': resp.mimetype,
+                        'status_code': resp.status_code, 'headers': headers}
+            
+            try:
+                CACHE_LOOKUPS.labels(route=request.endpoint, status='miss').inc()
+                result = singleflight(f"response:{cache_key}", functools.partial(admitted, request.endpoint, generate))
+            except Overloaded as e:
+                if age is None:
+                    return overloaded_response(e)
+                logger.warning("%s，返回已硬过期的缓存数据，缓存时长: %s秒", e, int(age))
+                ADMISSION_SHED.labels(route=e.route, outcome='stale').inc()
+                CACHE_LOOKUPS.labels(route=request.endpoint, status='stale').inc()
+                return add_cache_headers(cached_body_response(entry), 'STALE', age)
+            
+            stored = result.get('entry')
+            if stored is None:
+                resp = Response(result['body'], status=result['status_code'], mimetype=result['mimetype'],
+                                headers=result['headers'])
+                return add_cache_headers(resp, 'MISS', 0)
+            matched = matched_etag(stored['etag'])
+            if matched:
+                return add_cache_headers(not_modified_response(matched), 'MISS', 0)
+            return add_cache_headers(cached_body_response(stored), 'MISS', 0)
+        return decorated_function
+    return decorator
+
+def platform_digest(result):
+    """镜像数据的digest缓存键：多架构镜像的Digest指向manifest list，因此键中包含平台"""
+    digest = result.get('Digest', '')
+    if not digest:
+        return ''
+    return f"{digest}|{result.get('Os', '')}/{result.get('Architecture', '')}/{result.get('Variant', '')}"
+
 def calculate_image_size(result):
     """计算镜像大小的辅助函数"""
-    # 打印原始数据，帮助调试
-    logger.debug(f"原始镜像数据: {json.dumps(result, indent=2)}")
+    # 镜像内容不可变，按digest缓存计算结果
+    name = result.get('Name', '')
+    digest = platform_digest(result)
+    if name and digest:
+        cached_size = get_digest_entry('size', name, digest)
+        if cached_size is not None:
+            logger.debug("大小缓存命中: %s@%s", name, digest)
+            return tuple(int(size) for size in cached_size)
+    
+    # 打印原始数据，帮助调试；只在启用DEBUG级别时序列化
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("原始镜像数据: %s", json.dumps(result, indent=2))
     
     # 初始化大小变量
     compressed_size = 0
@@ -410,10 +2471,10 @@ def calculate_image_size(result):
     # 方法1: 尝试从LayersData获取（部分skopeo版本）
     layers_data = result.get('LayersData', [])
     if layers_data:
-        logger.info("从LayersData字段计算大小")
+        logger.debug("从LayersData字段计算大小")
         for layer in layers_data:
             layer_size = layer.get('Size', 0)
-            logger.debug(f"图层大小: {layer_size}")
+            logger.debug("图层大小: %s", layer_size)
             compressed_size += layer_size
             
             # 计算未压缩大小
@@ -422,20 +2483,18 @@ def calculate_image_size(result):
     
     # 方法2: 如果没有LayersData，尝试从digest获取大小
     elif 'Layers' in result:
-        logger.info("从manifest和config计算大小")
-        # 使用同样的skopeo命令，但添加--raw参数获取原始manifest
+        logger.debug("从manifest和config计算大小")
+        # 使用同样的skopeo命令，但添加--raw参数获取原始manifest；Name不含标签，按digest定位同一镜像
         image = result.get('Name', '').replace('docker://', '')
+        if image and result.get('Digest'):
+            image = f"{image}@{result['Digest']}"
         if image:
             try:
                 # 获取manifest
                 cmd = ['skopeo', 'inspect', '--raw', f'docker://{image}']
-                logger.debug(f"执行命令获取原始manifest: {' '.join(cmd)}")
+                logger.debug("执行命令获取原始manifest: %s", ' '.join(cmd))
                 
-                manifest_process = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True
-                )
+                manifest_process = run_skopeo('skopeo_inspect_raw_size', cmd, text=True)
                 
                 if manifest_process.returncode == 0:
                     manifest = json.loads(manifest_process.stdout)
@@ -445,68 +2504,449 @@ def calculate_image_size(result):
                         for layer in manifest.get('layers', []):
                             if 'size' in layer:
                                 size = layer.get('size', 0)
-                                logger.debug(f"从manifest获取图层大小: {size}")
+                                logger.debug("从manifest获取图层大小: %s", size)
                                 compressed_size += size
                     
+                    # 多架构镜像的manifest list没有layers，需要按平台获取子manifest
+                    elif 'manifests' in manifest:
+                        logger.warning("原始manifest为多架构manifest list，无法直接计算大小")
+                    
                     # 如果是v1格式的manifest
                     elif 'fsLayers' in manifest and 'history' in manifest:
                         logger.debug("检测到v1格式的manifest")
                         # 这种格式需要进一步处理
                         # 由于v1格式不直接包含大小信息，可能需要其他方法
+            except CommandCancelled:
+                raise
             except Exception as e:
-                logger.error(f"获取manifest时出错: {str(e)}")
+                logger.error("获取manifest时出错: %s", e)
     
     # 方法3: 如果存在Size字段（某些skopeo版本）
     if compressed_size == 0 and 'Size' in result:
-        logger.info("从顶层Size字段获取大小")
+        logger.debug("从顶层Size字段获取大小")
         compressed_size = result.get('Size', 0)
     
-    # 如果未压缩大小仍为0，但我们有压缩大小，则估算未压缩大小
-    if uncompressed_size == 0 and compressed_size > 0:
-        logger.info("估算未压缩大小（使用1.7倍系数）")
-        uncompressed_size = compressed_size * 1.7
+    # 如果未压缩大小仍为0，但我们有压缩大小，则估算未压缩大小
+    if uncompressed_size == 0 and compressed_size > 0:
+        logger.debug("估算未压缩大小（使用%s倍系数）", FIXED_COMPRESSION_RATIO)
+        uncompressed_size = int(compressed_size * FIXED_COMPRESSION_RATIO)
+    
+    logger.debug("计算结果 - 压缩大小: %s 字节, 未压缩/估算大小: %s 字节", compressed_size, uncompressed_size)
+    if name and digest and compressed_size > 0:
+        set_digest_entry('size', name, digest, [compressed_size, uncompressed_size])
+    return compressed_size, uncompressed_size
+
+def get_image_layers(result, username=None, password=None, proxy=None):
+    """返回镜像的图层列表 [[digest, 压缩大小], ...]，按镜像digest缓存"""
+    name = result.get('Name', '')
+    digest = platform_digest(result)
+    if name and digest:
+        cached_layers = get_digest_entry('layers', name, digest)
+        if cached_layers is not None:
+            return cached_layers
+    
+    layers = [[layer['Digest'], layer.get('Size', 0)] for layer in result.get('LayersData') or [] if layer.get('Digest')]
+    if not layers and result.get('Layers'):
+        # 旧版skopeo没有LayersData，从原始manifest获取图层大小
+        manifest = {}
+        if name and result.get('Digest'):
+            manifest, _ = get_raw_manifest_skopeo(f"{name.replace('docker://', '')}@{result['Digest']}", username, password, proxy)
+        sizes = {layer.get('digest'): layer.get('size', 0) for layer in manifest.get('layers', [])}
+        if not sizes:
+            logger.warning("无法获取图层大小: %s@%s", name, result.get('Digest'))
+        layers = [[layer, sizes.get(layer, 0)] for layer in result['Layers']]
+    
+    if name and digest and layers:
+        set_digest_entry('layers', name, digest, layers)
+    return layers
+
+class ChunkReader:
+    """将字节块迭代器包装为只读文件对象，供gzip和zstd流式解压读取"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b''
+
+    def peek(self, size):
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        return self.buffer[:size]
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self.buffer + b''.join(self.chunks)
+            self.buffer = b''
+            return data
+        if not self.buffer:
+            self.buffer = next(self.chunks, b'')
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readable(self):
+        return True
+
+# 解压到截断的输入结尾时抛出的异常
+DECOMPRESS_ERRORS = (EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+def count_uncompressed_bytes(chunks, partial=False):
+    """流式解压图层并统计解压后的字节数，按文件头识别gzip、zstd或未压缩的tar，解压数据直接丢弃
+
+    partial为True时输入只是图层开头的一部分，解压到输入结尾时返回已统计的字节数。
+    """
+    reader = ChunkReader(chunks)
+    magic = reader.peek(4)
+    if magic[:2] == b'\x1f\x8b':
+        stream = gzip.GzipFile(fileobj=reader, mode='rb')
+    elif magic == b'\x28\xb5\x2f\xfd':
+        if zstandard is None:
+            raise RuntimeError("未安装zstandard，无法解压zstd图层")
+        stream = zstandard.ZstdDecompressor().stream_reader(reader, read_across_frames=True)
+    else:
+        stream = reader
+    # read1每次只解压已读入的数据，截断时已解压的部分不会随异常丢失
+    read = getattr(stream, 'read1', stream.read)
+    
+    total = 0
+    while True:
+        try:
+            data = read(LAYER_CHUNK_SIZE)
+        except DECOMPRESS_ERRORS:
+            if partial:
+                return total
+            raise
+        if not data:
+            return total
+        total += len(data)
+
+def layer_compression(media_type):
+    """图层的压缩方式: gzip、zstd 或 none（未压缩的tar）"""
+    if media_type.endswith('zstd'):
+        return 'zstd'
+    if media_type.endswith('tar'):
+        return 'none'
+    return 'gzip'
+
+ratio_stats_lock = threading.Lock()
+
+def get_ratio_stats(compression):
+    """已精确测量的图层的压缩比统计 [数量, 均值, 平方差和]，按压缩方式区分"""
+    key = f"ratio-stats:{compression}"
+    stats = cache.get(key)
+    if stats is None and metadata_store is not None:
+        stats = metadata_store.get_digest(key)
+    return stats
+
+def record_compression_ratio(compression, ratio):
+    """记录一个精确测量的压缩比（Welford算法增量更新均值和方差）"""
+    key = f"ratio-stats:{compression}"
+    with ratio_stats_lock:
+        count, mean, m2 = get_ratio_stats(compression) or [0, 0.0, 0.0]
+        count += 1
+        delta = ratio - mean
+        mean += delta / count
+        m2 += delta * (ratio - mean)
+        cache.set(key, [count, mean, m2], timeout=0)
+        if metadata_store is not None:
+            metadata_store.set_digest(key, [count, mean, m2])
+
+def learned_ratio(compression):
+    """从已精确测量的图层学习到的压缩比 (均值, 标准差)，样本不足3个时返回None"""
+    stats = get_ratio_stats(compression)
+    if not stats or stats[0] < 3:
+        return None
+    count, mean, m2 = stats
+    return mean, (m2 / (count - 1)) ** 0.5
+
+def record_layer_size(digest, uncompressed_size, compressed_size=0, media_type=''):
+    """永久记录图层的精确未压缩大小，并计入该压缩方式的压缩比统计"""
+    set_digest_entry('uncompressed', 'layer', digest, uncompressed_size)
+    if compressed_size:
+        record_compression_ratio(layer_compression(media_type), uncompressed_size / compressed_size)
+
+def get_layer_uncompressed_size(registry, repository, digest, auth, proxy=None, compressed_size=0, media_type=''):
+    """返回图层的精确未压缩大小，按图层digest永久记录，所有共享该图层的镜像共用；没有记录时流式下载并解压统计"""
+    size = get_digest_entry('uncompressed', 'layer', digest)
+    if size is not None:
+        return size
+    
+    def measure_layer():
+        with STAGE_LATENCY.labels(stage='layer_decompress').time():
+            resp = registry_client.open_blob(registry, repository, digest, auth, proxy)
+            try:
+                size = count_uncompressed_bytes(resp.iter_content(LAYER_CHUNK_SIZE))
+            finally:
+                resp.close()
+        record_layer_size(digest, size, compressed_size, media_type)
+        logger.info("图层 %s 未压缩大小: %s 字节", digest, size)
+        return size
+    
+    return singleflight(f"layer:{digest}", measure_layer)
+
+def sample_layer(registry, repository, digest, auth, proxy=None):
+    """通过Range请求下载图层开头SAMPLE_SIZE字节并解压，返回[解压字节数, 采样的压缩字节数]，按图层digest缓存"""
+    sample = get_digest_entry('sample', 'layer', digest)
+    if sample is not None:
+        return sample
+    
+    def fetch_sample():
+        consumed = [0]
+        
+        def limited(chunks):
+            # Registry不支持Range时返回完整内容，只读取前SAMPLE_SIZE字节
+            for chunk in chunks:
+                chunk = chunk[:SAMPLE_SIZE - consumed[0]]
+                consumed[0] += len(chunk)
+                yield chunk
+                if consumed[0] >= SAMPLE_SIZE:
+                    return
+        
+        with STAGE_LATENCY.labels(stage='layer_sample').time():
+            resp = registry_client.request('GET', registry, repository, f"/v2/{repository}/blobs/{digest}", auth, proxy,
+                                           headers={'Range': f'bytes=0-{SAMPLE_SIZE - 1}'}, stream=True)
+            try:
+                size = count_uncompressed_bytes(limited(resp.iter_content(LAYER_CHUNK_SIZE)), partial=True)
+            finally:
+                resp.close()
+        sample = [size, consumed[0]]
+        set_digest_entry('sample', 'layer', digest, sample)
+        return sample
+    
+    return singleflight(f"sample:{digest}", fetch_sample)
+
+def estimate_layer_size(layer, method, registry, repository, auth, proxy):
+    """估算单个图层的未压缩大小，返回(大小, 误差, 方法)
+
+    依次使用: 已记录的精确值 → 精确测量（method=exact）或采样估算（method=sample）
+    → 学习到的压缩比 → 固定压缩比FIXED_COMPRESSION_RATIO。
+    """
+    digest, compressed_size, media_type = layer
+    compression = layer_compression(media_type)
+    size = get_digest_entry('uncompressed', 'layer', digest)
+    if size is not None:
+        return size, 0, 'exact'
+    if compression == 'none' and compressed_size:
+        record_layer_size(digest, compressed_size)
+        return compressed_size, 0, 'exact'
+    if method == 'exact':
+        return get_layer_uncompressed_size(registry, repository, digest, auth, proxy, compressed_size, media_type), 0, 'exact'
+    
+    learned = learned_ratio(compression)
+    if method == 'sample' and compressed_size:
+        sampled, consumed = sample_layer(registry, repository, digest, auth, proxy)
+        if consumed >= compressed_size:
+            # 图层不超过采样大小，采样即为完整测量
+            record_layer_size(digest, sampled, compressed_size, media_type)
+            return sampled, 0, 'exact'
+        if sampled and consumed:
+            # 按采样部分的压缩比外推剩余部分，误差取学习到的压缩比相对标准差的2倍
+            relative_error = 2 * learned[1] / learned[0] if learned else SAMPLE_RATIO_ERROR
+            rest = (compressed_size - consumed) * sampled / consumed
+            return int(sampled + rest), int(rest * relative_error), 'sampled'
+    
+    if learned:
+        mean, std = learned
+        return int(compressed_size * mean), int(compressed_size * 2 * std), 'learned_ratio'
+    return int(compressed_size * FIXED_COMPRESSION_RATIO), int(compressed_size * FIXED_COMPRESSION_RATIO * FIXED_RATIO_ERROR), 'fixed_ratio'
+
+# 估算方法由准到粗的顺序，镜像的估算方法取所有图层中最粗的一个
+SIZE_METHODS = ['exact', 'sampled', 'learned_ratio', 'fixed_ratio']
+
+def estimate_uncompressed_size(result, username=None, password=None, proxy=None, method='auto'):
+    """按图层估算镜像的未压缩大小，返回(大小, 误差, 方法)，没有图层信息时返回None
+
+    method为auto时只使用已有数据，不访问Registry；为sample或exact时并发（EXACT_SIZE_WORKERS）
+    采样或完整测量没有记录的图层。误差为各图层误差之和。
+    """
+    media_types = {layer.get('Digest'): layer.get('MIMEType', '') for layer in result.get('LayersData') or []}
+    layers = [(digest, size, media_types.get(digest, '')) for digest, size in get_image_layers(result, username, password, proxy)]
+    name = result.get('Name', '').replace('docker://', '')
+    if not layers or not name:
+        return None
+    
+    registry, repository, _ = split_image_reference(name)
+    auth = {
+        'username': username or os.environ.get('IMAGE_USERNAME', ''),
+        'password': password or os.environ.get('IMAGE_PASSWORD', ''),
+    }
+    proxy = proxy or os.environ.get('HTTPS_PROXY', '')
+    
+    def estimate(layer):
+        return estimate_layer_size(layer, method, registry, repository, auth, proxy)
+    
+    if method in ('sample', 'exact') and len(layers) > 1:
+        with ThreadPoolExecutor(max_workers=min(EXACT_SIZE_WORKERS, len(layers))) as executor:
+            estimates = list(executor.map(estimate, layers))
+    else:
+        estimates = [estimate(layer) for layer in layers]
+    
+    return (sum(size for size, _, _ in estimates),
+            sum(error for _, error, _ in estimates),
+            max((m for _, _, m in estimates), key=SIZE_METHODS.index))
+
+def size_method_requested():
+    """当前请求的未压缩大小计算方法: size_method参数（auto/sample/exact），exact=1等同于exact，默认SIZE_METHOD
+
+    无效的值原样返回（也用于缓存键），由接口通过invalid_size_method_response返回400。
+    """
+    if request.args.get('exact', '').lower() in ('1', 'true', 'yes'):
+        return 'exact'
+    return request.args.get('size_method', '').lower() or SIZE_METHOD
+
+def invalid_size_method_response(method):
+    """size_method无效时返回400响应，否则返回None"""
+    if method in ('auto', 'sample', 'exact'):
+        return None
+    return jsonify({
+        'status': 'error',
+        'message': f'无效的size_method: {method}，可选值为 auto、sample、exact'
+    }), 400
+
+def apply_size_estimate(response, result, username=None, password=None, proxy=None, method='auto'):
+    """用按图层估算的未压缩大小替换响应中的固定系数估算值，并注明估算方法和误差
+
+    采样或精确测量失败时退回只使用已有数据的估算。
+    """
+    try:
+        estimate = estimate_uncompressed_size(result, username, password, proxy, method)
+    except Exception as e:
+        logger.warning("计算未压缩大小失败（%s），使用已有数据估算: %s", method, e)
+        estimate = estimate_uncompressed_size(result, username, password, proxy) if method != 'auto' else None
+    if estimate is None:
+        return response
+    size, error, used_method = estimate
+    response['uncompressed_size'] = size
+    response['uncompressed_size_mb'] = round(size / 1024 / 1024, 2)
+    response['uncompressed_size_method'] = used_method
+    response['uncompressed_size_error'] = error
+    response['uncompressed_size_exact'] = used_method == 'exact'
+    return response
+
+def format_platform(entry_platform):
+    """将manifest list中的platform字段格式化为 os/arch[/variant]"""
+    platform = f"{entry_platform.get('os', '')}/{entry_platform.get('architecture', '')}"
+    if entry_platform.get('variant'):
+        platform += f"/{entry_platform['variant']}"
+    return platform
+
+def get_raw_manifest_skopeo(image, username=None, password=None, proxy=None):
+    """通过skopeo inspect --raw获取原始manifest，返回(manifest, digest)"""
+    username = username or os.environ.get('IMAGE_USERNAME', '')
+    password = password or os.environ.get('IMAGE_PASSWORD', '')
+    proxy = proxy or os.environ.get('HTTPS_PROXY', '')
+    env = os.environ.copy()
+    if proxy:
+        env['HTTPS_PROXY'] = proxy
+        env['HTTP_PROXY'] = proxy
     
-    logger.info(f"计算结果 - 压缩大小: {compressed_size} 字节, 未压缩/估算大小: {uncompressed_size} 字节")
-    return compressed_size, uncompressed_size
+    cmd = ['skopeo', 'inspect', '--raw']
+    cmd.extend(skopeo_auth_args(image, username, password, proxy))
+    cmd.append(f'docker://{image}')
+    
+    process = run_skopeo('skopeo_inspect_raw', cmd, env=env)
+    if process.returncode != 0:
+        stderr = process.stderr.decode(errors='replace')
+        raise RegistryError(f"skopeo命令执行失败: {stderr}", skopeo_error_status(stderr))
+    return json.loads(process.stdout), 'sha256:' + hashlib.sha256(process.stdout).hexdigest()
 
-@app.route('/image-size')
-@require_api_key
-@cache.cached(timeout=None, make_cache_key=make_cache_key)
-def image_size():
-    """仅返回镜像压缩大小和预估实际大小的API端点"""
-    # 获取请求参数
-    image = request.args.get('image', '')
-    if not image:
-        return jsonify({
-            'status': 'error',
-            'message': '请提供镜像名称，例如：/image-size?image=nginx:latest'
-        }), 400
+def get_image_platforms(image, username=None, password=None, proxy=None, platform=None, size_method='auto'):
+    """获取多架构镜像每个平台的压缩和未压缩大小
+
+    检测到manifest list/OCI index时并发获取各平台的子manifest（复用连接池和digest缓存），
+    指定platform时只获取该平台。各平台的未压缩大小与顶层使用相同的size_method估算。
+    单架构镜像返回空列表，失败时抛出RegistryError。
+    """
+    registry, repository, reference = split_image_reference(image)
+    name = parse_image_reference(image).name
+    
+    if IMAGE_BACKEND == 'skopeo':
+        index, digest = get_raw_manifest_skopeo(image, username, password, proxy)
+        media_type = index.get('mediaType', '')
+        
+        def fetch_child(child_digest):
+            return get_raw_manifest_skopeo(f"{name}@{child_digest}", username, password, proxy)[0]
+    else:
+        proxy = proxy or os.environ.get('HTTPS_PROXY', '')
+        auth = {
+            'username': username or os.environ.get('IMAGE_USERNAME', ''),
+            'password': password or os.environ.get('IMAGE_PASSWORD', ''),
+        }
+        if is_digest(reference):
+            digest = reference
+        else:
+            digest = resolve_tag_digest(registry, repository, reference, auth, proxy)
+        index, media_type = get_manifest_by_digest(registry, repository, digest, auth, proxy)
+        
+        def fetch_child(child_digest):
+            return get_manifest_by_digest(registry, repository, child_digest, auth, proxy)[0]
+    
+    if media_type not in MANIFEST_LIST_TYPES and 'manifests' not in index:
+        return []
     
-    logger.info(f"开始处理镜像大小请求: {image}")
+    if platform:
+        entry = select_platform_manifest(index, platform)
+        entries = [entry] if entry else []
+    else:
+        # 跳过构建证明等非运行平台的条目（platform为unknown/unknown）
+        entries = [m for m in index.get('manifests', []) if m.get('platform', {}).get('os') != 'unknown']
     
-    # 生成缓存键用于日志
-    cache_key = make_cache_key()
-    # 检查是否已缓存，方法是尝试获取值并检查是否存在
-    cached_value = cache.get(cache_key)
-    cached = cached_value is not None
-    logger.info(f"缓存状态: {'命中' if cached else '未命中'}")
+    def platform_size(entry):
+        manifest = fetch_child(entry['digest'])
+        child = {
+            'Name': name,
+            'Digest': entry['digest'],
+            'LayersData': [
+                {'MIMEType': layer.get('mediaType', ''), 'Digest': layer.get('digest'), 'Size': layer.get('size', 0)}
+                for layer in manifest.get('layers', [])
+            ],
+        }
+        compressed_size, uncompressed_size = calculate_image_size(child)
+        platform_entry = {
+            'platform': format_platform(entry.get('platform', {})),
+            'digest': entry['digest'],
+            'compressed_size': compressed_size,
+            'compressed_size_mb': round(compressed_size / 1024 / 1024, 2),
+            'uncompressed_size': uncompressed_size,
+            'uncompressed_size_mb': round(uncompressed_size / 1024 / 1024, 2),
+        }
+        return apply_size_estimate(platform_entry, child, username, password, proxy, size_method)
     
+    if not entries:
+        return []
+    with ThreadPoolExecutor(max_workers=min(PLATFORM_WORKERS, len(entries))) as executor:
+        platforms = list(executor.map(platform_size, entries))
+    logger.debug("多架构镜像 %s 共 %s 个平台", image, len(platforms))
+    return platforms
+
+def add_platform_sizes(response, image, username=None, password=None, proxy=None, platform=None, size_method='auto'):
+    """多架构镜像时在响应中添加各平台大小，获取失败只记录日志，不影响主结果"""
+    try:
+        platforms = get_image_platforms(image, username, password, proxy, platform, size_method)
+    except (RegistryError, requests.RequestException, ValueError, KeyError) as e:
+        logger.warning("获取多架构平台信息失败: %s, %s", image, e)
+        return
+    if platforms:
+        response['platforms'] = platforms
+
+def get_image_size_result(image, username=None, password=None, proxy=None, platform=None, include_platforms=True,
+                          size_method='auto'):
+    """获取镜像压缩大小和预估实际大小，返回(响应字典, HTTP状态码)，供单个和批量查询共用
+
+    size_method为未压缩大小的计算方法，见estimate_uncompressed_size。
+    """
     try:
-        # 获取可选参数
-        username = request.args.get('username')
-        password = request.args.get('password')
-        proxy = request.args.get('proxy')
-        
         # 调用共用函数获取镜像数据
-        data = get_image_data(image, username, password, proxy)
+        data = get_image_data(image, username, password, proxy, platform)
         
         # 检查是否出错
         if data['status'] == 'error':
-            return jsonify({
+            return {
                 'status': 'error',
                 'message': data['message'],
                 'error': data.get('error')
-            }), data['code']
+            }, data['code']
         
         # 从结果中计算大小
         result = data['result']
@@ -515,7 +2955,7 @@ def image_size():
         # 计算人类可读格式
         compressed_mb = compressed_size / 1024 / 1024
         
-        logger.info(f"镜像 {image} 压缩大小: {compressed_mb:.2f}MB")
+        logger.debug("镜像 %s 压缩大小: %.2fMB", image, compressed_mb)
         
         response = {
             'status': 'success',
@@ -527,45 +2967,312 @@ def image_size():
         # 添加暴露端口信息到顶层响应中，方便用户访问
         if 'ExposedPorts' in result:
             response['exposed_ports'] = result['ExposedPorts']
-            logger.info(f"添加暴露端口信息到响应: {result['ExposedPorts']}")
+            logger.debug("添加暴露端口信息到响应: %s", result['ExposedPorts'])
         
-        # 如果有未压缩大小，添加到响应
+        # 如果有未压缩大小，添加到响应（有图层信息时由apply_size_estimate替换为按图层估算的值）
         if uncompressed_size > 0:
             uncompressed_mb = uncompressed_size / 1024 / 1024
             response['uncompressed_size'] = uncompressed_size
             response['uncompressed_size_mb'] = round(uncompressed_mb, 2)
-            logger.info(f"镜像 {image} 未压缩大小: {uncompressed_mb:.2f}MB")
-        else:
-            # 估算未压缩大小（乘以1.7，与原脚本一致）
-            estimated_uncompressed = compressed_size * 1.7
-            estimated_uncompressed_mb = estimated_uncompressed / 1024 / 1024
-            response['estimated_uncompressed_size'] = estimated_uncompressed
-            response['estimated_uncompressed_size_mb'] = round(estimated_uncompressed_mb, 2)
-            logger.info(f"镜像 {image} 估算未压缩大小: {estimated_uncompressed_mb:.2f}MB")
-        
-        # 添加缓存响应头
-        resp = jsonify(response)
-        # 正确的缓存状态检查
-        is_cached = cache.get(make_cache_key()) is not None
-        resp.headers['X-Cache-Status'] = 'HIT' if is_cached else 'MISS'
-        resp.headers['X-Cache-TTL'] = str(cache_config["CACHE_DEFAULT_TIMEOUT"])
-        resp.headers['X-Cache-Type'] = cache_config["CACHE_TYPE"]
-        return resp
+            logger.debug("镜像 %s 未压缩大小: %.2fMB", image, uncompressed_mb)
+        apply_size_estimate(response, result, username, password, proxy, size_method)
+        
+        # 多架构镜像，添加各平台大小
+        if platform:
+            response['platform'] = platform
+        if include_platforms:
+            add_platform_sizes(response, image, username, password, proxy, platform, size_method)
+        
+        return response, 200
         
     except Exception as e:
         # 捕获并记录所有异常，包括堆栈跟踪
         error_traceback = traceback.format_exc()
-        logger.error(f"处理异常: {str(e)}")
-        logger.error(f"详细堆栈: {error_traceback}")
+        logger.error("处理异常: %s", e)
+        logger.error("详细堆栈: %s", error_traceback)
         
-        return jsonify({
+        return {
             'status': 'error',
             'message': f'处理异常: {str(e)}'
-        }), 500
+        }, 500
+
+@app.route('/image-size')
+@require_api_key
+@cached_response(stale_check=tag_digest_expired)
+def image_size():
+    """仅返回镜像压缩大小和预估实际大小的API端点"""
+    # 获取请求参数
+    image = request.args.get('image', '')
+    if not image:
+        return jsonify({
+            'status': 'error',
+            'message': '请提供镜像名称，例如：/image-size?image=nginx:latest'
+        }), 400
+    
+    invalid = invalid_reference_response(image) or invalid_size_method_response(size_method_requested())
+    if invalid:
+        return invalid
+    
+    logger.debug("开始处理镜像大小请求: %s", image)
+    
+    # 获取可选参数
+    username = request.args.get('username')
+    password = request.args.get('password')
+    proxy = request.args.get('proxy')
+    platform = request.args.get('platform')
+    
+    response, code = get_image_size_result(image, username, password, proxy, platform, size_method=size_method_requested())
+    if code != 200:
+        return jsonify(response), code
+    
+    return json_response(response)
+
+@app.route('/image-size/batch', methods=['POST'])
+@require_api_key
+def image_size_batch():
+    """批量查询镜像大小
+
+    请求体为JSON: {"images": ["nginx:latest", ...], "username": ..., "password": ..., "proxy": ...,
+                  "platform": ..., "platforms": false, "stream": false}
+    相同镜像只查询一次，缓存命中的结果立即返回，未命中的按Registry限制并发获取。
+    stream=true（或?stream=1、Accept: application/x-ndjson）时以NDJSON逐条输出完成的结果。
+    """
+    body = request.get_json(silent=True)
+    if isinstance(body, list):
+        body = {'images': body}
+    if not isinstance(body, dict) or not isinstance(body.get('images'), list) or not body['images']:
+        return jsonify({
+            'status': 'error',
+            'message': '请在请求体中提供镜像列表，例如：{"images": ["nginx:latest", "redis:7"]}'
+        }), 400
+    
+    if len(body['images']) > BATCH_MAX_IMAGES:
+        return jsonify({
+            'status': 'error',
+            'message': f'单次最多查询 {BATCH_MAX_IMAGES} 个镜像，当前 {len(body["images"])} 个'
+        }), 400
+    # 无效的条目按位置返回单独的错误，不影响其他镜像
+    images, invalid_entries = partition_image_list(body['images'])
+    
+    # 获取可选参数，请求体优先于查询参数
+    username = body.get('username') or request.args.get('username')
+    password = body.get('password') or request.args.get('password')
+    proxy = body.get('proxy') or request.args.get('proxy')
+    platform = body.get('platform') or request.args.get('platform')
+    include_platforms = bool(body.get('platforms'))
+    size_method = 'exact' if body.get('exact') else body.get('size_method') or size_method_requested()
+    invalid = invalid_size_method_response(size_method.lower() if isinstance(size_method, str) else size_method)
+    if invalid:
+        return invalid
+    size_method = size_method.lower()
+    stream = (bool(body.get('stream')) or request.args.get('stream') in ('1', 'true')
+              or request.accept_mimetypes.best == 'application/x-ndjson')
+    
+    # 按规范化引用去重，保留首次出现的写法
+    unique_images = {}
+    for image in images:
+        unique_images.setdefault(normalized_reference(image), image)
+    unique_images = list(unique_images.values())
+    
+    hits = [image for image in unique_images if get_cached_image_data(image, username, password, proxy, platform) is not None]
+    misses = [image for image in unique_images if image not in hits]
+    logger.info("批量查询镜像大小: 共 %s 个，去重后 %s 个，缓存命中 %s 个",
+                len(images), len(unique_images), len(hits))
+    
+    def size_entry(image, cached):
+        response, code = get_image_size_result(image, username, password, proxy, platform, include_platforms, size_method)
+        response['image'] = image
+        response['cache'] = 'HIT' if cached else 'MISS'
+        if code != 200:
+            response['code'] = code
+        return response
+    
+    def fetch_entry(image):
+        registry, _, _ = split_image_reference(image)
+        with registry_semaphore(registry):
+            return size_entry(image, False)
+    
+    def iter_entries():
+        yield from invalid_entries
+        for image in hits:
+            yield size_entry(image, True)
+        if not misses:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(misses)))
+        cancelled = threading.Event()
+        try:
+            futures = {executor.submit(run_cancellable, cancelled, fetch_entry, image): image for image in misses}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    logger.error("批量查询异常: %s, %s", futures[future], e)
+                    yield {'status': 'error', 'image': futures[future], 'code': 500,
+                           'message': f'处理异常: {str(e)}', 'cache': 'MISS'}
+        finally:
+            # 客户端断开时取消尚未开始的查询，并终止正在执行的skopeo子进程
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    if stream:
+        return Response((json.dumps(entry, ensure_ascii=False) + '\n' for entry in iter_entries()),
+                        mimetype='application/x-ndjson')
+    
+    entries = {entry['image']: entry for entry in iter_entries() if 'index' not in entry}
+    results = [entries[image] for image in unique_images] + invalid_entries
+    succeeded = sum(1 for entry in results if entry['status'] == 'success')
+    return jsonify({
+        'status': 'success',
+        'count': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    })
+
+@app.route('/footprint', methods=['POST'])
+@require_api_key
+def footprint():
+    """多镜像占用分析：按图层digest去重，计算一组镜像实际需要的存储和拉取大小
+
+    请求体为JSON: {"images": ["app:1", "worker:1"], "present": ["python:3.11"], "username": ..., "password": ...,
+                  "proxy": ..., "platform": ...}
+    present为节点上已有的镜像，其图层不计入增量拉取大小。所有大小均为压缩大小（即拉取字节数）。
+    """
+    body = request.get_json(silent=True)
+    if isinstance(body, list):
+        body = {'images': body}
+    if not isinstance(body, dict) or not isinstance(body.get('images'), list) or not body['images']:
+        return jsonify({
+            'status': 'error',
+            'message': '请在请求体中提供镜像列表，例如：{"images": ["nginx:latest", "redis:7"], "present": ["debian:12"]}'
+        }), 400
+    if not isinstance(body.get('present', []), list):
+        return jsonify({
+            'status': 'error',
+            'message': 'present必须是镜像列表'
+        }), 400
+    
+    if len(body['images']) + len(body.get('present', [])) > BATCH_MAX_IMAGES:
+        return jsonify({
+            'status': 'error',
+            'message': f'单次最多分析 {BATCH_MAX_IMAGES} 个镜像，当前 {len(body["images"]) + len(body.get("present", []))} 个'
+        }), 400
+    # 无效的条目逐项记入errors，其余镜像照常分析
+    images, rejected = partition_image_list(body['images'], 'images')
+    present, rejected_present = partition_image_list(body.get('present', []), 'present')
+    rejected += rejected_present
+    if not images:
+        return jsonify({
+            'status': 'error',
+            'message': 'images中没有有效的镜像名称',
+            'errors': rejected
+        }), 400
+    
+    username = body.get('username') or request.args.get('username')
+    password = body.get('password') or request.args.get('password')
+    proxy = body.get('proxy') or request.args.get('proxy')
+    platform = body.get('platform') or request.args.get('platform')
+    
+    # 按规范化引用去重，同一镜像同时出现在两个列表中时视为已存在
+    present_images = {}
+    for image in present:
+        present_images.setdefault(normalized_reference(image), image)
+    target_images = {}
+    for image in images:
+        key = normalized_reference(image)
+        if key not in present_images:
+            target_images.setdefault(key, image)
+    target_images = list(target_images.values())
+    present_images = list(present_images.values())
+    
+    def fetch_layers(image):
+        registry, _, _ = split_image_reference(image)
+        with registry_semaphore(registry):
+            data = get_image_data(image, username, password, proxy, platform)
+            if data['status'] == 'error':
+                return data
+            return {'status': 'success', 'digest': data['result'].get('Digest'),
+                    'layers': get_image_layers(data['result'], username, password, proxy)}
+    
+    all_images = target_images + present_images
+    layers_by_image = {}
+    errors = list(rejected)
+    with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(all_images))) as executor:
+        futures = {executor.submit(fetch_layers, image): image for image in all_images}
+        for future in as_completed(futures):
+            image = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                logger.error("占用分析异常: %s, %s", image, e)
+                entry = {'status': 'error', 'code': 500, 'message': f'处理异常: {str(e)}'}
+            if entry['status'] == 'error':
+                errors.append({'image': image, 'code': entry.get('code', 500), 'message': entry.get('message')})
+            else:
+                layers_by_image[image] = entry
+    
+    # 图层索引: digest -> 大小和使用它的镜像
+    layer_index = {}
+    for image in all_images:
+        for digest, size in layers_by_image.get(image, {}).get('layers', []):
+            layer = layer_index.setdefault(digest, {'size': size, 'images': []})
+            if image not in layer['images']:
+                layer['images'].append(image)
+    
+    present_set = set(present_images)
+    present_layers = {digest for digest, layer in layer_index.items() if present_set.intersection(layer['images'])}
+    target_layers = {digest for image in target_images for digest, _ in layers_by_image.get(image, {}).get('layers', [])}
+    
+    image_results = []
+    total_size = 0
+    for image in target_images:
+        entry = layers_by_image.get(image)
+        if entry is None:
+            continue
+        digests = {digest for digest, _ in entry['layers']}
+        size = sum(layer_index[digest]['size'] for digest in digests)
+        exclusive_size = sum(layer_index[digest]['size'] for digest in digests if len(layer_index[digest]['images']) == 1)
+        total_size += size
+        image_results.append({
+            'image': image,
+            'digest': entry['digest'],
+            'layer_count': len(digests),
+            'compressed_size': size,
+            'exclusive_size': exclusive_size,
+            'incremental_size': sum(layer_index[digest]['size'] for digest in digests - present_layers),
+        })
+    
+    unique_size = sum(layer_index[digest]['size'] for digest in target_layers)
+    incremental_size = sum(layer_index[digest]['size'] for digest in target_layers - present_layers)
+    shared_layers = sorted(
+        ({'digest': digest, 'size': layer['size'], 'images': layer['images'], 'present': digest in present_layers}
+         for digest, layer in layer_index.items() if len(layer['images']) > 1),
+        key=lambda layer: layer['size'], reverse=True)
+    
+    logger.info("占用分析: %s 个镜像，%s 个不同图层，合计 %s 字节，去重后 %s 字节，增量拉取 %s 字节",
+                len(target_images), len(target_layers), total_size, unique_size, incremental_size)
+    
+    return jsonify({
+        'status': 'success',
+        'image_count': len(image_results),
+        'present_count': len([image for image in present_images if image in layers_by_image]),
+        'layer_count': len(target_layers),
+        'total_size': total_size,
+        'total_size_mb': round(total_size / 1024 / 1024, 2),
+        'unique_size': unique_size,
+        'unique_size_mb': round(unique_size / 1024 / 1024, 2),
+        'shared_savings': total_size - unique_size,
+        'shared_savings_mb': round((total_size - unique_size) / 1024 / 1024, 2),
+        'incremental_pull_size': incremental_size,
+        'incremental_pull_size_mb': round(incremental_size / 1024 / 1024, 2),
+        'images': image_results,
+        'shared_layers': shared_layers,
+        'errors': errors,
+    })
 
 @app.route('/image-info')
 @require_api_key
-@cache.cached(timeout=None, make_cache_key=make_cache_key)
+@cached_response(stale_check=tag_digest_expired)
 def image_info():
     # 获取请求参数
     image = request.args.get('image', '')
@@ -575,23 +3282,29 @@ def image_info():
             'message': '请提供镜像名称，例如：/image-info?image=nginx:latest'
         }), 400
     
-    logger.info(f"开始处理镜像请求: {image}")
+    invalid = invalid_reference_response(image) or invalid_size_method_response(size_method_requested())
+    if invalid:
+        return invalid
+    
+    fields = requested_fields()
+    unknown = sorted(fields - set(IMAGE_INFO_FIELDS)) if fields is not None else []
+    if unknown:
+        return jsonify({
+            'status': 'error',
+            'message': f"未知字段: {', '.join(unknown)}，可选字段: {', '.join(IMAGE_INFO_FIELDS)}"
+        }), 400
     
-    # 生成缓存键用于日志
-    cache_key = make_cache_key()
-    # 检查是否已缓存，方法是尝试获取值并检查是否存在
-    cached_value = cache.get(cache_key)
-    cached = cached_value is not None
-    logger.info(f"缓存状态: {'命中' if cached else '未命中'}")
+    logger.debug("开始处理镜像请求: %s", image)
     
     try:
         # 获取可选参数
         username = request.args.get('username')
         password = request.args.get('password')
         proxy = request.args.get('proxy')
+        platform = request.args.get('platform')
         
         # 调用共用函数获取镜像数据
-        data = get_image_data(image, username, password, proxy)
+        data = get_image_data(image, username, password, proxy, platform)
         
         # 检查是否出错
         if data['status'] == 'error':
@@ -601,56 +3314,57 @@ def image_info():
                 'error': data.get('error')
             }), data['code']
         
-        # 从结果中计算大小
         result = data['result']
-        compressed_size, uncompressed_size = calculate_image_size(result)
-        
-        # 计算人类可读格式
-        compressed_mb = compressed_size / 1024 / 1024
-        
-        logger.info(f"镜像 {image} 压缩大小: {compressed_mb:.2f}MB")
-        
         response = {
             'status': 'success',
             'image': image,
-            'compressed_size': compressed_size,
-            'compressed_size_mb': round(compressed_mb, 2),
-            'raw_data': result
         }
         
         # 添加暴露端口信息到顶层响应中，方便用户访问
-        if 'ExposedPorts' in result:
+        if 'ExposedPorts' in result and field_selected(fields, 'exposed_ports'):
             response['exposed_ports'] = result['ExposedPorts']
-            logger.info(f"添加暴露端口信息到响应: {result['ExposedPorts']}")
+            logger.debug("添加暴露端口信息到响应: %s", result['ExposedPorts'])
+        if field_selected(fields, 'raw_data'):
+            response['raw_data'] = result
+        if field_selected(fields, 'layers'):
+            response['layers'] = get_image_layers(result, username, password, proxy)
         
-        # 如果有未压缩大小，添加到响应
+        # 只请求了端口、图层等字段时不计算大小
+        size_keys = [key for key in IMAGE_INFO_FIELDS if 'compressed_size' in key]
+        if not any(field_selected(fields, key) for key in size_keys):
+            return json_response(response)
+        
+        # 从结果中计算大小
+        compressed_size, uncompressed_size = calculate_image_size(result)
+        
+        # 计算人类可读格式
+        compressed_mb = compressed_size / 1024 / 1024
+        
+        logger.debug("镜像 %s 压缩大小: %.2fMB", image, compressed_mb)
+        
+        response['compressed_size'] = compressed_size
+        response['compressed_size_mb'] = round(compressed_mb, 2)
+        
+        # 如果有未压缩大小，添加到响应（有图层信息时由apply_size_estimate替换为按图层估算的值）
         if uncompressed_size > 0:
             uncompressed_mb = uncompressed_size / 1024 / 1024
             response['uncompressed_size'] = uncompressed_size
             response['uncompressed_size_mb'] = round(uncompressed_mb, 2)
-            logger.info(f"镜像 {image} 未压缩大小: {uncompressed_mb:.2f}MB")
-        else:
-            # 估算未压缩大小（乘以1.7，与原脚本一致）
-            estimated_uncompressed = compressed_size * 1.7
-            estimated_uncompressed_mb = estimated_uncompressed / 1024 / 1024
-            response['estimated_uncompressed_size'] = estimated_uncompressed
-            response['estimated_uncompressed_size_mb'] = round(estimated_uncompressed_mb, 2)
-            logger.info(f"镜像 {image} 估算未压缩大小: {estimated_uncompressed_mb:.2f}MB")
-        
-        # 添加缓存响应头
-        resp = jsonify(response)
-        # 正确的缓存状态检查
-        is_cached = cache.get(make_cache_key()) is not None
-        resp.headers['X-Cache-Status'] = 'HIT' if is_cached else 'MISS'
-        resp.headers['X-Cache-TTL'] = str(cache_config["CACHE_DEFAULT_TIMEOUT"])
-        resp.headers['X-Cache-Type'] = cache_config["CACHE_TYPE"]
-        return resp
+            logger.debug("镜像 %s 未压缩大小: %.2fMB", image, uncompressed_mb)
+        # 按图层估算未压缩大小可能需要下载图层，只在请求了未压缩大小时进行
+        if any(field_selected(fields, key) for key in size_keys if key.startswith('uncompressed')):
+            apply_size_estimate(response, result, username, password, proxy, size_method_requested())
+        
+        if fields is not None:
+            response = {key: value for key, value in response.items()
+                        if key in ('status', 'image') or field_selected(fields, key)}
+        return json_response(response)
         
     except Exception as e:
         # 捕获并记录所有异常，包括堆栈跟踪
         error_traceback = traceback.format_exc()
-        logger.error(f"处理异常: {str(e)}")
-        logger.error(f"详细堆栈: {error_traceback}")
+        logger.error("处理异常: %s", e)
+        logger.error("详细堆栈: %s", error_traceback)
         
         return jsonify({
             'status': 'error',
@@ -660,9 +3374,12 @@ def image_info():
 
 @app.route('/image-tags')
 @require_api_key
-@cache.cached(timeout=None, make_cache_key=make_cache_key)
 def image_tags():
-    """获取镜像的所有标签列表"""
+    """获取镜像的标签列表
+
+    标签按仓库建立排序索引并缓存（见get_tag_index），每次请求只在索引上筛选和分页：
+    prefix（或 image=nginx:1.21 形式）前缀筛选、semver版本约束、regex正则、sort/order排序、limit/offset分页。
+    """
     # 获取请求参数
     image = request.args.get('image', '')
     if not image:
@@ -671,22 +3388,32 @@ def image_tags():
             'message': '请提供镜像名称，例如：/image-tags?image=nginx'
         }), 400
     
-    # 检查是否有标签前缀过滤
-    tag_prefix = None
-    if ':' in image:
-        image_parts = image.split(':', 1)
-        image = image_parts[0]
-        tag_prefix = image_parts[1]
-        logger.info(f"检测到标签前缀过滤: {tag_prefix}")
+    # 检查是否有标签前缀过滤（冒号位于最后一个斜杠之后才是标签前缀）
+    tag_prefix = request.args.get('prefix')
+    name, separator, prefix = image.rpartition(':')
+    if separator and '/' not in prefix:
+        image = name
+        tag_prefix = tag_prefix or prefix
+    if tag_prefix:
+        logger.debug("检测到标签前缀过滤: %s", tag_prefix)
+    
+    invalid = invalid_reference_response(image)
+    if invalid:
+        return invalid
     
-    logger.info(f"开始处理镜像标签请求: {image}")
+    regex = request.args.get('regex')
+    semver = request.args.get('semver')
+    sort = request.args.get('sort', 'semver' if semver else 'lex')
+    order = request.args.get('order', 'asc')
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if sort not in ('lex', 'semver') or order not in ('asc', 'desc') or offset < 0 or (limit is not None and limit <= 0):
+        return jsonify({
+            'status': 'error',
+            'message': '参数错误: sort可选lex或semver，order可选asc或desc，limit须为正整数，offset须为非负整数'
+        }), 400
     
-    # 生成缓存键用于日志
-    cache_key = make_cache_key()
-    # 检查是否已缓存，方法是尝试获取值并检查是否存在
-    cached_value = cache.get(cache_key)
-    cached = cached_value is not None
-    logger.info(f"缓存状态: {'命中' if cached else '未命中'}")
+    logger.debug("开始处理镜像标签请求: %s", image)
     
     try:
         # 获取可选参数
@@ -694,40 +3421,51 @@ def image_tags():
         password = request.args.get('password')
         proxy = request.args.get('proxy')
         
-        # 调用函数获取标签列表
-        data = get_image_tags(image, username, password, proxy)
+        try:
+            index, cache_status = get_tag_index(image, username, password, proxy)
+        except Overloaded as e:
+            return overloaded_response(e)
         
         # 检查是否出错
-        if data.get('status') == 'error':
+        if index.get('status') == 'error':
             return jsonify({
                 'status': 'error',
-                'message': data.get('message'),
-                'error': data.get('error')
-            }), data.get('code', 500)
+                'message': index.get('message'),
+                'error': index.get('error')
+            }), index.get('code', 500)
         
-        # 如果有标签前缀，过滤标签列表
-        if tag_prefix:
-            filtered_tags = [tag for tag in data['tags'] if tag.startswith(tag_prefix)]
-            original_count = len(data['tags'])
-            data['original_tag_count'] = original_count
-            data['tags'] = filtered_tags
-            data['tag_count'] = len(filtered_tags)
-            logger.info(f"根据前缀 '{tag_prefix}' 过滤标签: 从 {original_count} 个标签中筛选出 {len(filtered_tags)} 个")
-        
-        # 添加缓存响应头
-        resp = jsonify(data)
-        # 正确的缓存状态检查
-        is_cached = cache.get(make_cache_key()) is not None
-        resp.headers['X-Cache-Status'] = 'HIT' if is_cached else 'MISS'
-        resp.headers['X-Cache-TTL'] = str(cache_config["CACHE_DEFAULT_TIMEOUT"])
-        resp.headers['X-Cache-Type'] = cache_config["CACHE_TYPE"]
-        return resp
+        try:
+            tags = query_tag_index(index, tag_prefix, regex, semver, sort, order)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        page = tags[offset:offset + limit] if limit else tags[offset:]
+        data = {
+            'status': 'success',
+            'image': image,
+            'tag_count': len(page),
+            'tags': page
+        }
+        if tag_prefix or regex or semver:
+            data['original_tag_count'] = len(index['tags'])
+            logger.debug("筛选标签: 从 %s 个标签中筛选出 %s 个", len(index['tags']), len(tags))
+        if limit or offset:
+            data['total'] = len(tags)
+            data['offset'] = offset
+            if offset + len(page) < len(tags):
+                data['next_offset'] = offset + len(page)
+        
+        age = time.time() - index['fetched']
+        return add_cache_headers(jsonify(data), cache_status, age, ttl=TAG_INDEX_REFRESH)
         
     except Exception as e:
         # 捕获并记录所有异常，包括堆栈跟踪
         error_traceback = traceback.format_exc()
-        logger.error(f"处理异常: {str(e)}")
-        logger.error(f"详细堆栈: {error_traceback}")
+        logger.error("处理异常: %s", e)
+        logger.error("详细堆栈: %s", error_traceback)
         
         return jsonify({
             'status': 'error',
@@ -735,9 +3473,187 @@ def image_tags():
             'traceback': error_traceback
         }), 500
 
+@app.route('/image-tags/sizes')
+@require_api_key
+def image_tags_sizes():
+    """查询仓库所有（或指定前缀的）标签的大小，边完成边流式返回
+
+    先并发解析每个标签指向的digest，指向相同digest的标签只获取一次manifest；
+    结果写入与 /tag-info 共用的标签映射和digest缓存。标签筛选参数prefix、semver、regex与 /image-tags 相同。
+    format参数: ndjson（默认）、sse 或 json（全部完成后一次性返回）。
+    """
+    image = request.args.get('image', '')
+    if not image:
+        return jsonify({
+            'status': 'error',
+            'message': '请提供镜像名称，例如：/image-tags/sizes?image=nginx 或 /image-tags/sizes?image=nginx:1.21'
+        }), 400
+    
+    # 检查是否有标签前缀过滤（冒号位于最后一个斜杠之后才是标签前缀）
+    tag_prefix = request.args.get('prefix')
+    name, separator, prefix = image.rpartition(':')
+    if separator and '/' not in prefix:
+        image, tag_prefix = name, tag_prefix or prefix
+    
+    invalid = invalid_reference_response(image)
+    if invalid:
+        return invalid
+    
+    # 获取可选参数
+    username = request.args.get('username')
+    password = request.args.get('password')
+    proxy = request.args.get('proxy')
+    platform = request.args.get('platform')
+    output_format = request.args.get('format', '')
+    if not output_format:
+        output_format = 'sse' if request.accept_mimetypes.best == 'text/event-stream' else 'ndjson'
+    
+    try:
+        index, _ = get_tag_index(image, username, password, proxy)
+    except Overloaded as e:
+        return overloaded_response(e)
+    if index.get('status') == 'error':
+        return jsonify({
+            'status': 'error',
+            'message': index.get('message'),
+            'error': index.get('error')
+        }), index.get('code', 500)
+    
+    try:
+        tags = query_tag_index(index, tag_prefix, request.args.get('regex'), request.args.get('semver'))
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    if len(tags) > TAG_SWEEP_MAX_TAGS:
+        return jsonify({
+            'status': 'error',
+            'message': f'匹配的标签数 {len(tags)} 超过上限 {TAG_SWEEP_MAX_TAGS}，请使用标签前缀缩小范围，例如：{image}:1.21'
+        }), 400
+    logger.info("开始批量查询 %s 的标签大小，共 %s 个标签", image, len(tags))
+    
+    registry, repository, _ = split_image_reference(image)
+    auth = {
+        'username': username or os.environ.get('IMAGE_USERNAME', ''),
+        'password': password or os.environ.get('IMAGE_PASSWORD', ''),
+    }
+    resolved_proxy = proxy or os.environ.get('HTTPS_PROXY', '')
+    
+    def size_entry(data):
+        result = data['result']
+        compressed_size, uncompressed_size = calculate_image_size(result)
+        entry = {
+            'status': 'success',
+            'digest': result.get('Digest', ''),
+            'compressed_size': compressed_size,
+            'compressed_size_mb': round(compressed_size / 1024 / 1024, 2),
+            'created': result.get('Created', ''),
+            'architecture': result.get('Architecture', ''),
+            'os': result.get('Os', '')
+        }
+        if uncompressed_size > 0:
+            entry['uncompressed_size'] = uncompressed_size
+            entry['uncompressed_size_mb'] = round(uncompressed_size / 1024 / 1024, 2)
+        # 只使用已有的测量数据，不在批量查询中下载图层
+        apply_size_estimate(entry, result)
+        return entry
+    
+    def error_entry(data):
+        return {'status': 'error', 'code': data.get('code', 500), 'message': data.get('message'),
+                'error': data.get('error')}
+    
+    def exception_entry(e):
+        return {'status': 'error', 'code': 500, 'message': f'处理异常: {str(e)}', 'error': str(e)}
+    
+    def resolve(tag):
+        """解析标签的digest；skopeo后端无法单独解析digest，直接获取完整数据"""
+        try:
+            with registry_semaphore(registry):
+                if IMAGE_BACKEND == 'skopeo':
+                    data = get_image_data(f"{image}:{tag}", username, password, proxy, platform)
+                    if data['status'] == 'error':
+                        return 'resolved', tag, None, error_entry(data)
+                    entry = size_entry(data)
+                    return 'resolved', tag, entry['digest'], entry
+                return 'resolved', tag, resolve_tag_digest(registry, repository, tag, auth, resolved_proxy), None
+        except (RegistryError, requests.RequestException, ValueError) as e:
+            return 'resolved', tag, None, {'status': 'error', 'code': getattr(e, 'status_code', 500),
+                                           'message': f'解析标签失败: {tag}', 'error': str(e)}
+        except CommandCancelled:
+            raise
+        except Exception as e:
+            logger.error("标签大小查询异常: %s:%s, %s", image, tag, e)
+            return 'resolved', tag, None, exception_entry(e)
+    
+    def fetch(digest):
+        """获取digest的大小，失败时返回错误条目，由指向该digest的每个标签各输出一条，不中断输出流"""
+        try:
+            with registry_semaphore(registry):
+                data = get_image_data(f"{image}@{digest}", username, password, proxy, platform)
+            return 'fetched', digest, None, size_entry(data) if data['status'] == 'success' else error_entry(data)
+        except CommandCancelled:
+            raise
+        except Exception as e:
+            logger.error("标签大小查询异常: %s@%s, %s", image, digest, e)
+            return 'fetched', digest, None, dict(exception_entry(e), digest=digest)
+    
+    def iter_entries():
+        executor = ThreadPoolExecutor(max_workers=TAG_SWEEP_WORKERS)
+        cancelled = threading.Event()
+        entries_by_digest = {}
+        waiting = {}
+        try:
+            pending = {executor.submit(run_cancellable, cancelled, resolve, tag) for tag in tags}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, key, digest, entry = future.result()
+                    if kind == 'fetched':
+                        entries_by_digest[key] = entry
+                        for tag in waiting.pop(key):
+                            yield dict(entry, tag=tag)
+                    elif digest is None:
+                        yield dict(entry, tag=key)
+                    elif digest in entries_by_digest:
+                        yield dict(entries_by_digest[digest], tag=key)
+                    elif entry is not None:
+                        entries_by_digest[digest] = entry
+                        yield dict(entry, tag=key)
+                    elif digest in waiting:
+                        waiting[digest].append(key)
+                    else:
+                        # 指向相同digest的标签只获取一次
+                        waiting[digest] = [key]
+                        pending.add(executor.submit(run_cancellable, cancelled, fetch, digest))
+            logger.info("标签大小查询完成: %s，%s 个标签对应 %s 个digest", image, len(tags), len(entries_by_digest))
+        finally:
+            # 客户端断开时取消尚未开始的查询，并终止正在执行的skopeo子进程
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    if output_format == 'json':
+        entries = {entry['tag']: entry for entry in iter_entries()}
+        return jsonify({
+            'status': 'success',
+            'image': image,
+            'tag_count': len(tags),
+            'tags': [entries[tag] for tag in tags]
+        })
+    
+    if output_format == 'sse':
+        def iter_events():
+            for entry in iter_entries():
+                yield f"event: tag\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+            yield f"event: done\ndata: {json.dumps({'image': image, 'tag_count': len(tags)})}\n\n"
+        return Response(iter_events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    
+    return Response((json.dumps(entry, ensure_ascii=False) + '\n' for entry in iter_entries()),
+                    mimetype='application/x-ndjson')
+
 @app.route('/tag-info')
 @require_api_key
-@cache.cached(timeout=None, make_cache_key=make_cache_key)
+@cached_response(stale_check=tag_digest_expired)
 def tag_info():
     """获取特定镜像标签的详细信息"""
     # 获取请求参数
@@ -748,30 +3664,29 @@ def tag_info():
             'message': '请提供镜像名称及标签，例如：/tag-info?image=nginx:latest'
         }), 400
     
-    # 确保镜像名包含标签
-    if ':' not in image:
+    invalid = invalid_reference_response(image) or invalid_size_method_response(size_method_requested())
+    if invalid:
+        return invalid
+    
+    # 确保镜像名包含标签或digest（host:5000/repo中的端口不算标签）
+    reference = parse_image_reference(image)
+    if not reference.tag and not reference.digest:
         return jsonify({
             'status': 'error',
             'message': '请提供完整的镜像名称和标签，例如：/tag-info?image=nginx:latest'
         }), 400
     
-    logger.info(f"开始处理标签详情请求: {image}")
-    
-    # 生成缓存键用于日志
-    cache_key = make_cache_key()
-    # 检查是否已缓存，方法是尝试获取值并检查是否存在
-    cached_value = cache.get(cache_key)
-    cached = cached_value is not None
-    logger.info(f"缓存状态: {'命中' if cached else '未命中'}")
+    logger.debug("开始处理标签详情请求: %s", image)
     
     try:
         # 获取可选参数
         username = request.args.get('username')
         password = request.args.get('password')
         proxy = request.args.get('proxy')
+        platform = request.args.get('platform')
         
         # 使用已有的image_info逻辑，直接调用get_image_data
-        data = get_image_data(image, username, password, proxy)
+        data = get_image_data(image, username, password, proxy, platform)
         
         # 检查是否出错
         if data.get('status') == 'error':
@@ -788,7 +3703,7 @@ def tag_info():
         # 计算人类可读格式
         compressed_mb = compressed_size / 1024 / 1024
         
-        logger.info(f"标签 {image} 压缩大小: {compressed_mb:.2f}MB")
+        logger.debug("标签 %s 压缩大小: %.2fMB", image, compressed_mb)
         
         # 构建响应
         response = {
@@ -804,7 +3719,7 @@ def tag_info():
         # 添加暴露端口信息到顶层响应中
         if 'ExposedPorts' in result:
             response['exposed_ports'] = result['ExposedPorts']
-            logger.info(f"添加暴露端口信息到响应: {result['ExposedPorts']}")
+            logger.debug("添加暴露端口信息到响应: %s", result['ExposedPorts'])
         
         # 添加环境变量
         if 'Env' in result:
@@ -819,27 +3734,21 @@ def tag_info():
             uncompressed_mb = uncompressed_size / 1024 / 1024
             response['uncompressed_size'] = uncompressed_size
             response['uncompressed_size_mb'] = round(uncompressed_mb, 2)
-        else:
-            # 估算未压缩大小
-            estimated_uncompressed = compressed_size * 1.7
-            estimated_uncompressed_mb = estimated_uncompressed / 1024 / 1024
-            response['estimated_uncompressed_size'] = estimated_uncompressed
-            response['estimated_uncompressed_size_mb'] = round(estimated_uncompressed_mb, 2)
-        
-        # 添加缓存响应头
-        resp = jsonify(response)
-        # 正确的缓存状态检查
-        is_cached = cache.get(make_cache_key()) is not None
-        resp.headers['X-Cache-Status'] = 'HIT' if is_cached else 'MISS'
-        resp.headers['X-Cache-TTL'] = str(cache_config["CACHE_DEFAULT_TIMEOUT"])
-        resp.headers['X-Cache-Type'] = cache_config["CACHE_TYPE"]
-        return resp
+        size_method = size_method_requested()
+        apply_size_estimate(response, result, username, password, proxy, size_method)
+        
+        # 多架构镜像，添加各平台大小
+        if platform:
+            response['platform'] = platform
+        add_platform_sizes(response, image, username, password, proxy, platform, size_method)
+        
+        return json_response(response)
         
     except Exception as e:
         # 捕获并记录所有异常，包括堆栈跟踪
         error_traceback = traceback.format_exc()
-        logger.error(f"处理异常: {str(e)}")
-        logger.error(f"详细堆栈: {error_traceback}")
+        logger.error("处理异常: %s", e)
+        logger.error("详细堆栈: %s", error_traceback)
         
         return jsonify({
             'status': 'error',
@@ -864,6 +3773,9 @@ def cache_info():
             "cache_type": cache_config["CACHE_TYPE"],
             "cache_timeout": cache_config["CACHE_DEFAULT_TIMEOUT"],
             "cache_stats": stats,
+            "request_stats": dict(request_stats),
+            "inflight": len(inflight),
+            "metadata_store": metadata_store.stats() if metadata_store is not None else None,
         })
     except Exception as e:
         return jsonify({
@@ -874,23 +3786,152 @@ def cache_info():
 @app.route('/cache-clear')
 @require_api_key
 def cache_clear():
-    """清除缓存"""
+    """清除缓存
+
+    不带参数时清除所有缓存；指定image时只失效该仓库的条目：image带标签时只失效该标签，
+    prefix参数失效指定前缀的标签（例如 /cache-clear?image=nginx&prefix=1.21）。
+    """
+    image = request.args.get('image')
+    if image:
+        invalid = invalid_reference_response(image)
+        if invalid:
+            return invalid
+        reference = parse_image_reference(image)
+        prefix = request.args.get('prefix')
+        tags = [reference.tag] if reference.tag and not reference.digest else None
+        deleted, _ = invalidate_cache(reference.registry, reference.repository, tags, prefix)
+        return jsonify({
+            "status": "success",
+            "message": f"已失效 {reference.name} 的缓存",
+            "invalidated": deleted
+        })
+    
     try:
         cache.clear()
+        cache_key_index.clear()
+        if metadata_store is not None:
+            metadata_store.clear()
         logger.info("已清除所有缓存")
         return jsonify({
             "status": "success",
             "message": "缓存已清除"
         })
     except Exception as e:
-        logger.error(f"清除缓存失败: {str(e)}")
+        logger.error("清除缓存失败: %s", e)
         return jsonify({
             "status": "error",
             "message": f"清除缓存失败: {str(e)}"
         }), 500
 
+def parse_registry_events(body, registry=None):
+    """将Registry通知解析为[(动作, ImageReference)]，动作为push或delete
+
+    支持Docker distribution（events数组）和Harbor（type/event_data）两种格式，忽略拉取事件和图层blob事件。
+    registry指定时覆盖通知中的Registry地址（通知里的地址可能是内部地址，与客户端使用的不同）。
+    """
+    events = []
+    if isinstance(body.get('events'), list):
+        for event in body['events']:
+            action = event.get('action')
+            target = event.get('target') or {}
+            media_type = target.get('mediaType', '')
+            if action not in ('push', 'delete') or not target.get('repository'):
+                continue
+            if action == 'push' and 'manifest' not in media_type and 'index' not in media_type:
+                continue
+            host = registry or urlsplit(target.get('url', '')).netloc or (event.get('request') or {}).get('host', '')
+            image = f"{host}/{target['repository']}"
+            if target.get('tag'):
+                image += f":{target['tag']}"
+            if target.get('digest'):
+                image += f"@{target['digest']}"
+            events.append((action, image))
+    elif isinstance(body.get('event_data'), dict):
+        action = {'PUSH_ARTIFACT': 'push', 'DELETE_ARTIFACT': 'delete'}.get(body.get('type'))
+        if action:
+            for resource in body['event_data'].get('resources') or []:
+                image = resource.get('resource_url', '')
+                if registry:
+                    image = f"{registry}/{image.split('/', 1)[1]}"
+                if resource.get('digest') and '@' not in image:
+                    image += f"@{resource['digest']}"
+                events.append((action, image))
+    
+    parsed = []
+    for action, image in events:
+        try:
+            parsed.append((action, parse_image_reference(image)))
+        except ValueError as e:
+            logger.warning("忽略无法解析的Registry通知: %s, %s", image, e)
+    return parsed
+
+@app.route('/webhook/registry', methods=['POST'])
+@require_api_key
+def registry_webhook():
+    """接收Registry推送/删除通知，只失效受影响的缓存条目
+
+    推送标签时失效该标签的接口缓存、标签列表和标签索引，标签的digest映射直接更新为通知中的digest；
+    删除标签时失效该标签；只带digest的删除无法确定受影响的标签，失效整个仓库。
+    查询参数registry可以指定客户端使用的Registry地址，覆盖通知中的地址。
+    """
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, dict):
+        return jsonify({
+            'status': 'error',
+            'message': '请求体必须是Docker distribution或Harbor格式的JSON通知'
+        }), 400
+    
+    results = []
+    for action, reference in parse_registry_events(body, request.args.get('registry')):
+        if reference.tag:
+            refresh = {reference.tag: reference.digest} if action == 'push' and reference.digest else None
+            deleted, refreshed = invalidate_cache(reference.registry, reference.repository, [reference.tag],
+                                                  refresh=refresh)
+        elif action == 'delete':
+            deleted, refreshed = invalidate_cache(reference.registry, reference.repository)
+        else:
+            # 只推送digest不改变任何标签
+            continue
+        REGISTRY_EVENTS.labels(action=action).inc()
+        results.append({
+            'action': action,
+            'image': reference.name + (f":{reference.tag}" if reference.tag else '')
+                     + (f"@{reference.digest}" if reference.digest else ''),
+            'invalidated': deleted,
+            'refreshed': refreshed
+        })
+    
+    logger.info("处理Registry通知: %s 个事件", len(results))
+    return jsonify({
+        'status': 'success',
+        'events': results
+    })
+
+@app.route('/metrics')
+@require_api_key
+def metrics():
+    """Prometheus指标，设置了PROMETHEUS_MULTIPROC_DIR时汇总所有worker进程的数据"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+def run_async_server(host='0.0.0.0', port=8000):
+    """异步模式: 使用gevent WSGI服务器，每个请求一个协程，ASYNC_MAX_CONNECTIONS限制同时处理的连接数"""
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+    
+    max_connections = int(os.environ.get('ASYNC_MAX_CONNECTIONS', 1000))
+    logger.info("以异步模式启动，最大并发连接数: %s", max_connections)
+    server = WSGIServer((host, port), app, spawn=Pool(max_connections), log=None)
+    server.serve_forever()
+
 if __name__ == '__main__':
     # 打印启动信息
     logger.info("Docker镜像大小查询服务启动中...")
     
-    app.run(host='0.0.0.0', port=8000) 
\ No newline at end of file
+    if SERVER_MODE == 'async':
+        run_async_server(host='0.0.0.0', port=8000)
+    else:
+        app.run(host='0.0.0.0', port=8000)
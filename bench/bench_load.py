@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+接口负载基准测试: 启动本地模拟Registry（bench/fake_registry.py）和服务，不依赖真实Registry、skopeo和网络，
+对 /image-size、/image-info、/image-tags、/tag-info 分别运行三种场景:
+
+- cold: 缓存为空，每个请求查询不同的镜像，衡量未命中路径
+- warm: 先预热一小组镜像，再并发查询这些镜像，衡量缓存命中路径
+- stampede: 缓存为空时同一镜像的并发请求同时到达，衡量请求合并的效果
+
+输出每个场景的吞吐量、p50/p99延迟、错误数、被拒绝数和平均每个请求的Registry请求数。
+吞吐量、延迟和Registry请求数只统计成功（2xx）的响应，过载保护快速返回的503单独计入拒绝数，不会拉低延迟。
+服务的慢速通道默认放宽到与 --concurrency 相同，cold场景测量的是实际获取而不是拒绝，可用 --env SLOW_LANE_*=... 覆盖。
+镜像内容和请求顺序都是确定的，相同参数的结果可以直接比较；--output 保存结果，
+--compare 与之前保存的结果对比，超过 --threshold 的退化以非0退出码结束，可用于CI。
+
+用法:
+    python bench/bench_load.py --output baseline.json
+    python bench/bench_load.py --compare baseline.json --threshold 0.2
+    python bench/bench_load.py --backend skopeo --latency 0.05 --scenarios cold,stampede
+    python bench/bench_load.py --endpoints image-size --env CACHE_TYPE=redis --env CACHE_REDIS_URL=redis://localhost:6379/0
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench_server import ROOT, start_server, stop_server
+from fake_registry import FakeRegistry, add_arguments as add_registry_arguments
+
+FAKEBIN = os.path.join(ROOT, 'bench', 'fakebin')
+
+ENDPOINTS = {
+    'image-size': '/image-size?image={image}',
+    'image-info': '/image-info?image={image}',
+    'image-tags': '/image-tags?image={repository}',
+    'tag-info': '/tag-info?image={image}',
+}
+SCENARIOS = ['cold', 'warm', 'stampede']
+# 对比时检查的指标: 名称 -> 变大是否为退化
+COMPARED_METRICS = {'rps': False, 'p50': True, 'p99': True, 'calls_per_request': True}
+
+
+def percentile(latencies, p):
+    if not latencies:
+        return 0.0
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+
+class Bench:
+    def __init__(self, base, registry, concurrency):
+        self.base = base
+        self.registry = registry
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def url(self, endpoint, index, tag):
+        repository = f"{self.registry.server_host}/bench/app-{index}"
+        return self.base + ENDPOINTS[endpoint].format(image=f"{repository}:{tag}", repository=repository)
+
+    def get(self, url):
+        start = time.perf_counter()
+        try:
+            code = self.session.get(url, timeout=120).status_code
+        except requests.RequestException:
+            code = 0
+        return time.perf_counter() - start, code
+
+    def reset(self):
+        """清空服务的所有缓存和Registry请求统计"""
+        self.session.get(f"{self.base}/cache-clear", timeout=30).raise_for_status()
+        self.registry.stats.reset()
+
+    def measure(self, run):
+        calls_before = self.registry.stats.snapshot()
+        start = time.perf_counter()
+        results = run()
+        elapsed = time.perf_counter() - start
+        calls = self.registry.stats.snapshot()
+        # 只统计成功的响应，被拒绝的请求几乎不耗时，计入会让延迟和吞吐量看起来更好
+        latencies = [latency for latency, code in results if 200 <= code < 300]
+        total_calls = calls.get('total', 0) - calls_before.get('total', 0)
+        return {
+            'requests': len(results),
+            'succeeded': len(latencies),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50': round(percentile(latencies, 0.50), 2),
+            'p99': round(percentile(latencies, 0.99), 2),
+            'errors': sum(1 for _, code in results if not 200 <= code < 300 and code != 503),
+            # 过载保护拒绝的请求（503），见README「过载保护」
+            'shed': sum(1 for _, code in results if code == 503),
+            'calls_per_request': round(total_calls / max(1, len(latencies)), 3),
+            'throttled': calls.get('throttled', 0) - calls_before.get('throttled', 0),
+        }
+
+    def load(self, urls, concurrency):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(self.get, urls))
+
+    def cold(self, endpoint, offset, args):
+        # 每个请求查询不同的仓库，全部未命中
+        urls = [self.url(endpoint, offset + i, f"v{i % args.tags}") for i in range(args.requests)]
+        return self.measure(lambda: self.load(urls, args.concurrency))
+
+    def warm(self, endpoint, offset, args):
+        urls = [self.url(endpoint, offset + i, 'v0') for i in range(args.hot_set)]
+        for url in urls:
+            self.get(url)
+        return self.measure(lambda: self.load([urls[i % len(urls)] for i in range(args.requests)], args.concurrency))
+
+    def stampede(self, endpoint, offset, args):
+        rounds = max(1, args.requests // args.concurrency)
+
+        def run():
+            results = []
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                for round_index in range(rounds):
+                    url = self.url(endpoint, offset + round_index, 'v1')
+                    barrier = threading.Barrier(args.concurrency)
+
+                    def one(_, url=url, barrier=barrier):
+                        barrier.wait()
+                        return self.get(url)
+
+                    results.extend(executor.map(one, range(args.concurrency)))
+            return results
+
+        return self.measure(run)
+
+
+def compare(results, baseline, threshold):
+    """与基线结果对比，返回退化列表"""
+    previous = {(r['scenario'], r['endpoint']): r for r in baseline['results']}
+    regressions = []
+    print(f"\n与基线对比（阈值 {threshold:.0%}）:")
+    for r in results:
+        base = previous.get((r['scenario'], r['endpoint']))
+        if base is None:
+            continue
+        changes = []
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            old, new = base[metric], r[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if higher_is_worse else change < -threshold
+            changes.append(f"{metric} {change:+.0%}{' !' if worse else ''}")
+            if worse:
+                regressions.append(f"{r['scenario']}/{r['endpoint']} {metric}: {old} -> {new}")
+        # 错误数和拒绝数增加直接视为退化
+        for metric in ('errors', 'shed'):
+            if r[metric] > base.get(metric, 0):
+                changes.append(f"{metric} {base.get(metric, 0)} -> {r[metric]} !")
+                regressions.append(f"{r['scenario']}/{r['endpoint']} {metric}: {base.get(metric, 0)} -> {r[metric]}")
+        print(f"{r['scenario']:<10}{r['endpoint']:<12}{', '.join(changes)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='使用本地模拟Registry压测各查询接口')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='逗号分隔的接口')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='逗号分隔的场景: cold,warm,stampede')
+    parser.add_argument('--requests', type=int, default=400, help='每个场景的请求数')
+    parser.add_argument('--concurrency', type=int, default=20, help='并发客户端数，也是stampede每轮同时到达的请求数')
+    parser.add_argument('--hot-set', type=int, default=10, help='warm场景预热的镜像数')
+    parser.add_argument('--backend', choices=['registry', 'skopeo'], default='registry',
+                        help='服务的IMAGE_BACKEND，skopeo时使用bench/fakebin中的skopeo替身')
+    parser.add_argument('--mode', choices=['dev', 'prod', 'async'], default='prod', help='服务器运行模式')
+    parser.add_argument('--port', type=int, default=8100, help='服务监听端口')
+    parser.add_argument('--registry-port', type=int, default=0, help='模拟Registry监听端口，0为随机端口')
+    parser.add_argument('--env', action='append', default=[], help='传给服务的环境变量，KEY=VALUE，可多次指定')
+    parser.add_argument('--output', help='将结果保存为JSON文件')
+    parser.add_argument('--compare', help='与之前保存的JSON结果对比')
+    parser.add_argument('--threshold', type=float, default=0.2, help='对比时视为退化的相对变化')
+    add_registry_arguments(parser)
+    args = parser.parse_args()
+
+    registry = FakeRegistry(('127.0.0.1', args.registry_port), args.latency, args.jitter, args.throttle_every,
+                            args.tags, args.page_size, args.layers, args.layer_size)
+    registry.server_host = f"localhost:{registry.server_port}"
+    threading.Thread(target=registry.serve_forever, daemon=True).start()
+
+    env = {
+        'IMAGE_BACKEND': args.backend,
+        'CACHE_TYPE': 'simple',
+        'WEB_CONCURRENCY': '1',
+        'METADATA_DB': '',
+        'CREDENTIAL_SCOPE_KEY': 'bench',
+        # 慢速通道容纳全部并发客户端，cold场景不因排队被拒绝；线程数需大于并发数与排队数之和
+        'SLOW_LANE_CONCURRENCY': str(args.concurrency),
+        'SLOW_LANE_QUEUE': str(args.concurrency),
+        'SLOW_LANE_WAIT': '120',
+        'GUNICORN_THREADS': str(max(48, args.concurrency * 2 + 8)),
+    }
+    if args.backend == 'skopeo':
+        env['PATH'] = FAKEBIN + os.pathsep + os.environ.get('PATH', '')
+    env.update(item.split('=', 1) for item in args.env)
+
+    proc, base = start_server(args.mode, args.port, env)
+    bench = Bench(base, registry, args.concurrency)
+    results = []
+    print(f"{'场景':<10}{'接口':<12}{'请求/秒':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'错误':>6}{'拒绝':>6}{'Registry请求/请求':>18}")
+    try:
+        for endpoint_index, endpoint in enumerate(args.endpoints.split(',')):
+            for scenario in args.scenarios.split(','):
+                bench.reset()
+                # 不同场景使用不重叠的仓库，相同参数的每次运行请求的镜像相同
+                offset = endpoint_index * 1000000 + SCENARIOS.index(scenario) * 100000
+                r = getattr(bench, scenario)(endpoint, offset, args)
+                r.update(scenario=scenario, endpoint=endpoint)
+                results.append(r)
+                print(f"{scenario:<10}{endpoint:<12}{r['rps']:>10.1f}{r['p50']:>10.1f}{r['p99']:>10.1f}"
+                      f"{r['errors']:>6}{r['shed']:>6}{r['calls_per_request']:>18.3f}")
+    finally:
+        stop_server(proc)
+        registry.shutdown()
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'threshold', 'port', 'registry_port')}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print("警告: 基线使用的参数不同，结果可能不可比较")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\n性能退化:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务器模式基准测试: 分别以 dev(Flask开发服务器)、prod(gunicorn多线程worker)、
+async(gunicorn gevent worker) 模式启动服务，用相同的并发请求压测并对比吞吐量和延迟。
+
+用法:
+    python bench/bench_server.py --path "/image-size?image=nginx:latest" --requests 2000 --concurrency 50
+    python bench/bench_server.py --modes dev,prod --env CACHE_TYPE=null
+
+默认压测缓存命中路径（第一次请求预热缓存），衡量的是服务器本身的请求处理能力；
+设置 --env CACHE_TYPE=null 可以压测每次都访问Registry的路径。
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    'dev': [sys.executable, 'app.py'],
+    'prod': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+    'async': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+}
+
+
+def start_server(mode, port, extra_env):
+    env = dict(os.environ, SERVER_MODE=mode, BIND=f'127.0.0.1:{port}', **extra_env)
+    cmd = list(COMMANDS[mode])
+    if mode == 'dev':
+        # app.py 固定监听8000端口
+        port = 8000
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f'{base}/cache-info', timeout=1)
+            return proc, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'{mode} 模式服务启动超时')
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def run_load(url, total, concurrency):
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            code = session.get(url, timeout=120).status_code
+        except requests.RequestException:
+            code = 0
+        return time.perf_counter() - start, code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for r in results if r[1] != 200)
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        'rps': total / elapsed,
+        'p50': pct(0.50),
+        'p95': pct(0.95),
+        'p99': pct(0.99),
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比不同服务器模式的吞吐量和延迟')
+    parser.add_argument('--path', default='/image-size?image=nginx:latest', help='压测的请求路径')
+    parser.add_argument('--requests', type=int, default=2000, help='每种模式的请求总数')
+    parser.add_argument('--concurrency', type=int, default=50, help='并发客户端数')
+    parser.add_argument('--modes', default='dev,prod,async', help='逗号分隔的服务器模式')
+    parser.add_argument('--port', type=int, default=8100, help='gunicorn监听端口')
+    parser.add_argument('--env', action='append', default=[], help='传给服务的环境变量，KEY=VALUE，可多次指定')
+    args = parser.parse_args()
+
+    extra_env = dict(item.split('=', 1) for item in args.env)
+
+    print(f"{'模式':<8}{'请求/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'错误':>8}")
+    for mode in args.modes.split(','):
+        proc, base = start_server(mode, args.port, extra_env)
+        try:
+            url = base + args.path
+            # 预热: 建立缓存和Registry连接
+            requests.get(url, timeout=120)
+            r = run_load(url, args.requests, args.concurrency)
+        finally:
+            stop_server(proc)
+        print(f"{mode:<8}{r['rps']:>10.1f}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}{r['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
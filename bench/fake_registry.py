@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟的 Registry v2 服务，供基准测试使用，不依赖真实Registry和网络。
+
+镜像内容由仓库名和标签确定性生成，每次启动结果相同:
+
+- `bench/app-<n>`: 单架构镜像，标签为 v0 ~ v<tags-1>
+- `bench/multi-<n>`: 多架构镜像（manifest list），平台为 linux/amd64、linux/arm64/v8、linux/arm/v7
+- `bench/private-<n>`: 与 app 相同的单架构镜像，但需要用户名密码（默认 bench/secret）换取令牌
+- 其他仓库或标签返回 404；`hidden` 中的仓库暂时返回 404（测试中模拟尚未推送或尚未授权）
+
+支持的行为:
+
+- Bearer令牌认证: 未带令牌的请求返回 401 和 WWW-Authenticate 挑战，令牌从 /token 获取；
+  请求私有仓库的令牌时需要Basic认证，凭证错误时 /token 返回 401
+- 标签分页: /tags/list 支持 n 和 last 参数，超过一页时返回 Link 响应头
+- 限流: --throttle-every N 时每第N个请求返回 429 和 Retry-After
+- 延迟: --latency 和 --jitter 模拟Registry的响应时间
+
+/_stats 返回按类型统计的请求数，/_reset 清零统计，这两个路径不计入统计也不受延迟影响。
+
+用法:
+    python bench/fake_registry.py --port 5000 --latency 0.05 --tags 120
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+MANIFEST_V2 = 'application/vnd.docker.distribution.manifest.v2+json'
+MANIFEST_LIST = 'application/vnd.docker.distribution.manifest.list.v2+json'
+CONFIG_V1 = 'application/vnd.docker.container.image.v1+json'
+LAYER_GZIP = 'application/vnd.docker.image.rootfs.diff.tar.gzip'
+PLATFORMS = [('amd64', ''), ('arm64', 'v8'), ('arm', 'v7')]
+TOKEN = 'bench-token'
+PRIVATE_TOKEN = 'bench-private-token'
+
+REPOSITORY_PATTERN = re.compile(r'^bench/(app|multi|private)-\d+$')
+PRIVATE_PATTERN = re.compile(r'^bench/private-\d+$')
+# 请求路径中的仓库名、对象类型和引用
+PATH_PATTERN = re.compile(r'^/v2/(?P<repository>.+)/(?P<kind>manifests|blobs)/(?P<reference>[^/]+)$')
+TAGS_PATTERN = re.compile(r'^/v2/(?P<repository>.+)/tags/list$')
+
+
+def sha256(data):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+class Store:
+    """按需生成并保存镜像内容，相同的仓库和标签总是生成相同的digest"""
+
+    def __init__(self, tags, layers, layer_size):
+        self.tags = tags
+        self.layers = layers
+        self.layer_size = layer_size
+        self.lock = threading.Lock()
+        self.blobs = {}
+        self.manifests = {}
+
+    def tag_list(self, repository):
+        if not REPOSITORY_PATTERN.match(repository):
+            return None
+        return sorted(f"v{i}" for i in range(self.tags))
+
+    def add_blob(self, data):
+        digest = sha256(data)
+        self.blobs[digest] = data
+        return digest
+
+    def add_manifest(self, repository, manifest):
+        body = json.dumps(manifest, sort_keys=True).encode()
+        digest = sha256(body)
+        self.manifests[(repository, digest)] = (body, manifest['mediaType'])
+        return digest, len(body)
+
+    def build_image(self, repository, tag, arch, variant):
+        seed = f"{repository}:{tag}:{arch}/{variant}"
+        rng = random.Random(seed)
+        layers = []
+        for i in range(self.layers):
+            # 一半随机一半填充，压缩比约为2，接近真实图层
+            raw = rng.randbytes(self.layer_size // 2) + bytes(self.layer_size - self.layer_size // 2)
+            blob = gzip.compress(raw, compresslevel=1, mtime=0)
+            layers.append({'mediaType': LAYER_GZIP, 'size': len(blob), 'digest': self.add_blob(blob)})
+        config = {
+            'architecture': arch,
+            'os': 'linux',
+            'variant': variant or None,
+            'created': '2024-01-01T00:00:00Z',
+            'config': {'Env': ['PATH=/usr/local/bin:/usr/bin:/bin'], 'ExposedPorts': {'80/tcp': {}},
+                       'Labels': {'bench.seed': seed}},
+            'rootfs': {'type': 'layers', 'diff_ids': [sha256(str(i).encode()) for i in range(self.layers)]},
+        }
+        config_body = json.dumps(config, sort_keys=True).encode()
+        return self.add_manifest(repository, {
+            'schemaVersion': 2,
+            'mediaType': MANIFEST_V2,
+            'config': {'mediaType': CONFIG_V1, 'size': len(config_body), 'digest': self.add_blob(config_body)},
+            'layers': layers,
+        })
+
+    def resolve(self, repository, reference):
+        """返回 (manifest内容, mediaType)，不存在时返回None"""
+        with self.lock:
+            if reference.startswith('sha256:'):
+                return self.manifests.get((repository, reference))
+            if reference not in (self.tag_list(repository) or ()):
+                return None
+            key = (repository, reference)
+            if key not in self.manifests:
+                if repository.startswith('bench/multi-'):
+                    entries = []
+                    for arch, variant in PLATFORMS:
+                        digest, size = self.build_image(repository, reference, arch, variant)
+                        platform = {'architecture': arch, 'os': 'linux'}
+                        if variant:
+                            platform['variant'] = variant
+                        entries.append({'mediaType': MANIFEST_V2, 'size': size, 'digest': digest, 'platform': platform})
+                    digest, _ = self.add_manifest(repository, {
+                        'schemaVersion': 2, 'mediaType': MANIFEST_LIST, 'manifests': entries})
+                else:
+                    digest, _ = self.build_image(repository, reference, 'amd64', '')
+                self.manifests[key] = self.manifests[(repository, digest)]
+            return self.manifests[key]
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def incr(self, kind, total=True):
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            if total:
+                self.counts['total'] = self.counts.get('total', 0) + 1
+            return self.counts.get('total', 0)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'bench-registry/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, code, body=b'', headers=None):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_json(self, code, data, headers=None):
+        self.send(code, json.dumps(data).encode(), dict(headers or {}, **{'Content-Type': 'application/json'}))
+
+    def send_error_code(self, code, error):
+        self.send_json(code, {'errors': [{'code': error, 'message': error.lower().replace('_', ' ')}]})
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        if url.path == '/_stats':
+            return self.send_json(200, server.stats.snapshot())
+        if url.path == '/_reset':
+            server.stats.reset()
+            return self.send_json(200, {})
+
+        kind = self.request_kind(url.path)
+        count = server.stats.incr(kind)
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+        if server.throttle_every and count % server.throttle_every == 0:
+            server.stats.incr('throttled', total=False)
+            return self.send_json(429, {'errors': [{'code': 'TOOMANYREQUESTS'}]}, {'Retry-After': '1'})
+
+        if url.path == '/token':
+            return self.token(parse_qs(url.query))
+        match = PATH_PATTERN.match(url.path) or TAGS_PATTERN.match(url.path)
+        private = bool(match and PRIVATE_PATTERN.match(match.group('repository')))
+        allowed = {f'Bearer {PRIVATE_TOKEN}'} if private else {f'Bearer {TOKEN}', f'Bearer {PRIVATE_TOKEN}'}
+        if self.headers.get('Authorization') not in allowed:
+            host = self.headers.get('Host', f'127.0.0.1:{server.server_port}')
+            challenge = f'Bearer realm="http://{host}/token",service="bench-registry"'
+            if match:
+                challenge += f',scope="repository:{match.group("repository")}:pull"'
+            return self.send(401, b'{}', {'WWW-Authenticate': challenge, 'Content-Type': 'application/json'})
+
+        if url.path == '/v2/':
+            return self.send_json(200, {})
+        if match and match.group('repository') in server.hidden:
+            return self.send_error_code(404, 'NAME_UNKNOWN')
+        match = TAGS_PATTERN.match(url.path)
+        if match:
+            return self.tags_list(match.group('repository'), parse_qs(url.query))
+        match = PATH_PATTERN.match(url.path)
+        if not match:
+            return self.send_error_code(404, 'NAME_UNKNOWN')
+        if match.group('kind') == 'manifests':
+            return self.manifest(match.group('repository'), match.group('reference'))
+        return self.blob(match.group('reference'))
+
+    do_HEAD = do_GET
+
+    def token(self, query):
+        """签发令牌，scope包含私有仓库时校验Basic认证"""
+        scope = query.get('scope', [''])[0]
+        if not any(PRIVATE_PATTERN.match(item.split(':')[1]) for item in scope.split() if item.count(':') >= 2):
+            return self.send_json(200, {'token': TOKEN, 'expires_in': self.server.token_ttl})
+        username, password = self.server.credentials
+        expected = 'Basic ' + base64.b64encode(f"{username}:{password}".encode()).decode()
+        if self.headers.get('Authorization') != expected:
+            return self.send_error_code(401, 'UNAUTHORIZED')
+        self.send_json(200, {'token': PRIVATE_TOKEN, 'expires_in': self.server.token_ttl})
+
+    @staticmethod
+    def request_kind(path):
+        if path == '/token':
+            return 'token'
+        if path == '/v2/':
+            return 'ping'
+        if path.endswith('/tags/list'):
+            return 'tags'
+        match = PATH_PATTERN.match(path)
+        return match.group('kind') if match else 'other'
+
+    def tags_list(self, repository, query):
+        tags = self.server.store.tag_list(repository)
+        if tags is None:
+            return self.send_error_code(404, 'NAME_UNKNOWN')
+        n = int(query.get('n', [self.server.page_size])[0])
+        last = query.get('last', [None])[0]
+        if last:
+            tags = [tag for tag in tags if tag > last]
+        page = tags[:n]
+        headers = {}
+        if len(tags) > n:
+            headers['Link'] = f'</v2/{repository}/tags/list?n={n}&last={page[-1]}>; rel="next"'
+        self.send_json(200, {'name': repository, 'tags': page}, headers)
+
+    def manifest(self, repository, reference):
+        found = self.server.store.resolve(repository, reference)
+        if found is None:
+            return self.send_error_code(404, 'MANIFEST_UNKNOWN')
+        body, media_type = found
+        self.send(200, body, {'Content-Type': media_type, 'Docker-Content-Digest': sha256(body)})
+
+    def blob(self, digest):
+        data = self.server.store.blobs.get(digest)
+        if data is None:
+            return self.send_error_code(404, 'BLOB_UNKNOWN')
+        byte_range = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if byte_range:
+            start = int(byte_range.group(1))
+            end = int(byte_range.group(2)) if byte_range.group(2) else len(data) - 1
+            part = data[start:end + 1]
+            return self.send(206, part, {'Content-Range': f'bytes {start}-{start + len(part) - 1}/{len(data)}',
+                                         'Content-Type': 'application/octet-stream'})
+        self.send(200, data, {'Docker-Content-Digest': digest, 'Content-Type': 'application/octet-stream'})
+
+
+class FakeRegistry(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, jitter=0.0, throttle_every=0, tags=120, page_size=100,
+                 layers=3, layer_size=64 * 1024, token_ttl=300, credentials=('bench', 'secret')):
+        super().__init__(address, RegistryHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_every = throttle_every
+        self.page_size = page_size
+        self.token_ttl = token_ttl
+        self.credentials = credentials
+        self.store = Store(tags, layers, layer_size)
+        self.stats = Stats()
+        self.hidden = set()
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的固定延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='在固定延迟上增加的随机延迟上限（秒）')
+    parser.add_argument('--throttle-every', type=int, default=0, help='每第N个请求返回429，0为不限流')
+    parser.add_argument('--tags', type=int, default=120, help='每个仓库的标签数')
+    parser.add_argument('--page-size', type=int, default=100, help='标签列表默认每页数量')
+    parser.add_argument('--layers', type=int, default=3, help='每个镜像的图层数')
+    parser.add_argument('--layer-size', type=int, default=64 * 1024, help='每个图层解压后的字节数')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的Registry v2服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = FakeRegistry((args.host, args.port), args.latency, args.jitter, args.throttle_every,
+                          args.tags, args.page_size, args.layers, args.layer_size)
+    print(f"模拟Registry监听 http://{args.host}:{server.server_port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
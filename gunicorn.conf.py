@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# gunicorn 生产环境配置，所有参数都可以通过环境变量调整
+# 启动方式: gunicorn -c gunicorn.conf.py app:app
+
+import os
+import multiprocessing
+
+# SERVER_MODE=async 使用gevent协程worker，其余情况使用多线程worker
+# gevent需要在加载应用之前打补丁，preload时应用在master进程中导入
+SERVER_MODE = os.environ.get('SERVER_MODE', 'prod').lower()
+if SERVER_MODE == 'async':
+    from gevent import monkey
+    monkey.patch_all()
+
+CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
+# simple缓存保存在每个worker进程内存中，多个worker之间不共享，worker重启后缓存也会丢失，
+# 因此只有使用Redis共享缓存时才默认启用多worker和按请求数重启
+SHARED_CACHE = CACHE_TYPE == 'redis'
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1 if SHARED_CACHE else 1))
+worker_class = 'gevent' if SERVER_MODE == 'async' else 'gthread'
+# gthread worker每个进程的线程数；慢速通道中运行和排队的请求都占用线程，默认值保证
+# 5个路由的慢速通道（默认各4并发、4排队）全部占满时仍有线程处理缓存命中的请求
+threads = int(os.environ.get('GUNICORN_THREADS', 48))
+# gevent worker每个进程同时处理的最大连接数
+worker_connections = int(os.environ.get('ASYNC_MAX_CONNECTIONS', 1000))
+
+# 在fork之前加载应用和配置，worker启动更快并共享只读内存
+preload_app = True
+
+# 处理指定数量的请求后重启worker，jitter避免所有worker同时重启
+max_requests = int(os.environ.get('MAX_REQUESTS', 1000 if SHARED_CACHE else 0))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', 100))
+
+# worker无响应超时和优雅退出等待时间（秒），标签大小批量查询等长请求需要较长的超时
+timeout = int(os.environ.get('WORKER_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('KEEPALIVE', 5))
+
+# 应用本身已输出日志，只保留gunicorn错误日志
+accesslog = os.environ.get('ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    server.log.info(f"生产模式启动: worker类型 {worker_class}, worker数 {workers}, "
+                    f"线程数 {threads}, max_requests {max_requests}")
+    if workers > 1 and CACHE_TYPE == 'simple':
+        server.log.warning("CACHE_TYPE=simple时每个worker使用独立的内存缓存，命中率会随worker数下降，"
+                           "多worker部署建议设置 CACHE_TYPE=redis 和 CACHE_REDIS_URL")
+
+
+def post_fork(server, worker):
+    # 预加载时日志输出线程只在master进程中启动，fork出的worker需要重新启动
+    from app import setup_logging
+    setup_logging()
+
+
+def child_exit(server, worker):
+    # 多进程Prometheus指标: 清理已退出worker的进行中计数
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    # 优雅退出时不再等待排队中的后台刷新任务，并终止仍在运行的skopeo子进程
+    from app import refresh_executor, command_executor
+    refresh_executor.shutdown(wait=False)
+    command_executor.kill_all()
+
+
+def worker_abort(worker):
+    # worker处理超时被中止时，skopeo子进程在独立的进程组中不会随worker退出，需要主动终止
+    from app import command_executor
+    command_executor.kill_all()
@@ -28,9 +28,24 @@ if [ "$CACHE_TYPE" = "redis" ]; then
         echo "  警告: CACHE_TYPE设置为redis但CACHE_REDIS_URL未设置"
     fi
 fi
+if { [ "$CACHE_TYPE" = "redis" ] || [ -n "$METADATA_DB" ]; } && [ -z "$CREDENTIAL_SCOPE_KEY" ]; then
+    echo "  错误: 使用Redis缓存或METADATA_DB时必须设置CREDENTIAL_SCOPE_KEY"
+fi
+
+# 输出镜像数据后端
+IMAGE_BACKEND=${IMAGE_BACKEND:-registry}
+echo "镜像数据后端: $IMAGE_BACKEND"
+
+# 输出服务运行模式: prod(gunicorn多线程worker，默认), async(gunicorn gevent worker), dev(Flask开发服务器)
+SERVER_MODE=${SERVER_MODE:-prod}
+export SERVER_MODE
+echo "服务运行模式: $SERVER_MODE"
+if [ "$SERVER_MODE" != "dev" ] && [ "$CACHE_TYPE" = "simple" ] && [ -n "$WEB_CONCURRENCY" ] && [ "$WEB_CONCURRENCY" -gt 1 ]; then
+    echo "  警告: CACHE_TYPE=simple时每个worker使用独立缓存，多worker部署建议使用redis缓存"
+fi
 
-# 确保 skopeo 命令可用
-if ! command -v skopeo &> /dev/null; then
+# skopeo 后端需要 skopeo 命令可用
+if [ "$IMAGE_BACKEND" = "skopeo" ] && ! command -v skopeo &> /dev/null; then
     echo "错误: skopeo 命令不可用"
     exit 1
 fi
@@ -41,6 +56,17 @@ if ! command -v python3 &> /dev/null; then
     exit 1
 fi
 
-# 启动 Flask 应用
-echo "启动 Flask 应用..."
-exec python3 app.py 
\ No newline at end of file
+# 多进程Prometheus指标目录需要在启动前清空
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+# 启动应用
+if [ "$SERVER_MODE" = "dev" ]; then
+    echo "启动 Flask 开发服务器..."
+    exec python3 app.py
+fi
+
+echo "启动 gunicorn..."
+exec gunicorn -c gunicorn.conf.py app:app 
\ No newline at end of file
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+测试共用的环境和夹具: 使用registry后端、进程内缓存，以 bench/fake_registry.py 作为本地Registry，不需要网络。
+环境变量必须在导入app之前设置。
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+sys.path.insert(0, ROOT)
+
+os.environ.update({
+    'IMAGE_BACKEND': 'registry',
+    'CACHE_TYPE': 'simple',
+    'METADATA_DB': '',
+    'CREDENTIAL_SCOPE_KEY': 'test-scope-key',
+    'LOG_LEVEL': 'WARNING',
+})
+
+import app as service  # noqa: E402
+from fake_registry import FakeRegistry  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def registry():
+    server = FakeRegistry(('127.0.0.1', 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def host(registry):
+    return f"localhost:{registry.server_port}"
+
+
+@pytest.fixture
+def client():
+    with service.app.test_request_context():
+        service.cache.clear()
+    service.cache_key_index.clear()
+    return service.app.test_client()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""/image-size/batch 的输入校验: 无效的size_method返回400，无效条目逐项返回错误，其余镜像照常查询"""
+
+import json
+
+
+def test_invalid_size_method(host, client):
+    resp = client.post('/image-size/batch', json={'images': [f"{host}/bench/app-1:v0"], 'size_method': 'bogus'})
+    assert resp.status_code == 400
+    assert resp.get_json()['status'] == 'error'
+
+
+def test_invalid_entries_reported_per_item(host, client):
+    image = f"{host}/bench/app-1:v0"
+    resp = client.post('/image-size/batch', json={'images': [image, 5, '', 'UPPER/Case:tag!']})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert (body['count'], body['succeeded'], body['failed']) == (4, 1, 3)
+    assert body['results'][0]['image'] == image and body['results'][0]['status'] == 'success'
+    rejected = {entry['index']: entry for entry in body['results'][1:]}
+    assert sorted(rejected) == [1, 2, 3]
+    assert all(entry['code'] == 400 for entry in rejected.values())
+    assert 'error' in rejected[3]
+
+
+def test_invalid_entries_streamed(host, client):
+    resp = client.post('/image-size/batch', json={'images': ['bad ref', f"{host}/bench/app-2:v0"], 'stream': True})
+    entries = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [entry['status'] for entry in entries] == ['error', 'success']
+    assert entries[0]['index'] == 0
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+条件请求测试: 精确大小的响应按digest直接返回304，不读取缓存条目也不访问Registry；包含估算值的响应
+使用弱ETag，由缓存条目判断；压缩表示的ETag匹配时，304返回同一个带编码后缀的ETag。
+"""
+
+import pytest
+
+from conftest import service
+
+
+@pytest.fixture(autouse=True)
+def compress_all(monkeypatch):
+    monkeypatch.setattr(service, 'COMPRESS_MIN_SIZE', 0)
+
+
+def image_size(client, image, size_method, **headers):
+    query = {'image': image}
+    if size_method:
+        query['size_method'] = size_method
+    return client.get('/image-size', query_string=query, headers=headers)
+
+
+def not_modified_count():
+    return service.CACHE_LOOKUPS.labels(route='image_size', status='not_modified')._value.get()
+
+
+@pytest.mark.parametrize('size_method, weak', [('exact', False), ('', True)])
+def test_encoded_etag_returned_on_not_modified(registry, host, client, size_method, weak):
+    image = f"{host}/bench/app-2:v0"
+    resp = image_size(client, image, size_method, **{'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    etag = resp.headers['ETag']
+    assert etag.startswith('W/') == weak
+    assert etag.endswith('-gzip"')
+
+    resp = image_size(client, image, size_method, **{'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == etag
+
+
+def test_exact_response_uses_digest_shortcut(registry, host, client):
+    image = f"{host}/bench/app-3:v0"
+    etag = image_size(client, image, 'exact').headers['ETag']
+
+    registry.stats.reset()
+    before = not_modified_count()
+    resp = image_size(client, image, 'exact', **{'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == etag
+    assert not_modified_count() == before + 1
+    assert registry.stats.snapshot().get('total', 0) == 0
+
+
+def test_estimated_response_compared_with_cache_entry(registry, host, client):
+    image = f"{host}/bench/app-4:v0"
+    etag = image_size(client, image, '').headers['ETag']
+    assert etag.startswith('W/')
+
+    before = not_modified_count()
+    resp = image_size(client, image, '', **{'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == etag
+    assert resp.headers['X-Cache-Status'] == 'HIT'
+    assert not_modified_count() == before
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+凭证隔离测试: 用正确密码查询私有镜像后，错误密码的请求不能复用标签映射和digest缓存，
+必须访问Registry并返回401/403；缓存键和持久化存储中不能出现密码的摘要。
+"""
+
+import hashlib
+import sqlite3
+
+import pytest
+
+from conftest import service
+
+
+def query(client, path, image, password):
+    return client.get(path, query_string={'image': image, 'username': 'bench', 'password': password})
+
+
+@pytest.mark.parametrize('path', ['/image-size', '/image-info'])
+def test_wrong_password_after_cached_tag(registry, host, client, path):
+    image = f"{host}/bench/private-1:v0"
+    assert query(client, path, image, 'secret').status_code == 200
+
+    registry.stats.reset()
+    resp = query(client, path, image, 'wrong')
+    assert registry.stats.snapshot().get('total', 0) > 0
+    assert resp.status_code in (401, 403)
+
+
+def test_wrong_password_after_cached_digest(registry, host, client):
+    image = f"{host}/bench/private-2:v0"
+    resp = query(client, '/image-info', image, 'secret')
+    assert resp.status_code == 200
+    digest = resp.get_json()['raw_data']['Digest']
+
+    registry.stats.reset()
+    resp = query(client, '/image-info', f"{host}/bench/private-2@{digest}", 'wrong')
+    assert registry.stats.snapshot().get('total', 0) > 0
+    assert resp.status_code in (401, 403)
+
+
+def test_keys_do_not_contain_password_digest(host, client, tmp_path, monkeypatch):
+    store = service.MetadataStore(str(tmp_path / 'metadata.db'))
+    monkeypatch.setattr(service, 'metadata_store', store)
+    assert query(client, '/image-size', f"{host}/bench/private-3:v0", 'secret').status_code == 200
+
+    password_digest = hashlib.sha256(b'secret').hexdigest()[:12]
+    conn = sqlite3.connect(store.path)
+    persisted = [row[0] for row in conn.execute('SELECT key FROM tag_digests UNION ALL SELECT key FROM digest_entries')]
+    conn.close()
+    cached = list(service.cache.cache._cache)
+    assert any('credentials:bench~' in key for key in persisted)
+    assert persisted and cached
+    assert not [key for key in persisted + cached if password_digest in key]
+
+
+def test_legacy_password_digest_rows_removed(tmp_path):
+    path = str(tmp_path / 'metadata.db')
+    service.MetadataStore(path).connection()
+    conn = sqlite3.connect(path)
+    legacy = f"tag:localhost/bench/private-1:v0|credentials:bench#{hashlib.sha256(b'secret').hexdigest()[:12]}|proxy:"
+    conn.execute('INSERT INTO tag_digests VALUES (?, ?, ?)', (legacy, 'sha256:0', 0))
+    conn.close()
+
+    service.MetadataStore(path).connection()
+    conn = sqlite3.connect(path)
+    assert conn.execute('SELECT COUNT(*) FROM tag_digests').fetchone()[0] == 0
+    conn.close()
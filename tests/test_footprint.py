@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""/footprint 的输入校验: 无效条目逐项报告，没有可用镜像时返回400 JSON"""
+
+import pytest
+
+
+@pytest.mark.parametrize('images', [[5], [''], [None, ''], ['UPPER/Case:tag!']])
+def test_no_usable_image(client, images):
+    resp = client.post('/footprint', json={'images': images})
+    assert resp.status_code == 400
+    assert resp.is_json
+    body = resp.get_json()
+    assert body['status'] == 'error'
+    assert [entry['index'] for entry in body['errors']] == list(range(len(images)))
+
+
+def test_rejected_entries_reported(host, client):
+    image = f"{host}/bench/app-1:v0"
+    resp = client.post('/footprint', json={'images': [image, 5, ''], 'present': [{'x': 1}]})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['image_count'] == 1
+    rejected = {(entry['field'], entry['index']) for entry in body['errors']}
+    assert rejected == {('images', 1), ('images', 2), ('present', 0)}
+    assert all(entry['code'] == 400 for entry in body['errors'])
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+精确失效测试: 按标签、标签前缀或仓库失效缓存只影响对应的条目；Registry推送通知失效该标签并直接更新
+标签的digest映射，只带digest的删除通知失效整个仓库。
+"""
+
+import pytest
+
+from conftest import service
+
+MANIFEST_V2 = 'application/vnd.docker.distribution.manifest.v2+json'
+
+
+def cache_status(client, image):
+    resp = client.get('/image-size', query_string={'image': image})
+    assert resp.status_code == 200
+    return resp.headers['X-Cache-Status']
+
+
+@pytest.fixture
+def cached(host, client):
+    """缓存bench/app-11的几个标签和另一个仓库的标签，返回仓库名"""
+    repository = f"{host}/bench/app-11"
+    for image in (f"{repository}:v1", f"{repository}:v10", f"{repository}:v2", f"{host}/bench/app-12:v1"):
+        assert cache_status(client, image) == 'MISS'
+    return repository
+
+
+def test_invalidate_tag(host, client, cached):
+    resp = client.get('/cache-clear', query_string={'image': f"{cached}:v1"})
+    assert resp.get_json()['invalidated'] >= 1
+    assert cache_status(client, f"{cached}:v1") == 'MISS'
+    assert cache_status(client, f"{cached}:v10") == 'HIT'
+    assert cache_status(client, f"{cached}:v2") == 'HIT'
+
+
+def test_invalidate_prefix(host, client, cached):
+    client.get('/cache-clear', query_string={'image': cached, 'prefix': 'v1'})
+    assert cache_status(client, f"{cached}:v1") == 'MISS'
+    assert cache_status(client, f"{cached}:v10") == 'MISS'
+    assert cache_status(client, f"{cached}:v2") == 'HIT'
+
+
+def test_invalidate_repository(host, client, cached):
+    client.get('/cache-clear', query_string={'image': cached})
+    assert cache_status(client, f"{cached}:v2") == 'MISS'
+    assert cache_status(client, f"{host}/bench/app-12:v1") == 'HIT'
+
+
+def test_push_webhook_refreshes_tag_digest(registry, host, client, cached):
+    info = client.get('/image-info', query_string={'image': f"{cached}:v2", 'fields': 'raw_data'}).get_json()
+    digest = info['raw_data']['Digest']
+
+    # v1 被重新推送为 v2 的内容，通知中的digest直接成为 v1 的映射，不需要重新解析标签
+    event = {'action': 'push', 'target': {'repository': 'bench/app-11', 'tag': 'v1', 'digest': digest,
+                                          'mediaType': MANIFEST_V2}}
+    resp = client.post('/webhook/registry', query_string={'registry': host}, json={'events': [event]})
+    assert resp.get_json()['events'][0]['refreshed'] == 1
+    assert cache_status(client, f"{cached}:v10") == 'HIT'
+
+    registry.stats.reset()
+    info = client.get('/image-info', query_string={'image': f"{cached}:v1", 'fields': 'raw_data'}).get_json()
+    assert info['raw_data']['Digest'] == digest
+    assert registry.stats.snapshot().get('manifests', 0) == 0
+
+
+def test_digest_delete_webhook_invalidates_repository(host, client, cached):
+    event = {'action': 'delete', 'target': {'repository': 'bench/app-11', 'digest': 'sha256:' + 'b' * 64}}
+    client.post('/webhook/registry', query_string={'registry': host}, json={'events': [event]})
+    assert cache_status(client, f"{cached}:v2") == 'MISS'
+    assert cache_status(client, f"{host}/bench/app-12:v1") == 'HIT'
+
+
+def test_parse_registry_events():
+    distribution = {'events': [
+        {'action': 'pull', 'target': {'repository': 'app', 'tag': 'v1', 'mediaType': MANIFEST_V2}},
+        {'action': 'push', 'target': {'repository': 'app', 'digest': 'sha256:' + 'c' * 64,
+                                      'mediaType': 'application/octet-stream'}},
+        {'action': 'push', 'target': {'repository': 'team/app', 'tag': 'v2', 'mediaType': MANIFEST_V2,
+                                      'url': 'http://internal:5000/v2/team/app/manifests/v2'}},
+    ]}
+    assert [(action, str(reference)) for action, reference in service.parse_registry_events(distribution)] == [
+        ('push', 'internal:5000/team/app:v2')]
+    assert str(service.parse_registry_events(distribution, 'registry.example.com')[0][1]) == \
+        'registry.example.com/team/app:v2'
+
+    harbor = {'type': 'DELETE_ARTIFACT', 'event_data': {'resources': [
+        {'resource_url': 'harbor.example.com/library/app:v3', 'digest': 'sha256:' + 'd' * 64}]}}
+    [(action, reference)] = service.parse_registry_events(harbor)
+    assert action == 'delete'
+    assert (reference.name, reference.tag, reference.digest) == ('harbor.example.com/library/app', 'v3', 'sha256:' + 'd' * 64)
+
+
+def test_webhook_rejects_non_json(client):
+    assert client.post('/webhook/registry', data='not json').status_code == 400
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+精确未压缩大小测试: 图层按块流式解压统计字节数（gzip、zstd、未压缩的tar），
+结果按图层digest永久记录，之后的查询不再下载图层。
+"""
+
+import gzip
+import os
+import zlib
+
+import pytest
+
+from conftest import service
+
+RAW = os.urandom(100 * 1024) + bytes(300 * 1024)
+
+
+def chunked(data, size=4096):
+    return iter([data[i:i + size] for i in range(0, len(data), size)])
+
+
+def test_count_gzip_layer():
+    assert service.count_uncompressed_bytes(chunked(gzip.compress(RAW))) == len(RAW)
+
+
+def test_count_uncompressed_tar():
+    assert service.count_uncompressed_bytes(chunked(RAW)) == len(RAW)
+
+
+@pytest.mark.skipif(service.zstandard is None, reason='未安装zstandard')
+def test_count_zstd_layer():
+    blob = service.zstandard.ZstdCompressor().compress(RAW)
+    assert service.count_uncompressed_bytes(chunked(blob)) == len(RAW)
+
+
+def test_truncated_layer():
+    with pytest.raises(service.DECOMPRESS_ERRORS):
+        service.count_uncompressed_bytes(chunked(gzip.compress(RAW)[:20 * 1024]))
+
+
+def test_reads_chunks_lazily():
+    consumed = []
+
+    def chunks():
+        for chunk in chunked(gzip.compress(RAW)):
+            consumed.append(len(chunk))
+            yield chunk
+
+    reader = service.ChunkReader(chunks())
+    reader.peek(4)
+    reader.read(service.LAYER_CHUNK_SIZE)
+    assert len(consumed) == 1
+
+
+def test_exact_size_recorded_per_layer(registry, host, client):
+    image = f"{host}/bench/app-10:v0"
+    resp = client.get('/image-size', query_string={'image': image, 'size_method': 'exact'})
+    data = resp.get_json()
+    assert data['uncompressed_size'] == registry.store.layers * registry.store.layer_size
+    assert data['uncompressed_size_exact'] is True
+
+    # 其他接口的相同镜像直接使用按图层digest记录的大小
+    registry.stats.reset()
+    resp = client.get('/image-info', query_string={'image': image, 'size_method': 'exact',
+                                                   'fields': 'uncompressed_size'})
+    assert resp.get_json()['uncompressed_size'] == data['uncompressed_size']
+    assert registry.stats.snapshot().get('blobs', 0) == 0
+
+
+def test_partial_sample_counts_decompressed_prefix():
+    blob = gzip.compress(RAW)
+    sample = blob[:len(blob) // 2]
+    counted = service.count_uncompressed_bytes(chunked(sample), partial=True)
+    # 截断处之前已解压的数据都应计入
+    expected = len(zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(sample))
+    assert counted == expected
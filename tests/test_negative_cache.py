@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+负缓存测试: 私有仓库暂时返回404时结果被短时缓存，仓库变为可访问后（其他路径用同一凭证访问成功，
+或收到推送通知），负缓存条目被删除，后续请求不再返回旧的404。
+"""
+
+import pytest
+
+from conftest import service
+
+CREDENTIALS = {'username': 'bench', 'password': 'secret'}
+
+
+@pytest.fixture
+def hidden(registry, host):
+    """返回一个暂时不可访问的私有仓库"""
+    repository = 'bench/private-7'
+    registry.hidden.add(repository)
+    yield f"{host}/{repository}"
+    registry.hidden.discard(repository)
+
+
+def image_size(client, image):
+    return client.get('/image-size', query_string=dict(CREDENTIALS, image=image))
+
+
+def cleared():
+    return service.NEGATIVE_LOOKUPS.labels(kind='image', outcome='clear')._value.get()
+
+
+def assert_cached_not_found(registry, client, image):
+    assert image_size(client, image).status_code == 404
+    registry.stats.reset()
+    assert image_size(client, image).status_code == 404
+    assert registry.stats.snapshot().get('total', 0) == 0
+
+
+def test_tag_listing_clears_negative_entry(registry, client, hidden):
+    image = f"{hidden}:v0"
+    assert_cached_not_found(registry, client, image)
+
+    registry.hidden.clear()
+    before = cleared()
+    resp = client.get('/image-tags', query_string=dict(CREDENTIALS, image=hidden))
+    assert resp.status_code == 200
+    assert cleared() == before + 1
+    assert image_size(client, image).status_code == 200
+
+
+def test_tag_sweep_clears_negative_entry(registry, client, hidden):
+    image = f"{hidden}:v1"
+    assert_cached_not_found(registry, client, image)
+
+    registry.hidden.clear()
+    resp = client.get('/image-tags/sizes', query_string=dict(CREDENTIALS, image=f"{hidden}:v1", format='ndjson'))
+    assert resp.status_code == 200
+    resp.get_data()
+    assert image_size(client, image).status_code == 200
+
+
+def test_other_credentials_keep_negative_entry(registry, client, hidden):
+    image = f"{hidden}:v0"
+    assert_cached_not_found(registry, client, image)
+
+    registry.hidden.clear()
+    # 其他凭证的成功访问不能证明该凭证可以访问
+    registry.credentials = ('other', 'secret')
+    try:
+        resp = client.get('/image-tags', query_string={'image': hidden, 'username': 'other', 'password': 'secret'})
+        assert resp.status_code == 200
+    finally:
+        registry.credentials = ('bench', 'secret')
+    assert image_size(client, image).status_code == 404
+
+
+def test_push_webhook_clears_negative_entry(registry, host, client, hidden):
+    image = f"{hidden}:v0"
+    assert_cached_not_found(registry, client, image)
+
+    registry.hidden.clear()
+    before = cleared()
+    event = {'action': 'push', 'target': {
+        'repository': 'bench/private-7', 'tag': 'v0',
+        'mediaType': 'application/vnd.docker.distribution.manifest.v2+json'}}
+    resp = client.post('/webhook/registry', query_string={'registry': host}, json={'events': [event]})
+    assert resp.status_code == 200
+    assert cleared() == before + 1
+    assert image_size(client, image).status_code == 200
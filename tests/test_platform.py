@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+多架构镜像测试: platform参数选择的平台决定返回的镜像数据，不同平台的响应互不复用。
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize('platform, architecture', [('linux/amd64', 'amd64'), ('linux/arm64/v8', 'arm64')])
+def test_image_info_uses_platform(host, client, platform, architecture):
+    resp = client.get('/image-info', query_string={'image': f"{host}/bench/multi-1:v0", 'platform': platform,
+                                                   'fields': 'raw_data'})
+    assert resp.status_code == 200
+    assert resp.get_json()['raw_data']['Architecture'] == architecture
+
+
+def test_image_info_platforms_cached_separately(host, client):
+    image = f"{host}/bench/multi-2:v0"
+    selected = set()
+    for platform in ('linux/amd64', 'linux/arm/v7'):
+        resp = client.get('/image-info', query_string={'image': image, 'platform': platform, 'fields': 'raw_data'})
+        assert resp.status_code == 200
+        raw = resp.get_json()['raw_data']
+        selected.add((raw['Architecture'], raw.get('Variant', '')))
+    assert selected == {('amd64', ''), ('arm', 'v7')}
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+镜像引用解析测试: Docker Hub的各种写法、带端口和IPv6的Registry地址、标签和digest同时指定，
+以及等价引用共用接口缓存条目。
+"""
+
+import pytest
+
+from conftest import service
+
+DIGEST = 'sha256:' + 'a' * 64
+
+
+@pytest.mark.parametrize('image', [
+    'nginx',
+    'nginx:latest',
+    'docker.io/nginx:latest',
+    'docker.io/library/nginx:latest',
+    'index.docker.io/library/nginx',
+    'registry-1.docker.io/nginx:latest',
+])
+def test_docker_hub_aliases(image):
+    reference = service.parse_image_reference(image)
+    assert reference == ('docker.io', 'library/nginx', reference.tag, None)
+    assert reference.registry == service.DOCKER_HUB_API
+    assert str(reference) == 'docker.io/library/nginx:latest'
+
+
+def test_docker_hub_user_repository_has_no_library_prefix():
+    assert service.parse_image_reference('bitnami/redis:7').repository == 'bitnami/redis'
+
+
+@pytest.mark.parametrize('image, domain, repository, tag', [
+    ('host:5000/repo', 'host:5000', 'repo', None),
+    ('host:5000/team/repo:1.0', 'host:5000', 'team/repo', '1.0'),
+    ('localhost/repo:t', 'localhost', 'repo', 't'),
+    ('[::1]:5000/repo:t', '[::1]:5000', 'repo', 't'),
+])
+def test_registry_host_and_port(image, domain, repository, tag):
+    reference = service.parse_image_reference(image)
+    assert (reference.domain, reference.repository, reference.tag) == (domain, repository, tag)
+    assert reference.registry == domain
+
+
+def test_tag_and_digest():
+    reference = service.parse_image_reference(f'ghcr.io/org/app:1.2@{DIGEST}')
+    assert (reference.tag, reference.digest) == ('1.2', DIGEST)
+    # 同时指定时按digest获取，标签只作为说明
+    assert reference.reference == DIGEST
+    assert str(reference) == f'ghcr.io/org/app@{DIGEST}'
+
+
+def test_uppercase_first_component_is_domain():
+    reference = service.parse_image_reference('MyRegistry/app:v1')
+    assert (reference.domain, reference.repository) == ('myregistry', 'app')
+
+
+@pytest.mark.parametrize('image', [
+    'Nginx',
+    'nginx:bad/tag',
+    'nginx@sha256:abc',
+    'host:5000/Repo',
+    'repo//x',
+    '',
+])
+def test_invalid_references(image):
+    with pytest.raises(ValueError):
+        service.parse_image_reference(image)
+
+
+def test_name_length_limit():
+    domain = 'registry.example.com'
+    path = 'a' * (service.REFERENCE_NAME_MAX_LENGTH - len(domain) - 1)
+    assert service.parse_image_reference(f'{domain}/{path}').repository == path
+    with pytest.raises(ValueError):
+        service.parse_image_reference(f'{domain}/{path}a')
+
+
+def test_equivalent_references_share_cache_entry(registry, host, client):
+    resp = client.get('/image-size', query_string={'image': f"{host}/bench/app-6:v0"})
+    assert resp.headers['X-Cache-Status'] == 'MISS'
+
+    registry.stats.reset()
+    resp = client.get('/image-size', query_string={'image': f"{host.upper()}/bench/app-6:v0"})
+    assert resp.status_code == 200
+    assert resp.headers['X-Cache-Status'] == 'HIT'
+    assert registry.stats.snapshot().get('total', 0) == 0
+
+
+def test_invalid_reference_returns_400(client):
+    resp = client.get('/image-size', query_string={'image': 'nginx:bad/tag'})
+    assert resp.status_code == 400
+    assert resp.get_json()['status'] == 'error'
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+接口缓存测试: CACHE_TIMEOUT为0时条目永不硬过期，软过期内直接命中，超过软过期后返回旧数据并在后台刷新。
+"""
+
+import pytest
+
+from conftest import service
+
+
+@pytest.fixture
+def no_expiry(monkeypatch):
+    monkeypatch.setitem(service.cache_config, 'CACHE_DEFAULT_TIMEOUT', 0)
+    monkeypatch.setattr(service, 'CACHE_SOFT_TIMEOUT', 300)
+
+
+def test_zero_timeout_never_expires(registry, host, client, no_expiry):
+    image = f"{host}/bench/app-5:v0"
+    assert client.get('/image-size', query_string={'image': image}).headers['X-Cache-Status'] == 'MISS'
+
+    registry.stats.reset()
+    resp = client.get('/image-size', query_string={'image': image})
+    assert resp.status_code == 200
+    assert resp.headers['X-Cache-Status'] == 'HIT'
+    assert int(resp.headers['X-Cache-TTL']) > 0
+    assert registry.stats.snapshot().get('total', 0) == 0
+
+
+def test_zero_timeout_serves_stale_after_soft_timeout(host, client, no_expiry, monkeypatch):
+    image = f"{host}/bench/app-5:v1"
+    assert client.get('/image-size', query_string={'image': image}).status_code == 200
+
+    monkeypatch.setattr(service, 'CACHE_SOFT_TIMEOUT', 0)
+    monkeypatch.setattr(service, 'schedule_refresh', lambda cache_key, view: None)
+    resp = client.get('/image-size', query_string={'image': image})
+    assert resp.status_code == 200
+    assert resp.headers['X-Cache-Status'] == 'STALE'
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+标签索引测试: 跟随Registry的分页获取全部标签，在索引上按前缀、版本约束、正则筛选并分页；
+索引过期后只获取新增的标签，完整刷新时移除已删除的标签。
+"""
+
+import pytest
+
+from conftest import service
+
+
+def image_tags(client, image, **query):
+    return client.get('/image-tags', query_string=dict(query, image=image))
+
+
+def test_follows_registry_pagination(registry, host, client):
+    resp = image_tags(client, f"{host}/bench/app-8")
+    assert resp.status_code == 200
+    data = resp.get_json()
+    # 超过一页（默认每页100个）时跟随Link响应头获取后续页
+    assert data['tag_count'] == 120 > registry.page_size
+    assert data['tags'] == sorted(data['tags'])
+
+
+def test_prefix_semver_regex_and_paging(registry, host, client):
+    image = f"{host}/bench/app-8"
+    data = image_tags(client, f"{image}:v11").get_json()
+    assert data['tags'] == ['v11'] + [f"v{i}" for i in range(110, 120)]
+    assert data['original_tag_count'] == 120
+
+    registry.stats.reset()
+    data = image_tags(client, image, semver='>=115', order='desc', limit=3).get_json()
+    assert data['tags'] == ['v119', 'v118', 'v117']
+    assert (data['total'], data['next_offset']) == (5, 3)
+    assert image_tags(client, image, semver='>=115', order='desc', limit=3, offset=3).get_json()['tags'] == ['v116', 'v115']
+    assert image_tags(client, image, regex=r'^v9\d$').get_json()['tag_count'] == 10
+    assert image_tags(client, image, sort='semver', order='desc', limit=1).get_json()['tags'] == ['v119']
+    # 后续查询都在缓存的索引上完成
+    assert registry.stats.snapshot().get('tags', 0) == 0
+
+
+@pytest.mark.parametrize('query', [{'semver': '>=abc'}, {'regex': '('}, {'sort': 'size'}, {'limit': 0}])
+def test_invalid_query(host, client, query):
+    assert image_tags(client, f"{host}/bench/app-8", **query).status_code == 400
+
+
+def test_incremental_and_full_refresh(registry, host, client, monkeypatch):
+    image = f"{host}/bench/app-9"
+    tags = registry.store.tag_list('bench/app-9')
+    assert image_tags(client, image).get_json()['tag_count'] == 120
+
+    # 字典序在已知最后一个标签之后的新标签通过 last 参数增量获取
+    monkeypatch.setattr(registry.store, 'tag_list', lambda repository: tags + ['w1', 'w2'])
+    monkeypatch.setattr(service, 'TAG_INDEX_REFRESH', 0)
+    registry.stats.reset()
+    data = image_tags(client, image).get_json()
+    assert data['tag_count'] == 122
+    assert data['tags'][-2:] == ['w1', 'w2']
+    assert registry.stats.snapshot()['tags'] == 1
+
+    # 完整刷新移除已删除的标签
+    monkeypatch.setattr(registry.store, 'tag_list', lambda repository: tags[:10])
+    monkeypatch.setattr(service, 'TAG_INDEX_FULL_REFRESH', 0)
+    assert image_tags(client, image).get_json()['tags'] == tags[:10]